@@ -0,0 +1,146 @@
+'''
+Benchmark de las consultas de los reportes.
+
+Para cada app y cada tamaño de historia se genera una historia de producción sintética, se guarda
+igual que la guardaría la carga de archivos y se mide cada consulta de los reportes varias veces:
+    v2 -> DataProcessor: get_available_values, get_available_dates, set_date_range y get_my_kpis
+          para cada tipo de filtro (familia, marca y sku) con valores al azar
+    v1 -> FileCleaner: get_products_on_interval, get_total_products_on_interval,
+          get_cumplimiento_en_intervalo y get_cumplimiento_por_semana para intervalos de 1, 12 y 52 semanas
+También se mide la carga de los datos en memoria (etapa carga). Para cada consulta se reportan
+la mediana, el percentil 95 y el máximo (la primera llamada suele ser la más lenta).
+
+Los resultados se pueden guardar en json y comparar contra una corrida anterior. Si alguna consulta
+es más lenta que la base por más de la tolerancia, o su percentil 95 pasa del SLO, el proceso
+termina con código 1.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.consultas --filas 10000 100000 1000000 --salida base.json
+    python -m benchmarks.consultas --filas 10000 100000 1000000 --base base.json --slo-ms 500
+'''
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+from benchmarks import historias
+from benchmarks.entorno import prepara_worker, corre_en_subproceso
+from benchmarks.medicion import Medidor, imprime_tabla, guarda_resultados, lee_resultados, compara
+
+SEMILLA = 20231016
+LLAVES = ['app', 'filas', 'caso']
+SEMANAS_INTERVALO = [1, 12, 52]
+COLUMNAS_REPORTE = ['app', 'filas', 'caso', 'etapa', 'n', 'p50_ms', 'p95_ms', 'maximo_ms', 'rss_pico_mb']
+COLUMNAS_COMPARACION = COLUMNAS_REPORTE + ['base_ms', 'cambio', 'estado', 'slo']
+
+def benchmark_v1(medidor:Medidor, filas:int, repeticiones:int):
+    from scripts.qlik_dataset import guarda_datos_qlik, get_qlik_dataset
+    from scripts.file_cleaner import FileCleaner
+
+    rng = np.random.default_rng(SEMILLA)
+    datos = historias.historia_v1(historias.historia(rng, historias.catalogo(rng), filas))
+    guarda_datos_qlik(datos, 'data/data_for_qlik.parquet')
+    del datos
+
+    etiquetas = {'app': 'v1', 'filas': filas}
+    with medidor.etapa('carga', **etiquetas, caso='todo'):
+        fc = FileCleaner()
+        get_qlik_dataset(fc.qlik_file_location).datos
+
+    # Igual que la página de intervalos: del domingo antes del primer lunes al domingo después del último viernes
+    fin = historias.ULTIMA_SEMANA + pd.Timedelta(days=6)
+    for semanas in SEMANAS_INTERVALO:
+        inicio = historias.ULTIMA_SEMANA - pd.Timedelta(weeks=semanas - 1) - pd.Timedelta(days=1)
+        caso = {**etiquetas, 'caso': f'{semanas} semanas'}
+        for _ in range(repeticiones):
+            with medidor.etapa('get_products_on_interval', **caso):
+                fc.get_products_on_interval(inicio, fin)
+            with medidor.etapa('get_total_products_on_interval', **caso):
+                fc.get_total_products_on_interval(inicio, fin)
+            with medidor.etapa('get_cumplimiento_en_intervalo', **caso):
+                fc.get_cumplimiento_en_intervalo(inicio, fin)
+            with medidor.etapa('get_cumplimiento_por_semana', **caso):
+                fc.get_cumplimiento_por_semana(inicio, fin)
+
+def benchmark_v2(medidor:Medidor, filas:int, repeticiones:int):
+    from scripts.production_dataset import ProductionDataset
+    from scripts.data_processor import DataProcessor
+
+    clean_data = 'data/datos_produccion'
+    rng = np.random.default_rng(SEMILLA)
+    ProductionDataset(clean_data).write(historias.historia(rng, historias.catalogo(rng), filas), drop_duplicates=False)
+
+    etiquetas = {'app': 'v2', 'filas': filas}
+    with medidor.etapa('carga', **etiquetas, caso='todo'):
+        DataProcessor(clean_data)
+
+    for filtro in ['familia', 'marca', 'sku']:
+        caso = {**etiquetas, 'caso': filtro}
+        for _ in range(repeticiones):
+            # En cada interacción streamlit vuelve a crear el procesador
+            data_processor = DataProcessor(clean_data)
+            data_processor.set_type_of_filter(filtro)
+            with medidor.etapa('get_available_values', **caso):
+                valores = data_processor.get_available_values()
+            valor = valores[rng.integers(len(valores))]
+            # Igual que la página de reportes: las opciones de sku son 'sku - descripcion'
+            data_processor.set_filter_value(valor.split('-')[0].strip() if filtro == 'sku' else valor)
+            with medidor.etapa('get_available_dates', **caso):
+                fechas = data_processor.get_available_dates()
+            with medidor.etapa('set_date_range', **caso):
+                data_processor.set_date_range(*fechas)
+            if data_processor.fully_instanciated_processor:
+                with medidor.etapa('get_my_kpis', **caso):
+                    data_processor.get_my_kpis()
+
+BENCHMARKS = {'v1': benchmark_v1, 'v2': benchmark_v2}
+
+def corre_worker(app:str, filas:int, repeticiones:int, salida:str):
+    '''
+    Corre dentro del proceso hijo, con el directorio actual en la copia de data de la app
+    '''
+    prepara_worker(app)
+    medidor = Medidor()
+    try:
+        BENCHMARKS[app](medidor, filas, repeticiones)
+    finally:
+        medidor.cierra()
+    guarda_resultados(salida, 'consultas', medidor.resumen(LLAVES))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de las consultas de los reportes')
+    parser.add_argument('--apps', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--filas', nargs='+', type=int, default=[10_000, 100_000], help='tamaños de la historia')
+    parser.add_argument('--repeticiones', type=int, default=20, help='veces que se repite cada consulta')
+    parser.add_argument('--salida', help='archivo json donde se guardan los resultados')
+    parser.add_argument('--base', help='archivo json de una corrida anterior contra el que se compara')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='cambio relativo de la mediana que se considera regresión')
+    parser.add_argument('--slo-ms', type=float, help='máximo aceptable del percentil 95 de cada consulta')
+    parser.add_argument('--worker', choices=list(BENCHMARKS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        corre_worker(args.worker, args.filas[0], args.repeticiones, args.salida)
+        return
+
+    resultados = [
+        fila
+        for app in args.apps for filas in args.filas
+        for fila in corre_en_subproceso('benchmarks.consultas', app, ['--filas', filas, '--repeticiones', args.repeticiones])
+    ]
+    if args.salida is not None:
+        guarda_resultados(args.salida, 'consultas', resultados)
+
+    if args.base is None and args.slo_ms is None:
+        imprime_tabla(resultados, COLUMNAS_REPORTE)
+        return
+    base = lee_resultados(args.base) if args.base is not None else []
+    comparados = compara(resultados, base, LLAVES, tolerancia=args.tolerancia, slo_ms=args.slo_ms)
+    imprime_tabla(comparados, COLUMNAS_COMPARACION)
+    fallas = [fila for fila in comparados if fila['estado'] == 'regresion' or fila['slo'] == 'excede']
+    if len(fallas) > 0:
+        print(f'\n{len(fallas)} consultas con regresión o fuera del SLO')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Archivos de la carpeta data que no se copian: la historia de producción y los reportes generados
+ARCHIVOS_HISTORIA = ['data_for_qlik.*', 'datos_produccion*', 'reportes']
+
+def prepara_worker(app:str):
+    '''
+    Hace que el paquete scripts de la app se pueda importar dentro del proceso hijo
+    '''
+    sys.path.insert(0, f'{RAIZ}/{app}')
+
+def corre_en_subproceso(modulo:str, app:str, argumentos:list) -> list:
+    '''
+    Copia la carpeta data de la app (sin la historia) a un directorio temporal y corre ahí
+    `python -m modulo --worker app argumentos --salida resultados.json`.
+    Cada app corre en su propio proceso porque las dos tienen un paquete llamado scripts.
+    Regresa los resultados que el worker haya guardado con guarda_resultados.
+    '''
+    with tempfile.TemporaryDirectory(prefix=f'bench-{app}-') as directorio:
+        shutil.copytree(f'{RAIZ}/{app}/data', f'{directorio}/data', ignore=shutil.ignore_patterns(*ARCHIVOS_HISTORIA))
+        salida = f'{directorio}/resultados.json'
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [RAIZ, os.environ.get('PYTHONPATH')]))}
+        subprocess.run(
+            [sys.executable, '-m', modulo, '--worker', app, *[str(argumento) for argumento in argumentos], '--salida', salida],
+            cwd=directorio, env=env, check=True
+        )
+        with open(salida) as f:
+            return json.load(f)['resultados']
@@ -0,0 +1,173 @@
+'''
+Generadores de libros de excel sintéticos que imitan las plantillas de cada planta.
+Todos los generadores son deterministas: reciben un numpy.random.Generator y regresan
+los bytes del libro (xlsx), igual que lo que llega desde el uploader de streamlit.
+
+Además de los datos, los libros traen lo que hace diferentes a los archivos reales:
+encabezados en filas distintas, índice CLAVE o Clave, celdas de fecha, filas ocultas,
+skus que no están en el catálogo y cantidades que no son números.
+'''
+import io
+import datetime
+import numpy as np
+import openpyxl as xl
+
+# Proporción de filas con sku fuera del catálogo y con cantidades que no son números
+PROPORCION_SKUS_NUEVOS = 0.05
+PROPORCION_CANTIDADES_MALAS = 0.02
+# Proporción de filas de datos que se ocultan y de productos seguidos de una fila vacía
+PROPORCION_FILAS_OCULTAS = 0.05
+PROPORCION_FILAS_VACIAS = 0.2
+
+class ArchivoSubido(io.BytesIO):
+    '''
+    Bytes de un libro con nombre, como los archivos que regresa st.file_uploader
+    '''
+    def __init__(self, contenido:bytes, name:str) -> None:
+        super().__init__(contenido)
+        self.name = name
+
+
+def lunes(semana:int, inicio:datetime.date=datetime.date(2021, 1, 4)) -> datetime.datetime:
+    '''
+    Regresa el lunes de la semana número semana contando desde inicio (que es lunes)
+    '''
+    fecha = inicio + datetime.timedelta(weeks=semana)
+    return datetime.datetime(fecha.year, fecha.month, fecha.day)
+
+def _filas_producto(rng:np.random.Generator, skus:list, n_filas:int, proporcion_cantidades_malas:float=PROPORCION_CANTIDADES_MALAS) -> list:
+    '''
+    Regresa n_filas tuplas (sku, descripcion, programado, fabricado).
+    Algunas filas traen un sku que no está en el catálogo o una cantidad que no es número.
+    '''
+    elegidos = rng.choice(len(skus), size=n_filas, replace=n_filas > len(skus))
+    programados = rng.integers(10, 5_000, size=n_filas).astype(float)
+    # La mayoría de los productos se terminan, algunos quedan cortos y otros se pasan
+    fabricados = np.round(programados * rng.choice([0.5, 0.9, 1.0, 1.0, 1.0, 1.1], size=n_filas))
+    filas = []
+    for i, indice in enumerate(elegidos):
+        sku = skus[indice]
+        if rng.random() < PROPORCION_SKUS_NUEVOS:
+            sku = f'BENCH{rng.integers(1_000, 9_999)}'
+        fabricado = fabricados[i]
+        if rng.random() < proporcion_cantidades_malas:
+            fabricado = 'N/D'
+        filas.append((sku, f'PRODUCTO {sku} {int(programados[i])} KG', programados[i], fabricado))
+    return filas
+
+def _escribe_tabla(rng:np.random.Generator, hoja, fila_inicial:int, columnas:list, filas:list) -> int:
+    '''
+    Escribe cada tupla de filas en las columnas dadas a partir de fila_inicial.
+    Como en los archivos reales, entre algunos productos quedan filas vacías y algunas filas están ocultas.
+    Regresa la última fila escrita.
+    '''
+    fila = fila_inicial
+    for valores in filas:
+        for columna, valor in zip(columnas, valores):
+            hoja.cell(fila, columna, valor)
+        if rng.random() < PROPORCION_FILAS_OCULTAS:
+            hoja.row_dimensions[fila].hidden = True
+        fila += 2 if rng.random() < PROPORCION_FILAS_VACIAS else 1
+    return fila - 1
+
+def _a_bytes(wb:xl.Workbook) -> bytes:
+    salida = io.BytesIO()
+    wb.save(salida)
+    return salida.getvalue()
+
+# ------------------------------------------------------------------
+# Plantillas de v1
+# ------------------------------------------------------------------
+
+def liquidos_v1(rng:np.random.Generator, skus:list, fecha:datetime.datetime, n_filas:int=120) -> bytes:
+    '''
+    Hoja 'Plan de Producción': las fechas de inicio y fin de la semana en C5 y C6, CLAVE en B10
+    y los datos desde B13 (sku, descripción, programa y, dos columnas después, fabricado)
+    '''
+    wb = xl.Workbook()
+    hoja = wb.active
+    hoja.title = 'Plan de Producción'
+    hoja['H2'] = 'PROGRAMA DE PRODUCCIÓN SEMANAL'
+    hoja['B5'], hoja['C5'] = 'DEL', fecha
+    hoja['B6'], hoja['C6'] = 'AL:', fecha + datetime.timedelta(days=4)
+    hoja['B7'], hoja['B8'] = 'fabricado', 'no fabricado'
+    for columna, valor in enumerate(['CLAVE', 'DESCRIPCION', 'Programa', 'Por Fabricar', 'Fabricado', 'Existencia'], start=2):
+        hoja.cell(10, columna, valor)
+    hoja['B12'] = 'ENVASADO HERBICIDAS 1 LITRO'
+    filas = [(sku, descripcion, programado, 'x', fabricado) for sku, descripcion, programado, fabricado in _filas_producto(rng, skus, n_filas)]
+    _escribe_tabla(rng, hoja, 13, [2, 3, 4, 5, 6], filas)
+    return _a_bytes(wb)
+
+def polvos_v1(rng:np.random.Generator, skus:list, fecha:datetime.datetime, n_filas:int=70) -> bytes:
+    '''
+    Hoja activa: la fecha en C5, los nombres de las columnas con kilos en la fila 7, CLAVE en B9
+    y los datos desde B10. Polvos en v1 no acepta cantidades que no sean números, así que no se generan.
+    '''
+    wb = xl.Workbook()
+    hoja = wb.active
+    hoja.title = 'FABRICACIONES'
+    hoja['D2'] = 'PROGRAMA DE PRODUCCIÓN SEMANAL'
+    hoja['B5'], hoja['C5'] = 'PLANTA PRODUCCIÓN POLVOS', fecha
+    hoja['D7'], hoja['E7'] = 'KG PROGRAMADOS', 'KG FABRICADOS'
+    for columna, valor in enumerate(['CLAVE', 'DESCRIPCION', 'PRODUCCION', 'FABRICADO ', 'POR FABRICAR '], start=2):
+        hoja.cell(9, columna, valor)
+    _escribe_tabla(rng, hoja, 10, [2, 3, 4, 5], _filas_producto(rng, skus, n_filas, proporcion_cantidades_malas=0))
+    return _a_bytes(wb)
+
+def lerma_v1(rng:np.random.Generator, skus:list, semanas:list, n_filas:int=70) -> bytes:
+    '''
+    Un libro con una hoja por semana (el nombre de la hoja es el número de semana).
+    La fila de encabezados empieza con 'Área' o 'Equipo' en la columna A y cambia de fila entre hojas.
+    '''
+    wb = xl.Workbook()
+    wb.remove(wb.active)
+    for semana in semanas:
+        hoja = wb.create_sheet(str(semana))
+        hoja['D1'] = 'PROGRAMA DE PRODUCCION SEMANAL'
+        hoja['A2'], hoja['D2'] = f'FOLIO: {semana:02d}', 'fecha'
+        fila_encabezados = int(rng.integers(3, 10))
+        encabezados = ['Área' if semana % 2 else 'Equipo', 'Clave', 'Descripción', 'Programado por \nsemana', 'Producido', 'UM']
+        for columna, valor in enumerate(encabezados, start=1):
+            hoja.cell(fila_encabezados, columna, valor)
+        filas = [('L-1', sku, descripcion, programado, fabricado, 'CJ') for sku, descripcion, programado, fabricado in _filas_producto(rng, skus, n_filas)]
+        _escribe_tabla(rng, hoja, fila_encabezados+1, [1, 2, 3, 4, 5, 6], filas)
+    return _a_bytes(wb)
+
+# ------------------------------------------------------------------
+# Plantillas de v2
+# ------------------------------------------------------------------
+
+def _hoja_v2(rng:np.random.Generator, skus:list, fecha:datetime.datetime, n_filas:int,
+             titulo:str, etiqueta_fecha:str, fecha_abajo:bool, encabezados:list) -> bytes:
+    '''
+    Hoja con un título, la etiqueta de la fecha (con la fecha a la derecha o abajo) y una tabla
+    cuyo encabezado empieza en una fila y columna al azar.
+    encabezados: [índice, descripción, programado, fabricado]
+    '''
+    wb = xl.Workbook()
+    hoja = wb.active
+    hoja['A1'] = titulo
+    hoja['A3'] = etiqueta_fecha
+    if fecha_abajo:
+        hoja['A4'] = fecha
+    else:
+        hoja['B3'] = fecha
+    fila_encabezados = int(rng.integers(6, 16))
+    columna_inicial = int(rng.integers(1, 4))
+    for columna, valor in enumerate(encabezados, start=columna_inicial):
+        hoja.cell(fila_encabezados, columna, valor)
+    columnas = list(range(columna_inicial, columna_inicial + len(encabezados)))
+    _escribe_tabla(rng, hoja, fila_encabezados+1, columnas, _filas_producto(rng, skus, n_filas))
+    return _a_bytes(wb)
+
+def liquido_v2(rng:np.random.Generator, skus:list, fecha:datetime.datetime, n_filas:int=150) -> bytes:
+    return _hoja_v2(rng, skus, fecha, n_filas, 'PROGRAMA DE PRODUCCIÓN', 'DEL:', False,
+                    ['CLAVE', 'DESCRIPCIÓN', 'Programa', 'Fabricado'])
+
+def polvo_v2(rng:np.random.Generator, skus:list, fecha:datetime.datetime, n_filas:int=80) -> bytes:
+    return _hoja_v2(rng, skus, fecha, n_filas, 'FABRICACIONES', 'Fecha', True,
+                    ['CLAVE', 'DESCRIPCION', 'KG PROGRAMADOS', 'KG FABRICADOS'])
+
+def lerma_v2(rng:np.random.Generator, skus:list, fecha:datetime.datetime, n_filas:int=80) -> bytes:
+    return _hoja_v2(rng, skus, fecha, n_filas, 'PRODUCCIÓN LERMA', 'Fecha:', False,
+                    ['Clave', 'Descripción', 'Programado por \nsemana', 'Producido'])
@@ -0,0 +1,87 @@
+'''
+Historias de producción sintéticas para medir las consultas de los reportes.
+Los productos siguen una distribución de Zipf: unos cuantos skus aparecen casi todas las
+semanas y la mayoría aparece pocas veces, igual que en los datos reales. Cada sku pertenece
+a una marca y cada marca a una familia.
+'''
+import numpy as np
+import pandas as pd
+
+TIPOS_V2 = ['liquido', 'polvo', 'lerma']
+# Tipo y planta que le corresponden en v1 a cada tipo de v2
+TIPOS_V1 = {'liquido': ('LIQUIDOS', 'IZUCAR'), 'polvo': ('POLVOS', 'IZUCAR'), 'lerma': ('TBD', 'LERMA')}
+ULTIMA_SEMANA = pd.Timestamp('2023-10-16')
+
+def catalogo(rng:np.random.Generator, n_skus:int=600, n_familias:int=25, n_marcas:int=120) -> pd.DataFrame:
+    '''
+    Regresa un catálogo con las columnas sku, descripcion, familia, marca y tipo
+    '''
+    familias = np.array([f'FAMILIA {i:02d}' for i in range(n_familias)])
+    marcas = np.array([f'MARCA {i:03d}' for i in range(n_marcas)])
+    familia_de_marca = rng.integers(0, n_familias, size=n_marcas)
+    marca_de_sku = rng.integers(0, n_marcas, size=n_skus)
+    tipo_de_sku = rng.integers(0, len(TIPOS_V2), size=n_skus)
+    skus = np.array([f'{"LPH"[tipo]}{i:04d}' for i, tipo in enumerate(tipo_de_sku)])
+    return pd.DataFrame({
+        'sku': skus,
+        'descripcion': [f'PRODUCTO {sku}' for sku in skus],
+        'familia': familias[familia_de_marca[marca_de_sku]],
+        'marca': marcas[marca_de_sku],
+        'tipo': np.array(TIPOS_V2)[tipo_de_sku]
+    })
+
+def historia(rng:np.random.Generator, productos:pd.DataFrame, n_filas:int, filas_por_semana:int=1_500) -> pd.DataFrame:
+    '''
+    Regresa n_filas registros de producción con las columnas de v2:
+    sku, fabricado, programado, fecha, tipo, descripcion, familia, marca.
+    Cada semana tiene filas_por_semana registros y la última semana es ULTIMA_SEMANA.
+    '''
+    n_semanas = -(-n_filas // filas_por_semana)
+    semanas = pd.date_range(end=ULTIMA_SEMANA, periods=n_semanas, freq='W-MON')
+    pesos = 1 / np.arange(1, len(productos) + 1) ** 1.1
+    elegidos = rng.choice(len(productos), size=n_filas, p=pesos / pesos.sum())
+    programado = rng.integers(10, 5_000, size=n_filas)
+    fabricado = np.round(programado * rng.choice([0.5, 0.9, 1.0, 1.0, 1.0, 1.1], size=n_filas)).astype(int)
+    datos = productos.iloc[elegidos].reset_index(drop=True)
+    return pd.DataFrame({
+        'sku': datos.sku,
+        'fabricado': fabricado,
+        'programado': programado,
+        'fecha': semanas[np.arange(n_filas) // filas_por_semana],
+        'tipo': datos.tipo,
+        'descripcion': datos.descripcion,
+        'familia': datos.familia,
+        'marca': datos.marca
+    })
+
+def historia_v1(datos:pd.DataFrame) -> pd.DataFrame:
+    '''
+    Convierte una historia con las columnas de v2 a las columnas del archivo de qlik de v1
+    '''
+    porcentaje = np.round(datos.fabricado / datos.programado, 2)
+    tipos = datos.tipo.map({tipo: v1[0] for tipo, v1 in TIPOS_V1.items()})
+    plantas = datos.tipo.map({tipo: v1[1] for tipo, v1 in TIPOS_V1.items()})
+    calendario = datos.fecha.dt.isocalendar()
+    # Las fechas como texto se calculan por semana y no por fila
+    fechas_texto = pd.Series(datos.fecha.unique()).dt.strftime('%d/%m/%Y')
+    fechas_texto.index = datos.fecha.unique()
+    return pd.DataFrame({
+        'sku': datos.sku,
+        'planeado': datos.programado,
+        'producido': datos.fabricado,
+        'tipo': tipos,
+        'planta': plantas,
+        'inicio_semana': datos.fecha.map(fechas_texto),
+        'inicio_semana_real': datos.fecha,
+        'semana': calendario.week.astype(int),
+        'anio': calendario.year.astype(int),
+        'porcentaje': porcentaje,
+        'completado': (porcentaje == 1).astype('int8'),
+        'superado': (porcentaje > 1).astype('int8'),
+        'inferior': (porcentaje < 1).astype('int8'),
+        'terminado': (porcentaje >= 1).astype('int8'),
+        'estatus': np.where(porcentaje == 1, 'COMPLETADO', np.where(porcentaje < 1, 'PENDIENTE', 'SUPERADO')),
+        'familia': datos.familia,
+        'marca': datos.marca,
+        'descripcion': datos.descripcion
+    })
@@ -0,0 +1,202 @@
+'''
+Benchmark de la carga de archivos de producción.
+
+Para cada app (v1 y v2), cada plantilla y cada escala (número de semanas) se generan libros
+sintéticos y se cargan uno por uno, igual que desde la página de carga. Se reporta el tiempo
+y el RSS máximo de cada etapa:
+    lectura     -> abrir el libro y extraer los datos
+    validacion  -> limpiar, validar contra el catálogo y juntar con la historia
+    guardado    -> escribir los datos
+El RSS es el del proceso que carga los archivos; no incluye los procesos del pool que usa lerma en v1.
+Antes de medir v2 se verifica que los dos modos de DataExtraction (streaming y DataFrame) extraigan
+lo mismo, con los mismos tipos, de un libro sintético y del ejemplo real de cada plantilla, tanto
+al extraer como al validar con ProductionCleaner.
+Con --base se compara contra una corrida anterior guardada con --salida (ver benchmarks.consultas).
+
+Cada app corre en su propio proceso (las dos tienen un paquete llamado scripts) dentro de un
+directorio temporal con una copia de su carpeta data sin la historia de producción: la historia
+empieza vacía y crece con lo que se carga, y los datos del repositorio no se tocan.
+
+Uso (desde la raíz del repositorio):
+    python -m benchmarks.ingestion
+    python -m benchmarks.ingestion --apps v2 --semanas 1 52 156 --salida ingestion.json
+'''
+import os
+import sys
+import glob
+import argparse
+import numpy as np
+from benchmarks import generadores
+from benchmarks.entorno import prepara_worker, corre_en_subproceso
+from benchmarks.medicion import Medidor, imprime_tabla, guarda_resultados, lee_resultados, compara
+
+SEMILLA = 20231016
+# Lerma en v1 es un solo libro con una hoja por semana del año
+MAXIMO_HOJAS_LERMA = 52
+ETAPAS = ['lectura', 'validacion', 'guardado']
+LLAVES = ['app', 'semanas', 'plantilla']
+COLUMNAS_REPORTE = ['app', 'semanas', 'plantilla', 'etapa', 'n', 'total_s', 'p50_ms', 'p95_ms', 'maximo_ms', 'rss_pico_mb']
+COLUMNAS_COMPARACION = COLUMNAS_REPORTE + ['base_ms', 'cambio', 'estado']
+# Los libros de ejemplo de cada plantilla de v2 (en v2/templates)
+EJEMPLOS_V2 = {
+    'liquido': 'Liquidos - *.xlsm',
+    'polvo': 'POLVOS - *.xlsx',
+    'lerma': 'produccion-lerma-*.xlsx'
+}
+
+def benchmark_v1(medidor:Medidor, semanas:int):
+    '''
+    Carga semanas archivos de líquidos y de polvos y un libro de lerma con FileCleaner.
+    Los métodos clean_* hacen todo en una sola llamada, así que para separar las etapas se mide
+    por dentro la actualización de la historia (__save_updated_df) y la escritura (reemplaza_semanas_qlik).
+    '''
+    import pandas as pd
+    import scripts.file_cleaner as file_cleaner
+    from scripts.file_cleaner import FileCleaner
+
+    etiquetas = {'app': 'v1', 'semanas': semanas}
+    reemplaza_semanas_qlik = file_cleaner.reemplaza_semanas_qlik
+    save_updated_df = FileCleaner._FileCleaner__save_updated_df
+
+    def guarda_medido(*args, **kwargs):
+        with medidor.etapa('guardado', **etiquetas):
+            return reemplaza_semanas_qlik(*args, **kwargs)
+
+    def save_updated_df_medido(self, updated_data):
+        with medidor.etapa('validacion', **etiquetas):
+            return save_updated_df(self, updated_data)
+
+    file_cleaner.reemplaza_semanas_qlik = guarda_medido
+    FileCleaner._FileCleaner__save_updated_df = save_updated_df_medido
+
+    rng = np.random.default_rng(SEMILLA)
+    skus = pd.read_parquet('data/static/catalogo_productos.parquet').sku.to_list()
+    fc = FileCleaner()
+
+    etiquetas['plantilla'] = 'liquidos'
+    for semana in range(semanas):
+        fecha = generadores.lunes(semana)
+        archivo = generadores.ArchivoSubido(generadores.liquidos_v1(rng, skus, fecha), f'liquidos-{semana}.xlsx')
+        with medidor.etapa('lectura', **etiquetas):
+            fc.clean_liquidos(archivo)
+
+    etiquetas['plantilla'] = 'polvos'
+    for semana in range(semanas):
+        fecha = generadores.lunes(semana)
+        archivo = generadores.ArchivoSubido(generadores.polvos_v1(rng, skus, fecha), f'polvos-{semana}.xlsx')
+        with medidor.etapa('lectura', **etiquetas):
+            fc.clean_polvos(archivo)
+
+    etiquetas['plantilla'] = 'lerma'
+    hojas = list(range(1, min(semanas, MAXIMO_HOJAS_LERMA) + 1))
+    archivo = generadores.ArchivoSubido(generadores.lerma_v1(rng, skus, hojas), 'lerma.xlsx')
+    with medidor.etapa('lectura', **etiquetas):
+        fc.clean_lerma(archivo)
+
+def verifica_modos_v2(catalogo:str, skus:list, generadores_v2:dict):
+    '''
+    Limpia cada libro con ProductionCleaner leyéndolo en modo streaming y en modo DataFrame y
+    verifica que los datos extraídos, los buenos y los malos sean iguales, incluidos los tipos
+    de las columnas. Si no, lanza AssertionError.
+    '''
+    import pandas as pd
+    from scripts.clean_production_files import ProductionCleaner
+    from scripts.template_registry import get_plantillas, DIRECTORIO_PLANTILLAS
+
+    # Otra semilla para que los libros que se miden sean los mismos con o sin la verificación
+    rng = np.random.default_rng(SEMILLA + 1)
+    for nombre in get_plantillas():
+        cleaner = ProductionCleaner(catalogo_file=catalogo, clean_data_file=None, plantilla=nombre)
+        libros = [generadores.ArchivoSubido(generadores_v2[nombre](rng, skus, generadores.lunes(0)), f'{nombre}.xlsx')]
+        libros += sorted(glob.glob(os.path.join(DIRECTORIO_PLANTILLAS, EJEMPLOS_V2[nombre])))
+        for libro in libros:
+            resultados = []
+            for streaming in [False, True]:
+                if hasattr(libro, 'seek'):
+                    libro.seek(0)
+                cleaner.extract_data(libro, streaming=streaming)
+                cleaner.valida_datos()
+                resultados.append((cleaner.extracted_data, cleaner.good_data, cleaner.bad_data))
+            for parte, dataframe, streaming in zip(['extraídos', 'buenos', 'malos'], *resultados):
+                pd.testing.assert_frame_equal(dataframe, streaming, obj=f'{nombre}: datos {parte}')
+
+def benchmark_v2(medidor:Medidor, semanas:int):
+    '''
+    Carga semanas archivos de cada plantilla con LiquidoCleaner, PolvoCleaner y LermaCleaner.
+    '''
+    from scripts.catalog_service import get_catalogo
+    from scripts.clean_production_files import LiquidoCleaner, PolvoCleaner, LermaCleaner
+
+    catalogo = 'data/catalogo_productos.xlsx'
+    clean_data = 'data/datos_produccion'
+    rng = np.random.default_rng(SEMILLA)
+    skus = get_catalogo(catalogo).datos.sku.to_list()
+    plantillas = [
+        ('liquido', LiquidoCleaner, generadores.liquido_v2),
+        ('polvo', PolvoCleaner, generadores.polvo_v2),
+        ('lerma', LermaCleaner, generadores.lerma_v2)
+    ]
+    verifica_modos_v2(catalogo, skus, {plantilla: generador for plantilla, _, generador in plantillas})
+    for plantilla, clase, generador in plantillas:
+        etiquetas = {'app': 'v2', 'semanas': semanas, 'plantilla': plantilla}
+        cleaner = clase(catalogo_file=catalogo, clean_data_file=clean_data)
+        for semana in range(semanas):
+            archivo = generadores.ArchivoSubido(generador(rng, skus, generadores.lunes(semana)), f'{plantilla}-{semana}.xlsx')
+            with medidor.etapa('lectura', **etiquetas):
+                cleaner.extract_data(archivo)
+            with medidor.etapa('validacion', **etiquetas):
+                cleaner.valida_datos()
+            with medidor.etapa('guardado', **etiquetas):
+                cleaner.save_data()
+
+BENCHMARKS = {'v1': benchmark_v1, 'v2': benchmark_v2}
+
+def corre_worker(app:str, semanas:int, salida:str):
+    '''
+    Corre dentro del proceso hijo, con el directorio actual en la copia de data de la app
+    '''
+    prepara_worker(app)
+    medidor = Medidor()
+    try:
+        BENCHMARKS[app](medidor, semanas)
+    finally:
+        medidor.cierra()
+    resumen = medidor.resumen(LLAVES)
+    # Las plantillas en el orden en que se cargaron y las etapas en el orden del proceso
+    plantillas = list(dict.fromkeys(fila['plantilla'] for fila in resumen))
+    resumen.sort(key=lambda fila: (plantillas.index(fila['plantilla']), ETAPAS.index(fila['etapa'])))
+    guarda_resultados(salida, 'ingestion', resumen)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la carga de archivos de producción')
+    parser.add_argument('--apps', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--semanas', nargs='+', type=int, default=[1, 52], help='escalas: número de semanas a cargar')
+    parser.add_argument('--salida', help='archivo json donde se guardan los resultados')
+    parser.add_argument('--base', help='archivo json de una corrida anterior contra el que se compara')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='cambio relativo de la mediana que se considera regresión')
+    parser.add_argument('--worker', choices=list(BENCHMARKS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        corre_worker(args.worker, args.semanas[0], args.salida)
+        return
+
+    resultados = [
+        fila
+        for app in args.apps for semanas in args.semanas
+        for fila in corre_en_subproceso('benchmarks.ingestion', app, ['--semanas', semanas])
+    ]
+    if args.salida is not None:
+        guarda_resultados(args.salida, 'ingestion', resultados)
+
+    if args.base is None:
+        imprime_tabla(resultados, COLUMNAS_REPORTE)
+        return
+    comparados = compara(resultados, lee_resultados(args.base), LLAVES, tolerancia=args.tolerancia)
+    imprime_tabla(comparados, COLUMNAS_COMPARACION)
+    if any(fila['estado'] == 'regresion' for fila in comparados):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
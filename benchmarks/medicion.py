@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import datetime
+import platform
+import resource
+import threading
+import numpy as np
+from contextlib import contextmanager
+
+# Cada cuánto se lee el RSS del proceso mientras corre una etapa
+INTERVALO_MUESTREO = 0.005
+
+def rss_actual_mb() -> float:
+    '''
+    Regresa el RSS actual del proceso en MB. En sistemas sin /proc se usa el máximo
+    que reporta resource, que solo puede crecer.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+
+class Medidor:
+    '''
+    Esta clase mide el tiempo y el RSS máximo de cada etapa de un proceso.
+    Las etapas se pueden anidar: el tiempo de una etapa no incluye el de las etapas que
+    corren dentro de ella, así que las etapas de un mismo proceso se pueden sumar.
+    El RSS máximo sí incluye todo lo que pasó mientras la etapa estaba abierta.
+
+    Ejemplo:
+        medidor = Medidor()
+        with medidor.etapa('lectura'):
+            ...
+        medidor.resumen(['app'])
+    '''
+    def __init__(self) -> None:
+        self.mediciones = []
+        self.__abiertas = []
+        self.__lock = threading.Lock()
+        self.__detener = threading.Event()
+        self.__muestreador = threading.Thread(target=self.__muestrea, daemon=True)
+        self.__muestreador.start()
+
+    def __muestrea(self):
+        while not self.__detener.wait(INTERVALO_MUESTREO):
+            rss = rss_actual_mb()
+            with self.__lock:
+                for abierta in self.__abiertas:
+                    abierta['rss_pico_mb'] = max(abierta['rss_pico_mb'], rss)
+
+    @contextmanager
+    def etapa(self, nombre:str, **etiquetas):
+        '''
+        Mide lo que pase dentro del bloque. Las etiquetas se guardan junto con la medición
+        (por ejemplo app o plantilla) para poder agrupar después.
+        '''
+        abierta = {'etapa': nombre, **etiquetas, 'rss_pico_mb': rss_actual_mb(), 'hijas': 0.0}
+        with self.__lock:
+            padre = self.__abiertas[-1] if len(self.__abiertas) > 0 else None
+            self.__abiertas.append(abierta)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            duracion = time.perf_counter() - inicio
+            rss = rss_actual_mb()
+            with self.__lock:
+                self.__abiertas.remove(abierta)
+                abierta['rss_pico_mb'] = max(abierta['rss_pico_mb'], rss)
+                if padre is not None:
+                    padre['hijas'] += duracion
+                    padre['rss_pico_mb'] = max(padre['rss_pico_mb'], abierta['rss_pico_mb'])
+            abierta['segundos'] = duracion - abierta.pop('hijas')
+            self.mediciones.append(abierta)
+
+    def resumen(self, llaves:list) -> list:
+        '''
+        Agrupa las mediciones por las llaves dadas (y la etapa). Por cada grupo regresa
+        el número de mediciones, el tiempo total, el promedio, la mediana, el percentil 95 y
+        el máximo en milisegundos y el RSS máximo.
+        '''
+        grupos = {}
+        for medicion in self.mediciones:
+            llave = tuple(medicion.get(columna) for columna in llaves + ['etapa'])
+            grupos.setdefault(llave, []).append(medicion)
+
+        resumen = []
+        for llave, mediciones in grupos.items():
+            milisegundos = 1000 * np.array([medicion['segundos'] for medicion in mediciones])
+            resumen.append({
+                **dict(zip(llaves + ['etapa'], llave)),
+                'n': len(mediciones),
+                'total_s': round(milisegundos.sum() / 1000, 4),
+                'promedio_ms': round(milisegundos.mean(), 3),
+                'p50_ms': round(np.percentile(milisegundos, 50), 3),
+                'p95_ms': round(np.percentile(milisegundos, 95), 3),
+                'maximo_ms': round(milisegundos.max(), 3),
+                'rss_pico_mb': round(max(medicion['rss_pico_mb'] for medicion in mediciones), 1)
+            })
+        return resumen
+
+    def cierra(self):
+        self.__detener.set()
+        self.__muestreador.join()
+
+
+def imprime_tabla(filas:list, columnas:list):
+    '''
+    Imprime una lista de diccionarios como una tabla de texto
+    '''
+    anchos = {columna: max([len(columna)] + [len(str(fila.get(columna, ''))) for fila in filas]) for columna in columnas}
+    print('  '.join(columna.ljust(anchos[columna]) for columna in columnas))
+    print('  '.join('-' * anchos[columna] for columna in columnas))
+    for fila in filas:
+        print('  '.join(str(fila.get(columna, '')).ljust(anchos[columna]) for columna in columnas))
+
+
+def guarda_resultados(ubicacion:str, benchmark:str, resultados:list):
+    '''
+    Guarda los resultados en json junto con la fecha y la versión de python y de la máquina
+    '''
+    contenido = {
+        'benchmark': benchmark,
+        'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'maquina': platform.platform(),
+        'resultados': resultados
+    }
+    with open(ubicacion, 'w') as f:
+        json.dump(contenido, f, indent=2)
+
+def lee_resultados(ubicacion:str) -> list:
+    with open(ubicacion) as f:
+        return json.load(f)['resultados']
+
+def compara(resultados:list, base:list, llaves:list, tolerancia:float=0.2, slo_ms:float=None, metrica:str='p50_ms') -> list:
+    '''
+    Compara cada resultado con el de la base que tenga las mismas llaves (y etapa).
+    A cada resultado se le agregan:
+        base_ms -> la métrica en la base
+        cambio  -> cambio relativo contra la base (0.25 es 25% más lento)
+        estado  -> 'regresion' o 'mejora' si el cambio pasa la tolerancia, 'ok' si no y 'nuevo' si no está en la base
+        slo     -> 'excede' si el percentil 95 pasa de slo_ms
+    '''
+    llaves = llaves + ['etapa']
+    por_llave = {tuple(fila.get(llave) for llave in llaves): fila for fila in base}
+    comparados = []
+    for fila in resultados:
+        anterior = por_llave.get(tuple(fila.get(llave) for llave in llaves))
+        comparado = {**fila, 'base_ms': None, 'cambio': None, 'estado': 'nuevo', 'slo': ''}
+        if anterior is not None and anterior[metrica] > 0:
+            cambio = fila[metrica] / anterior[metrica] - 1
+            comparado['base_ms'] = anterior[metrica]
+            comparado['cambio'] = round(cambio, 3)
+            comparado['estado'] = 'regresion' if cambio > tolerancia else 'mejora' if cambio < -tolerancia else 'ok'
+        if slo_ms is not None and fila['p95_ms'] > slo_ms:
+            comparado['slo'] = 'excede'
+        comparados.append(comparado)
+    return comparados
@@ -130,12 +130,19 @@ def download_df(df:pd.DataFrame):
     )
     download_button(bytes_data, filename)
 
-def show_cumplimiento_historico(n_semanas:int):
+def show_cumplimiento_historico(file_cleaner:FileCleaner, fecha_fin:pd.Timestamp, n_semanas:int):
     '''
-    TODO: función que muestre una gráfica para ver el históricio de cumplimiento.
-    La verdad no sé si esto sea necesario.
+    Función que muestra una gráfica con el histórico de cumplimiento de las n_semanas que terminan en fecha_fin.
+    El cumplimiento por semana ya está calculado, así que cambiar el número de semanas no vuelve a agrupar los datos.
+    Input:
+        fecha_fin -> un timestamp de final (el viernes de la semana)
+        n_semanas -> número de semanas a mostrar
     '''
-    pass
+    _, domingo_fin = get_corresponding_sundays(fecha_inicio=fecha_fin, fecha_fin=fecha_fin)
+    domingo_inicio = domingo_fin - pd.Timedelta(weeks=n_semanas)
+    historico = file_cleaner.get_cumplimiento_por_semana(inicio=domingo_inicio, fin=domingo_fin)
+    st.markdown('##### Histórico de Cumplimiento')
+    st.line_chart(historico*100)
 
 def lunes_anterior_cercano(fecha:datetime.date):
     # Calcula el día de la semana de la fecha dada (0 = lunes, 1 = martes, ..., 6 = domingo)
@@ -227,7 +234,8 @@ def render_page():
     st.dataframe(df_productos, hide_index=True, use_container_width=True)
     download_df(df=df_productos)
 
-    show_cumplimiento_historico(n_semanas=10)
+    n_semanas = st.sidebar.slider('Semanas a retroceder', min_value=2, max_value=52, value=10)
+    show_cumplimiento_historico(file_cleaner=fc, fecha_fin=fecha_fin, n_semanas=n_semanas)
     
 
 
@@ -0,0 +1,108 @@
+import os
+import threading
+import pandas as pd
+
+# Catálogos que ya se cargaron en este proceso. La llave es la ubicación del catálogo base.
+_CATALOGOS = {}
+_CATALOGOS_LOCK = threading.Lock()
+# Cuando el delta llega a este número de productos se junta con el catálogo base
+FILAS_MAXIMAS_DELTA = 200
+
+def _firma_archivo(location:str) -> tuple:
+    if not os.path.isfile(location):
+        return None
+    stat = os.stat(location)
+    return stat.st_mtime_ns, stat.st_size
+
+def _guarda_parquet(datos:pd.DataFrame, location:str):
+    '''
+    Escribe un archivo temporal y luego lo renombra, para que nunca quede un archivo a medias
+    '''
+    tmp_location = f'{os.path.dirname(location)}/.{os.path.basename(location)}.tmp'
+    datos.to_parquet(tmp_location, index=False)
+    os.replace(tmp_location, location)
+
+
+class CatalogoProductos:
+    '''
+    Esta clase mantiene el catálogo de productos como una tabla con llave sku.
+    El catálogo se guarda en dos archivos: el catálogo base y un delta con los productos que se
+    agregaron desde la última compactación. Agregar productos solo reescribe el delta, que es pequeño;
+    cuando llega a FILAS_MAXIMAS_DELTA productos se junta todo otra vez en el catálogo base.
+
+    Columnas del catálogo: sku, familia, marca, descripcion
+    '''
+    def __init__(self, location:str) -> None:
+        '''
+        location: ubicación del catálogo base (parquet)
+        '''
+        self.location = location
+        self.delta_location = f'{os.path.splitext(location)[0]}.delta.parquet'
+        self.signature = self.firma(location)
+        self.lock = threading.Lock()
+        base = pd.read_parquet(location)
+        delta = pd.read_parquet(self.delta_location) if os.path.isfile(self.delta_location) else base.iloc[:0]
+        # Si una compactación se interrumpió, los productos del delta ya pueden estar en el base
+        self.delta = delta.loc[~delta.sku.isin(base.sku)].reset_index(drop=True)
+        self.__set_datos(pd.concat([base, self.delta], ignore_index=True))
+
+    @staticmethod
+    def firma(location:str) -> tuple:
+        '''
+        Firma del catálogo: fecha de modificación y tamaño del base y del delta
+        '''
+        return _firma_archivo(location), _firma_archivo(f'{os.path.splitext(location)[0]}.delta.parquet')
+
+    def __set_datos(self, datos:pd.DataFrame):
+        self.datos = datos
+        self.skus = pd.Index(datos.sku.unique())
+
+    def is_current(self) -> bool:
+        '''
+        Regresa True si ninguno de los dos archivos ha cambiado desde que se cargaron
+        '''
+        return self.signature == self.firma(self.location)
+
+    def contiene(self, skus:pd.Series) -> pd.Series:
+        '''
+        Regresa una máscara con los skus que ya están en el catálogo
+        '''
+        return skus.isin(self.skus)
+
+    def agrega(self, nuevos_productos:pd.DataFrame):
+        '''
+        Agrega productos (que todavía no están en el catálogo) y guarda el delta.
+        Si el delta ya es muy grande se compacta en el catálogo base.
+        '''
+        if len(nuevos_productos) == 0:
+            return
+        with self.lock:
+            nuevos_productos = nuevos_productos[self.datos.columns]
+            self.delta = pd.concat([self.delta, nuevos_productos], ignore_index=True)
+            self.__set_datos(pd.concat([self.datos, nuevos_productos], ignore_index=True))
+            if len(self.delta) >= FILAS_MAXIMAS_DELTA:
+                self.__compacta()
+            else:
+                _guarda_parquet(self.delta, self.delta_location)
+            self.signature = self.firma(self.location)
+
+    def __compacta(self):
+        '''
+        Junta el delta con el catálogo base. Primero se escribe el base y después se borra el delta.
+        '''
+        _guarda_parquet(self.datos, self.location)
+        if os.path.isfile(self.delta_location):
+            os.remove(self.delta_location)
+        self.delta = self.delta.iloc[:0]
+
+
+def get_catalogo_productos(location:str) -> CatalogoProductos:
+    '''
+    Regresa el catálogo de este proceso. Solo se vuelve a leer si alguno de sus archivos cambió.
+    '''
+    with _CATALOGOS_LOCK:
+        catalogo = _CATALOGOS.get(location)
+        if catalogo is None or not catalogo.is_current():
+            catalogo = CatalogoProductos(location)
+            _CATALOGOS[location] = catalogo
+        return catalogo
@@ -0,0 +1,58 @@
+import re
+import datetime
+from functools import lru_cache
+
+# Meses en español. Las abreviaturas de tres letras se buscan igual que los nombres completos
+MESES = {
+    'enero': 1,
+    'febrero': 2,
+    'marzo': 3,
+    'abril': 4,
+    'mayo': 5,
+    'junio': 6,
+    'julio': 7,
+    'agosto': 8,
+    'septiembre': 9,
+    'octubre': 10,
+    'noviembre': 11,
+    'diciembre': 12
+}
+ABREVIATURAS = {nombre[:3]: numero for nombre, numero in MESES.items()}
+
+_PATRON_NUMEROS = re.compile(r'\d+')
+_PATRON_MESES = re.compile(
+    r'\b(?:' + '|'.join(sorted([*MESES, *ABREVIATURAS], key=len, reverse=True)) + r')\b',
+    re.IGNORECASE
+)
+
+def extraer_mes(texto:str) -> int:
+    '''
+    Regresa el número del primer mes (nombre completo o abreviatura) que aparece en el texto
+    '''
+    encontrado = _PATRON_MESES.search(texto)
+    if encontrado is None:
+        raise ValueError(f'No se encontró ningún mes en {texto}')
+    nombre = encontrado.group(0).lower()
+    return MESES.get(nombre, ABREVIATURAS.get(nombre))
+
+@lru_cache(maxsize=1024)
+def _fecha_de_texto(texto:str, year:int) -> datetime.datetime:
+    numeros = _PATRON_NUMEROS.findall(texto)
+    if len(numeros) == 0:
+        raise ValueError(f'No se encontró ningún día en {texto}')
+    # Igual que %d: el día tiene a lo más dos dígitos
+    if len(numeros[0]) > 2:
+        raise ValueError(f'No se entendió el día en {texto}')
+    return datetime.datetime(year, extraer_mes(texto), int(numeros[0]))
+
+def fecha_de_texto(texto:str, year:int=None) -> datetime.datetime:
+    '''
+    Esta función recibe una cadena de texto que contiene al menos un número y un nombre de mes
+    en español (por ejemplo el nombre de un archivo) y regresa la fecha que forman el primer número
+    y el primer mes. En caso de que no se especifique el año, se toma el año actual.
+    No depende del locale del sistema, así que se puede usar desde varios hilos a la vez.
+    Lanza ValueError si no se puede formar la fecha.
+    '''
+    if year is None:
+        year = datetime.datetime.now().year
+    return _fecha_de_texto(texto, year)
@@ -1,51 +1,36 @@
+import io
 import os
-import re
-import locale
+import math
 import datetime
 import pandas as pd
 import numpy as np
 import openpyxl as xl
 from openpyxl.utils.cell import coordinate_to_tuple
+from concurrent.futures.process import BrokenProcessPool
+from scripts.qlik_dataset import get_qlik_dataset, reemplaza_semanas_qlik, convierte_fechas, LLAVE_SEMANA
+from scripts.sku_normalizer import normaliza_skus
+from scripts.lerma_parser import extrae_hojas_lerma, get_pool, descarta_pool, MAXIMO_PROCESOS
+from scripts.catalogo_productos import get_catalogo_productos
+from scripts.date_parser import fecha_de_texto
+
+# Número de hojas de lerma que vale la pena darle a cada proceso
+HOJAS_POR_PROCESO = 4
+# Llave de las filas del archivo para qlik: un producto por semana de cada planta y tipo
+LLAVE_QLIK = LLAVE_SEMANA + ['sku']
 
 
 class FileCleaner:
     def __init__(self, main=False):
         self.qlik_file_name = 'data_for_qlik.parquet'
         self.current_dir = '..' if main else '.'
+        self.qlik_file_location = f'{self.current_dir}/data/{self.qlik_file_name}'
         self.unidades = pd.read_csv(f'{self.current_dir}/data/static/conversion_unidades.csv')
-        self.catalogo = pd.read_parquet(f'{self.current_dir}/data/static/catalogo_productos.parquet')
-
-    def __limpia_cadena(self, cadena):
-        # Quitamos tabulaciones
-        aux = str(cadena).replace('\t', '')
-        aux = aux.rstrip()
-        aux = aux.replace('´', '')
-        aux = re.sub(r'\.\d+', '', aux)
-        aux = re.sub(r'-\d+', '', aux)
-        aux = re.sub(r'^ANSA', '', aux)
-        # Tratamos de convertir a int, y luego lo regresamos a string
-        try:
-            aux = str(int(aux))
-        except:
-            aux = str(aux)
-        return aux
-    
-    def __open_qlik_file(self):
-        tipo_de_archivo = self.qlik_file_name.split('.')[-1]
-        file_to_open = f'{self.current_dir}/data/{self.qlik_file_name}'
-        # Verificar que el archivo verdaderamente exista, o crear uno nuevo en caso contrario
-        if self.qlik_file_name not in os.listdir(f'{self.current_dir}/data'):
-            # Creamos el archivo dummy solo para que no truene el resto de cosas
-            return pd.DataFrame(columns=['sku', 'planeado', 'producido', 'tipo', 'planta', 'inicio_semana',
-                    'inicio_semana_real', 'semana', 'anio', 'porcentaje', 'completado',
-                    'superado', 'inferior', 'terminado', 'estatus', 'familia', 'marca',
-                    'descripcion'])
-        if tipo_de_archivo == "csv":
-            data = pd.read_csv(file_to_open)
-        elif tipo_de_archivo == "parquet":
-            data = pd.read_parquet(file_to_open)
-        return data
+        self.catalogo_productos = get_catalogo_productos(f'{self.current_dir}/data/static/catalogo_productos.parquet')
+        self.catalogo = self.catalogo_productos.datos
 
+    def __open_qlik_file(self):
+        return get_qlik_dataset(self.qlik_file_location).datos
+    
     def __asigna_status(self, x):
         if x == 1:
             return "COMPLETADO"
@@ -67,20 +52,42 @@ class FileCleaner:
             col = coordinate_to_tuple(f'{col}1')[1]
             
         found_cells = []
-        row = initial_row
         consecutive_nones = 0
-        while consecutive_nones < max_consecutive_nones:
-            value = hoja.cell(row, col).value
+        # Leemos la columna de un jalón. Si la hoja se acaba antes, las filas que faltan son Nones
+        for row, (value,) in enumerate(hoja.iter_rows(min_row=initial_row, min_col=col, max_col=col, values_only=True), start=initial_row):
             # Hay dos opciones: value es el valor que buscamos o no
             if value == text:
                 found_cells.append(row)
             else: # si no es el valor que buscamos tenemos que ver si es None o no
                 if value is None: # Si el valor es None, tenemos que agregar 1 al contador de Nones
                     consecutive_nones += 1
+                    if consecutive_nones >= max_consecutive_nones:
+                        break
                 else: # Si el valor no es None, regresamos a 0 el contador de consecutive Nones
                     consecutive_nones = 0
-            row += 1
         return found_cells
+
+    def __lee_bloque(self, hoja, min_row, max_row, min_col=1, max_col=None) -> dict:
+        '''
+        Lee todas las filas entre min_row y max_row (incluidas) en un solo recorrido de la hoja.
+        Regresa un diccionario {numero_fila: tupla con los valores de la fila}
+        '''
+        filas = hoja.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col, values_only=True)
+        return {row: valores for row, valores in enumerate(filas, start=min_row)}
+
+    def __valores_bloque(self, bloque:dict, filas, cols:list, min_col=1) -> list:
+        '''
+        Regresa los valores de las columnas cols (números de columna) en cada una de las filas.
+        Las filas que no vienen en el bloque o que son más cortas se completan con None.
+        Al final se quitan las filas vacías, porque ahí ya se acabaron los datos.
+        '''
+        valores = []
+        for row in filas:
+            fila = bloque.get(row, ())
+            valores.append(tuple(fila[col - min_col] if col - min_col < len(fila) else None for col in cols))
+        while len(valores) > 0 and all(valor is None for valor in valores[-1]):
+            valores.pop()
+        return valores
     
     def __obtener_primer_dia_semana(self, numero_semana, anio):
         numero_semana, anio = int(numero_semana), int(anio)
@@ -95,71 +102,11 @@ class FileCleaner:
 
         return primer_dia_semana
     
-    def __extraer_numeros(self, texto):
-        patron = r'\d+'
-        numeros = re.findall(patron, texto)
-        return numeros
-    
-    def __extraer_nombres_meses(self, texto):
-        meses_espanol = {
-            'ene': 'enero',
-            'feb': 'febrero',
-            'mar': 'marzo',
-            'abr': 'abril',
-            'may': 'mayo',
-            'jun': 'junio',
-            'jul': 'julio',
-            'ago': 'agosto',
-            'sep': 'septiembre',
-            'oct': 'octubre',
-            'nov': 'noviembre',
-            'dic': 'diciembre'
-        }
-        patron = r'\b(?:ENERO|ENE|FEBRERO|FEB|MARZO|MAR|ABRIL|ABR|MAYO|MAY|JUNIO|JUN|JULIO|JUL|AGOSTO|AGO|SEPTIEMBRE|SEP|OCTUBRE|OCT|NOVIEMBRE|NOV|DICIEMBRE|DIC)\b'
-        nombres_meses = re.findall(patron, texto, re.IGNORECASE)
-        nombres_meses = [meses_espanol[nombre_mes.lower()] if len(nombre_mes) == 3 else nombre_mes for nombre_mes in nombres_meses ]
-        return nombres_meses
-    
-    def __crear_fecha(self, numero_dia, nombre_mes, year=None):
-        fecha_actual = datetime.datetime.now()
-        if year is None:
-            año_actual = fecha_actual.year
-        else:
-            año_actual = year
-        
-        # Establecer el idioma en español
-        locale.setlocale(locale.LC_TIME, 'es_ES.UTF-8')
-
-        
-        fecha_str = f"{numero_dia} {nombre_mes} {año_actual}"
-        fecha = datetime.datetime.strptime(fecha_str, "%d %B %Y")
-        
-        # Restaurar la configuración regional predeterminada
-        locale.setlocale(locale.LC_TIME, '')
-        
-        return fecha
-    
-    def __generate_date(self, nombre_archivo, year=None):
-        '''
-        Esta función recibe una cadena de texto que contiene al menos un número y un nombre de mes.
-        Extrae los número y nombres de mex que existan ahí y los convierte a una datetime.
-        En caso de que no se especifique el año, se toma el año actual.
-        '''
-        dia = self.__extraer_numeros(nombre_archivo)[0]
-        mes = self.__extraer_nombres_meses(nombre_archivo)[0]
-        try:
-            fecha = self.__crear_fecha(dia, mes, year)
-        except:
-            print(f'year was not successful in {nombre_archivo}')
-        return fecha
-    
-    def __obtener_columnas_en_fila(self, hoja, numero_fila, num_nones_consecutivos):
+    def __obtener_columnas_en_fila(self, valores_fila, num_nones_consecutivos):
         diccionario_columnas = {}
         nones_consecutivos = 0
     
-        for columna, celda in enumerate(hoja[numero_fila], start=1):
-            valor_celda = celda.value
-            
+        for columna, valor_celda in enumerate(valores_fila, start=1):
             if valor_celda is not None:
                 diccionario_columnas[valor_celda] = columna
                 nones_consecutivos = 0
@@ -170,14 +117,22 @@ class FileCleaner:
         
         return diccionario_columnas
 
-    def __actualiza_catalogo(self, new_data:pd.DataFrame):
-        new_catalogo = (
-            new_data
-            [['sku', 'descripcion']]
-            .merge(self.catalogo, on='sku', how='outer')
-            .fillna(value={'familia':'EXTERNO', 'marca':'BAYER'})
-            .assign(descripcion=lambda df: df.descripcion_y.fillna(df.descripcion_x).apply(self.__limpia_descripcion))
-            .drop(['descripcion_x', 'descripcion_y'], axis=1)
+    def __actualiza_catalogo(self, new_data:pd.DataFrame) -> list:
+        '''
+        Agrega al catálogo los skus de new_data que todavía no están en él. Los productos que ya
+        estaban no cambian. A los nuevos se les asigna EXTERNO/BAYER y la mejor de sus descripciones.
+        Regresa la lista de skus agregados.
+        '''
+        nuevos = new_data.loc[~self.catalogo_productos.contiene(new_data.sku) & (new_data.sku != "0"), ['sku', 'descripcion']]
+        if len(nuevos) == 0:
+            return []
+        nuevos_productos = (
+            nuevos
+            .assign(
+                familia='EXTERNO',
+                marca='BAYER',
+                descripcion=lambda df: df.descripcion.apply(self.__limpia_descripcion)
+            )
             # Vamos a agrupar para cada sku, contar cuántas descripciones distintas hay
             .drop_duplicates()
             .groupby(['sku', 'familia', 'marca'])
@@ -185,10 +140,11 @@ class FileCleaner:
             .assign(descripcion=lambda x: x.descripciones.apply(list).apply(self.__selecciona_descripcion))
             .drop(['descripciones'], axis=1)
             .reset_index()
-            .query('sku != "0"')
         )
-        new_catalogo.to_parquet(f'{self.current_dir}/data/static/catalogo_productos.parquet', index=False)
-        self.catalogo = new_catalogo
+        # Solo se escriben los productos nuevos
+        self.catalogo_productos.agrega(nuevos_productos)
+        self.catalogo = self.catalogo_productos.datos
+        return nuevos_productos.sku.to_list()
 
     def __limpia_descripcion(self, cadena:str):
         if cadena is None:
@@ -211,27 +167,25 @@ class FileCleaner:
         return min(lista_descripciones, key=len)
 
     def __save_updated_df(self, updated_data: pd.DataFrame):
-        # Ahora guardamos los datos
-        # Abrimos el archivo histórico, le pegamos los datos y los volvemos a guardar
-        previous_data = self.__open_qlik_file()
-        concated_data = pd.concat([previous_data, updated_data],ignore_index=True)
-        sin_duplicados = concated_data.drop_duplicates(subset=['sku', 'semana', 'anio'], keep='last')
-        # Actualizamos el catalogo, para asegurarnos de tener los más nuevos
-        self.__actualiza_catalogo(sin_duplicados)
-        # Tengo que asegurarme de que los datos de qlik estén limpios, porque siguen sucios
-        # Ya sabemos que todos los productos aquí tienen alguna descripción disponible, entonces es hacer el match y ya
-        sin_duplicados = (
-            sin_duplicados
+        '''
+        Guarda los datos nuevos en el archivo histórico. Cada semana de una planta y un tipo que
+        viene en los datos (LLAVE_SEMANA) reemplaza completa a la que estaba; el resto de la historia
+        no se toca y solo se leen los row groups de esas semanas (ver reemplaza_semanas_qlik).
+        El catálogo solo se actualiza con los skus nuevos y el archivo solo se reescribe si algo cambió.
+        '''
+        updated_data = (updated_data
+         .assign(inicio_semana_real=convierte_fechas(updated_data.inicio_semana_real))
+         .drop_duplicates(subset=LLAVE_QLIK, keep='last')
+        )
+        # Actualizamos el catalogo con los productos nuevos y le pegamos a los datos nuevos su información.
+        # Las filas que ya estaban en la historia ya tienen la información del catálogo
+        self.__actualiza_catalogo(updated_data)
+        updated_data = (
+            updated_data
             .drop(['descripcion', 'familia', 'marca'], axis=1)
             .merge(self.catalogo, on='sku', how='left')
         )
-        print(sin_duplicados.query('sku == "ABC1X20"'))
-        # Guardamos el archivo
-        tipo_de_archivo = self.qlik_file_name.split('.')[-1]
-        if tipo_de_archivo == "csv":
-            sin_duplicados.to_csv(f'{self.current_dir}/data/{self.qlik_file_name}', index=False)
-        elif tipo_de_archivo == "parquet":
-            sin_duplicados.to_parquet(f'{self.current_dir}/data/{self.qlik_file_name}', index=False)
+        reemplaza_semanas_qlik(updated_data, self.qlik_file_location)
 
     def __filtrar_valores_numericos(self, lista):
         valores_numericos = []
@@ -243,68 +197,23 @@ class FileCleaner:
                 pass
         return valores_numericos
     
-    def __extrae_datos_columnas(self, working_sheet, starting_row, dict_cols, ending_row=None, cols_to_extract=None, output_columns=None, rows_to_extract=100):
-        '''
-        Esta función extrae los datos de una hoja de excel y lo regresa como un dataframe.
-        working_sheet: la hoja de excel
-        starting_row: el número de la fila en la que empiezan los valores
-        dict_cols: un diccionario de la siguiente forma {'col_name_1':numero_columna_1, 'col_name_2':numero_columna_2}
-        ending_row: el número de la final donde terminan los valores (si es None, se extraen rows_to_extract filas tras starting_row)
-        cols_to_extract: una lista con los nombres de las columnas que se desean seleccionar (None->todas las dict_cols)
-        output_columns: los nombres de las columnas que se usarán en el DataFrame (None-> las mismas que dict_cols)
-        rows_to_extract: el máximo número de filas a extraer. Solo se considera si ending_row es None
-        '''
-        # Definimos los parámetros necesarios
-        
-        # LAST_ROW
-        if ending_row is None:
-            last_row = starting_row + rows_to_extract
-        else:
-            last_row = ending_row
-            
-        # COLS_TO_EXTRACT
-        if cols_to_extract is None:
-            cols_to_extract = list(dict_cols.keys())
-        
-        # OUTPUT_COLUMNS
-        if output_columns is None:
-            output_columns = cols_to_extract
-            
-        listas_datos = [[] for _ in range(len(cols_to_extract))]
-        for row in np.arange(starting_row, last_row):
-            for lista, col_name in zip(listas_datos, cols_to_extract):
-                lista.append(working_sheet.cell(row, dict_cols[col_name]).value)
-                
-        df = pd.DataFrame(np.array(listas_datos).transpose(), columns=output_columns)
-        df.dropna(how='all', inplace=True)
-        return df  
-    
-    def __find_last_data_row(self, ws, column_num, max_consecutive_nones, start_row):
-        consecutive_nones = 0
-        last_data_row = start_row - 1
-
-        for row in ws.iter_rows(min_row=start_row, min_col=column_num, max_col=column_num):
-            cell_value = row[0].value
-            if cell_value is None:
-                consecutive_nones += 1
-                if consecutive_nones >= max_consecutive_nones:
-                    return last_data_row
-            else:
-                last_data_row = row[0].row
-                consecutive_nones = 0
-
-        return last_data_row
-    
-    def __get_previous_processed_weeks(self, planta: str, tipo: str):
+    def __get_previous_processed_weeks(self, planta: str, tipo: str, anio: int=None):
+        '''
+        Regresa las semanas de la planta y el tipo que ya están en la historia.
+        Si se da anio, solo las de ese año.
+        '''
         previous_data = self.__open_qlik_file()
-        return list(previous_data.query('planta == @planta and tipo == @tipo').semana.unique())
+        previous_data = previous_data.query('planta == @planta and tipo == @tipo')
+        if anio is not None:
+            previous_data = previous_data.query('anio == @anio')
+        return list(previous_data.semana.unique())
 
     def __clean_data_frame(self, df_to_clean, fecha_formateada, year, semana):
         aux = (df_to_clean
         .query('planeado != 0')
         .dropna(subset=['sku', 'planeado'])
         .assign(
-            sku=lambda x: x.sku.apply(self.__limpia_cadena),
+            sku=lambda x: normaliza_skus(x.sku),
             tipo='TBD',
             planta='LERMA',
             inicio_semana=fecha_formateada,
@@ -354,53 +263,61 @@ class FileCleaner:
         celda_fecha = 'C5'
         celda_inicio_datos = 'B13'
 
-        # Apertura del archivo
-        archivo = xl.load_workbook(file, data_only=True)
-        programa = archivo[nombre_hoja]
-
-        coords_fecha = coordinate_to_tuple(celda_fecha)
-        fechas = []
-        for row in range(coords_fecha[0]-3, coords_fecha[0]+3):
-            fechas.append(programa.cell(row, coords_fecha[1]).value)
-        
-        if all(x is None for x in fechas):
-            print(f'Dates are not in the correct cell in {file.name}')
-            return False
-        fechas_aux = [aux for aux in fechas if aux is not None] # Aquí tengo dos fechas
-        mode_week, all_weeks = self.__calculate_week_mode(fechas_aux)
-        
-        if all_weeks.size > 13:
-            print(f"No se pudo entender la fecha en el archivo {file.name}")
-            return False
-        fecha = self.__obtener_primer_dia_semana(mode_week, datetime.datetime.now().year)
-        
-        #fecha = self.__obtener_primer_no_none(fechas)
-        
-        year = fechas_aux[0].year
-        semana = fecha.isocalendar().week
-        fecha_formateada = fechas_aux[0].strftime('%d/%m/%Y')
-        inicio_semana_real = fecha.strftime('%d/%m/%Y')
-
-
-        starting_data_row = self.__find_value(programa, celda_inicio_datos[0], text='CLAVE')[0]+1
-        starting_data_col = coordinate_to_tuple(celda_inicio_datos)[1]
-
-        # Ahora tomamos todos los datos de los skus
-        # NOTA: se espera que los datos empiecen siempre en la celda B13
-        # NOTA: no sé en qué medidas están. Supondré que son kg/lt
-        skus = []
-        descripciones = []
-        programado = []
-        fabricado = []
-        for row in range(starting_data_row, starting_data_row + 250):
-            skus.append(programa.cell(row, starting_data_col).value)
-            descripciones.append(programa.cell(row, starting_data_col + 1).value)  # se espera que las descripciones estén a un lado de los ids
-            programado.append(programa.cell(row, starting_data_col + 2).value) # se espera que lo programado esté a un lado de la descripción
-            fabricado.append(programa.cell(row, starting_data_col + 4).value) # se espera que lo fabricado esté a dos lados de lo programado 
+        # Apertura del archivo. En modo de solo lectura cada lectura recorre la hoja desde el principio,
+        # por eso se leen bloques completos de filas en lugar de celda por celda.
+        # Se cierra aunque el archivo no tenga el formato esperado
+        archivo = xl.load_workbook(file, data_only=True, read_only=True)
+        try:
+            programa = archivo[nombre_hoja]
+            programa.reset_dimensions()
+
+            coords_fecha = coordinate_to_tuple(celda_fecha)
+            filas_fecha = range(coords_fecha[0]-3, coords_fecha[0]+3)
+            bloque_fechas = self.__lee_bloque(programa, filas_fecha[0], filas_fecha[-1], min_col=coords_fecha[1], max_col=coords_fecha[1])
+            fechas = [bloque_fechas.get(row, (None,))[0] for row in filas_fecha]
+
+            if all(x is None for x in fechas):
+                print(f'Dates are not in the correct cell in {file.name}')
+                return False
+            fechas_aux = [aux for aux in fechas if aux is not None] # Aquí tengo dos fechas
+            mode_week, all_weeks = self.__calculate_week_mode(fechas_aux)
+
+            if all_weeks.size > 13:
+                print(f"No se pudo entender la fecha en el archivo {file.name}")
+                return False
+            fecha = self.__obtener_primer_dia_semana(mode_week, datetime.datetime.now().year)
+
+            #fecha = self.__obtener_primer_no_none(fechas)
+
+            year = fechas_aux[0].year
+            semana = fecha.isocalendar().week
+            fecha_formateada = fechas_aux[0].strftime('%d/%m/%Y')
+            inicio_semana_real = fecha.strftime('%d/%m/%Y')
+
+
+            starting_data_row = self.__find_value(programa, celda_inicio_datos[0], text='CLAVE')[0]+1
+            starting_data_col = coordinate_to_tuple(celda_inicio_datos)[1]
+
+            # Ahora tomamos todos los datos de los skus en un solo bloque
+            # NOTA: se espera que los datos empiecen siempre en la celda B13
+            # NOTA: no sé en qué medidas están. Supondré que son kg/lt
+            filas_datos = range(starting_data_row, starting_data_row + 250)
+            bloque_datos = self.__lee_bloque(programa, filas_datos[0], filas_datos[-1], min_col=starting_data_col, max_col=starting_data_col + 4)
+        finally:
+            archivo.close()
+
+        valores = self.__valores_bloque(
+            bloque_datos,
+            filas_datos,
+            # se espera que las descripciones estén a un lado de los ids, lo programado a un lado de la descripción
+            # y lo fabricado a dos lados de lo programado
+            cols=[starting_data_col, starting_data_col + 1, starting_data_col + 2, starting_data_col + 4],
+            min_col=starting_data_col
+        )
 
         # Creamos un dataframe para poder limpiar los datos
         df = (pd
-         .DataFrame({'sku':skus, 'descripcion':descripciones, 'planeado':programado, 'producido':fabricado})
+         .DataFrame(valores, columns=['sku', 'descripcion', 'planeado', 'producido'])
          .assign(
              planeado=lambda df: pd.to_numeric(df.planeado, errors='coerce'),
              producido=lambda df: pd.to_numeric(df.producido, errors='coerce')
@@ -419,7 +336,7 @@ class FileCleaner:
          .reset_index()
          .assign(
              # Limpiamos los skus para eliminar caracteres no deseados
-             sku=lambda df: df.sku.apply(self.__limpia_cadena),
+             sku=lambda df: normaliza_skus(df.sku),
              # Asignamos el tipo adecuado
              tipo='LIQUIDOS',
              planta='IZUCAR',
@@ -458,36 +375,47 @@ class FileCleaner:
         col_inicio_datos = coordinate_to_tuple(celda_inicio_datos)[1]
 
         # Abrimos el archivo y hoja
-        wb = xl.load_workbook(file, data_only=True)
-        programa = wb.active 
-        
-        # Encontramos la fila donde empiezan los datos y leemos las columnas
-        starting_data_row = self.__find_value(programa, celda_inicio_datos[0], text='CLAVE', max_consecutive_nones=10)[0]+1 
-        diccionario_cols = self.__obtener_columnas_en_fila(programa, starting_data_row-3, 15)
+        wb = xl.load_workbook(file, data_only=True, read_only=True)
+        try:
+            programa = wb.active 
+            programa.reset_dimensions()
+            
+            # Encontramos la fila donde empiezan los datos
+            starting_data_row = self.__find_value(programa, celda_inicio_datos[0], text='CLAVE', max_consecutive_nones=10)[0]+1 
+
+            # Leemos en un solo recorrido la fila con los nombres de las columnas, la fecha y los datos
+            fila_columnas = starting_data_row-3
+            row_fecha, col_fecha = coordinate_to_tuple(celda_fecha)
+            filas_datos = range(row_inicio_datos, row_inicio_datos + 100)
+            bloque = self.__lee_bloque(
+                programa,
+                min_row=min(fila_columnas, row_fecha, filas_datos[0]),
+                max_row=max(fila_columnas, row_fecha, filas_datos[-1])
+            )
+        finally:
+            wb.close()
+        diccionario_cols = self.__obtener_columnas_en_fila(bloque.get(fila_columnas, ()), 15)
+        valor_fecha = self.__valores_bloque(bloque, [row_fecha], [col_fecha])
         
         # Generamos la fecha a partir del nombre del archivo
         # Vemos si hay alguna fecha en la celda esperada, sino la creamos nosotros
-        if programa[celda_fecha].value is None:
-            fecha = self.__generate_date(file.name, year=None)
+        if len(valor_fecha) == 0:
+            fecha = fecha_de_texto(file.name, year=None)
         else:
-            fecha = programa[celda_fecha].value
+            fecha = valor_fecha[0][0]
         year = fecha.year
         semana = fecha.isocalendar().week
         fecha_formateada = fecha.strftime('%d/%m/%Y')
         inicio_semana_real = self.__obtener_primer_dia_semana(semana, year).strftime('%d/%m/%Y')
 
-        skus = []
-        descripciones = []
-        programado = []
-        fabricado = []
-        for row in range(row_inicio_datos, row_inicio_datos + 100):
-            skus.append(programa.cell(row, col_inicio_datos).value)
-            descripciones.append(programa.cell(row, col_inicio_datos + 1).value) 
-            programado.append(programa.cell(row, diccionario_cols['KG PROGRAMADOS']).value)
-            fabricado.append(programa.cell(row, diccionario_cols['KG FABRICADOS']).value)
+        valores = self.__valores_bloque(
+            bloque,
+            filas_datos,
+            cols=[col_inicio_datos, col_inicio_datos + 1, diccionario_cols['KG PROGRAMADOS'], diccionario_cols['KG FABRICADOS']]
+        )
 
         # Creamos un dataframe para poder limpiar los datos
-        df = pd.DataFrame({'sku':skus, 'descripcion':descripciones, 'planeado':programado, 'producido':fabricado})
+        df = pd.DataFrame(valores, columns=['sku', 'descripcion', 'planeado', 'producido'])
 
         # Limpiamos los datos
         limpio_aux = (df
@@ -501,7 +429,7 @@ class FileCleaner:
          .reset_index()
          .assign(
              # Limpiamos los skus para eliminar caracteres no deseados
-             sku=lambda df: df.sku.apply(self.__limpia_cadena),
+             sku=lambda df: normaliza_skus(df.sku),
              # Asignamos el tipo adecuado
              tipo='POLVOS',
              planta='IZUCAR',
@@ -528,57 +456,72 @@ class FileCleaner:
 
         self.__save_updated_df(limpio_aux)
 
-    def clean_lerma(self, file):
-        wb = xl.load_workbook(file, data_only=True)
-
-        # Vemos las semanas que ya habíamos procesado
-        previous_processed_weeks = self.__get_previous_processed_weeks(planta='LERMA', tipo='TBD')
+    def __lee_bytes(self, file) -> bytes:
+        '''
+        Regresa el contenido de un archivo subido en streamlit, de un archivo abierto o de una ubicación
+        '''
+        if hasattr(file, 'getvalue'):
+            return file.getvalue()
+        if hasattr(file, 'read'):
+            return file.read()
+        with open(file, 'rb') as f:
+            return f.read()
+
+    def __extrae_hojas_lerma(self, contenido:bytes, sheets:list, max_workers:int=None) -> dict:
+        '''
+        Reparte las hojas en grupos y cada grupo se extrae en un proceso distinto del pool compartido.
+        Cada proceso abre el libro una sola vez para todo su grupo.
+        max_workers: número máximo de procesos. Por default el número de CPUs, pero nunca más de MAXIMO_PROCESOS
+        Regresa un diccionario {hoja: datos crudos o None}
+        '''
+        if len(sheets) == 0:
+            return {}
+        if max_workers is None:
+            max_workers = min(os.cpu_count() or 1, MAXIMO_PROCESOS)
+        workers = min(max_workers, math.ceil(len(sheets) / HOJAS_POR_PROCESO))
+        if workers <= 1:
+            return dict(extrae_hojas_lerma(contenido, sheets))
+
+        grupos = [sheets[i::workers] for i in range(workers)]
+        try:
+            futures = [get_pool(workers).submit(extrae_hojas_lerma, contenido, grupo) for grupo in grupos]
+            return {sheet: datos for future in futures for sheet, datos in future.result()}
+        except BrokenProcessPool:
+            # Si algún proceso murió, el pool ya no sirve. Se crea uno nuevo en la siguiente carga.
+            descarta_pool(workers)
+            raise
+
+    def clean_lerma(self, file, max_workers:int=None):
+        '''
+        Cada hoja del libro de lerma es una semana del año actual. Solo se mandan a extraer, en
+        paralelo, las hojas de las semanas de este año que no están en la historia, y todas se
+        guardan juntas en una sola escritura.
+        max_workers: número máximo de procesos. Por default el número de CPUs, pero nunca más de MAXIMO_PROCESOS
+        '''
+        contenido = self.__lee_bytes(file)
+        wb = xl.load_workbook(io.BytesIO(contenido), read_only=True)
+        sheetnames = wb.sheetnames
+        wb.close()
+
+        # Vemos las semanas que ya habíamos procesado. Las hojas se fechan en el año actual
+        # (ver abajo), así que las semanas guardadas de otros años no cuentan
+        previous_processed_weeks = self.__get_previous_processed_weeks(planta='LERMA', tipo='TBD', anio=datetime.datetime.now().year)
+        sheets = [sheet for sheet in self.__filtrar_valores_numericos(sheetnames) if int(sheet) not in previous_processed_weeks]
+        processed_weeks = [int(sheet) for sheet in sheets]
+        datos_hojas = self.__extrae_hojas_lerma(contenido, sheets, max_workers)
 
-        sheets = self.__filtrar_valores_numericos(wb.sheetnames)
         clean_dfs = []
-        processed_weeks = []
-
         for sheet in sheets:
-            if int(sheet) in previous_processed_weeks:
+            df_datos = datos_hojas[sheet]
+            if df_datos is None: # Si no se encontró ni 'Área' ni 'Equipo' le decimos al usuario
+                print(f'No se identificó el inicio de las filas con datos en la hoja {sheet}')
                 continue
-            processed_weeks.append(int(sheet))
-            ws = wb[sheet]
             # Creamos la fecha a partir del nombre de la hoja
-            # En este caso se extrae del nombre de la hoja
             fecha = self.__obtener_primer_dia_semana(int(sheet), datetime.datetime.now().year)
             fecha_formateada = fecha.strftime('%d/%m/%Y')
             year = fecha.year
             semana = int(sheet)
 
-            # Primero encontramos en qué fila están los nombres de las columnas
-            list_cols = self.__find_value(ws, col=1, text='Área') # Se supone que ahí esté eso, pero ya se les ocurrió cambiarlo
-            if len(list_cols) == 0: # Si no encontró 'Área', entonces buscamos 'Equipo'
-                list_cols = self.__find_value(ws, col=1, text='Equipo')
-            if len(list_cols) == 0: # Si ninguno se encontró entonces ya al chile no hay nada y le decimos al usuario
-                print(f'No se identificó el inicio de las filas con datos en la hoja {sheet}')
-                continue
-            row_cols = list_cols[0]
-            
-            # Encontramos los nombres de las columnas
-            dict_cols = self.__obtener_columnas_en_fila(ws, row_cols, 10)
-            
-            # Encontramos la última fila con datos
-            # Dado que tienen un desmadre de filas ocultas tenemos que considerar un número exagerado de consecutive nones
-            last_row = self.__find_last_data_row(ws, dict_cols['Equipo'], 100, row_cols)
-
-
-            # Tercero, extraemos los valores de las columnas correspondientes
-            # Las columnas que queremos son las siguientes: Clave, Programado por semana y Producido
-            cols_to_extract = ['Clave', 'Descripción', 'Programado por \nsemana', 'Producido']
-            output_column_names = ['sku', 'descripcion', 'planeado', 'producido']
-            df_datos = self.__extrae_datos_columnas(
-                working_sheet=ws, 
-                starting_row=row_cols+1, 
-                dict_cols=dict_cols, 
-                cols_to_extract=cols_to_extract, 
-                output_columns=output_column_names
-            )
-
             # Limpiamos los datos
             clean_df_sheet = self.__clean_data_frame(df_datos, fecha_formateada, year, semana)
             clean_dfs.append(clean_df_sheet) # Aquí están todas las semanas extraídas
@@ -595,13 +538,7 @@ class FileCleaner:
         Esta función regresa la última fecha actualizada de las diferentes cosas en un diccionario.
         El ususario puede tomar el que necesite.
         """
-        datos = self.__open_qlik_file()
-
-        fechas = (datos
-         .assign(inicio_semana_real=lambda x: pd.to_datetime(x.inicio_semana_real, dayfirst=True))
-         .groupby(['planta', 'tipo'])
-         .agg(last_update=pd.NamedAgg('inicio_semana_real', 'max'))
-        )
+        fechas = get_qlik_dataset(self.qlik_file_location).get_last_update_dates()
 
         dict_aux = (fechas
          .assign(last_update=lambda x: x.last_update.dt.strftime('%d-%m-%Y'))
@@ -629,9 +566,20 @@ class FileCleaner:
             El resultado será el porcentaje de cumplimiento en la semana correspondiente a las fechas
             14-agosto, 15-agosto, 16-agosto, 17-agosto, 18-agosto (porque el 13 es domingo, el 19 es sábado y el 20 de agosto no está incluido)
         '''
-        datos_filtrados = self.filtra_datos_intervalo(inicio=inicio, fin=fin)
-        # Ahora econtramos el porcentaje de cumplimiento en ese intervalo
-        return datos_filtrados.terminado.mean()
+        inicio = pd.to_datetime(inicio.strftime('%m/%d/%Y'))
+        fin= pd.to_datetime(fin.strftime('%m/%d/%Y'))
+        # El dataset ya tiene el cumplimiento acumulado por semana, no hace falta filtrar los datos
+        return get_qlik_dataset(self.qlik_file_location).cumplimiento_en_intervalo(inicio, fin)
+
+    def get_cumplimiento_por_semana(self, inicio:pd.Timestamp, fin:pd.Timestamp) -> pd.DataFrame:
+        '''
+        Esta función recibe dos timestamps (domingos, el fin no se incluye) y regresa el cumplimiento de cada semana
+        del intervalo. El índice es el inicio de la semana, la columna completado es el cumplimiento total y hay
+        una columna por cada tipo de producto.
+        '''
+        inicio = pd.to_datetime(inicio.strftime('%m/%d/%Y'))
+        fin= pd.to_datetime(fin.strftime('%m/%d/%Y'))
+        return get_qlik_dataset(self.qlik_file_location).cumplimiento_por_semana(inicio, fin)
     
     def get_total_products_on_interval(self, inicio:pd.Timestamp, fin:pd.Timestamp) -> (int, int, int):
         '''
@@ -639,7 +587,6 @@ class FileCleaner:
         '''
         datos_filtrados = self.filtra_datos_intervalo(inicio=inicio, fin=fin)
         datos_agregados = (datos_filtrados
-         .assign(sku=lambda df: df.sku.apply(self.__limpia_cadena))
          .groupby(['sku', 'familia'])
          .agg(total=pd.NamedAgg('tipo', 'count'))
          .reset_index()
@@ -655,17 +602,10 @@ class FileCleaner:
         Función que recibe dos timestamps y filtra los datos correspondientes.
         Regresa un dataframe
         '''
-        datos = self.__open_qlik_file()
-        
         inicio = pd.to_datetime(inicio.strftime('%m/%d/%Y'))
         fin= pd.to_datetime(fin.strftime('%m/%d/%Y'))
-        datos = (datos
-                 .assign(inicio_semana_real=lambda x: pd.to_datetime(x.inicio_semana_real, dayfirst=True))
-                 .pipe(lambda df: df.loc[df.inicio_semana_real >= inicio])
-                 .pipe(lambda df: df.loc[df.inicio_semana_real < fin])
-                )
-        
-        return datos
+        # Los datos ya están en memoria y con las fechas convertidas
+        return get_qlik_dataset(self.qlik_file_location).filtra_intervalo(inicio, fin)
     
     def get_products_on_interval(self, inicio:pd.Timestamp, fin:pd.Timestamp, dates_are_sundays=True) -> pd.DataFrame:
         '''
@@ -682,7 +622,6 @@ class FileCleaner:
         grouping_columns = ['sku', 'descripcion', 'marca', 'familia', 'planta']
         datos_filtrados = self.filtra_datos_intervalo(inicio=inicio, fin=fin)
         datos_filtrados = (datos_filtrados
-         .assign(sku=lambda df: df.sku.apply(self.__limpia_cadena))
          .groupby(grouping_columns)
          .agg(
              planeado=pd.NamedAgg('planeado', 'sum'),
@@ -757,7 +696,13 @@ class FileCleaner:
             'producido',
             'porcentaje'
         ]
-        return datos.query('sku == @sku').reset_index(drop=True)[orden_output].sort_values(['anio', 'semana'])
+        return (datos
+         .query('sku == @sku')
+         .reset_index(drop=True)
+         [orden_output]
+         .sort_values(['anio', 'semana'])
+         .assign(inicio_semana_real=lambda df: df.inicio_semana_real.dt.strftime('%d/%m/%Y'))
+        )
         
 
 if __name__ == '__main__':
@@ -0,0 +1,133 @@
+import io
+import threading
+import multiprocessing
+import numpy as np
+import pandas as pd
+import openpyxl as xl
+from concurrent.futures import ProcessPoolExecutor
+
+# Columnas que se extraen de cada hoja de lerma y el nombre que llevan en el DataFrame
+COLUMNAS_LERMA = ['Clave', 'Descripción', 'Programado por \nsemana', 'Producido']
+NOMBRES_COLUMNAS = ['sku', 'descripcion', 'planeado', 'producido']
+FILAS_A_EXTRAER = 100
+# Máximo de procesos para extraer hojas de lerma
+MAXIMO_PROCESOS = 4
+# Pools de procesos de este proceso, uno por número de workers. Se comparten entre todas las
+# sesiones de streamlit para no levantar procesos nuevos en cada carga.
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+class _FilasHoja:
+    '''
+    Lee las filas de una hoja (en modo de solo lectura) conforme se van pidiendo.
+    Cada fila se lee una sola vez y la hoja nunca se recorre más allá de la última fila pedida.
+    '''
+    def __init__(self, hoja) -> None:
+        self.filas = []
+        self.iterador = hoja.iter_rows(values_only=True)
+
+    def valores(self, numero_fila:int) -> tuple:
+        while len(self.filas) < numero_fila and self.iterador is not None:
+            try:
+                self.filas.append(next(self.iterador))
+            except StopIteration:
+                self.iterador = None
+        if numero_fila <= len(self.filas):
+            return self.filas[numero_fila - 1]
+        return ()
+
+    def valor(self, numero_fila:int, columna:int):
+        valores = self.valores(numero_fila)
+        return valores[columna - 1] if columna <= len(valores) else None
+
+def _busca_valor(filas:_FilasHoja, col:int, text:str, initial_row:int=1, max_consecutive_nones:int=10) -> list:
+    '''
+    Regresa las filas de la columna col donde está text. Se deja de buscar después de
+    max_consecutive_nones celdas vacías seguidas.
+    '''
+    found_cells = []
+    row = initial_row
+    consecutive_nones = 0
+    while consecutive_nones < max_consecutive_nones:
+        value = filas.valor(row, col)
+        if value == text:
+            found_cells.append(row)
+        elif value is None:
+            consecutive_nones += 1
+        else:
+            consecutive_nones = 0
+        row += 1
+    return found_cells
+
+def _columnas_en_fila(valores_fila:tuple, num_nones_consecutivos:int) -> dict:
+    diccionario_columnas = {}
+    nones_consecutivos = 0
+    for columna, valor_celda in enumerate(valores_fila, start=1):
+        if valor_celda is not None:
+            diccionario_columnas[valor_celda] = columna
+            nones_consecutivos = 0
+        else:
+            nones_consecutivos += 1
+            if nones_consecutivos >= num_nones_consecutivos:
+                break
+    return diccionario_columnas
+
+def extrae_hoja_lerma(hoja) -> pd.DataFrame:
+    '''
+    Extrae los datos crudos de una hoja semanal de lerma.
+    Regresa None si no se encuentra la fila con los nombres de las columnas.
+    '''
+    filas = _FilasHoja(hoja)
+
+    # Primero encontramos en qué fila están los nombres de las columnas
+    list_cols = _busca_valor(filas, col=1, text='Área') # Se supone que ahí esté eso, pero ya se les ocurrió cambiarlo
+    if len(list_cols) == 0: # Si no encontró 'Área', entonces buscamos 'Equipo'
+        list_cols = _busca_valor(filas, col=1, text='Equipo')
+    if len(list_cols) == 0:
+        return None
+    row_cols = list_cols[0]
+
+    # Encontramos los nombres de las columnas y extraemos las filas que siguen
+    dict_cols = _columnas_en_fila(filas.valores(row_cols), 10)
+    listas_datos = [
+        [filas.valor(row, dict_cols[col_name]) for row in range(row_cols + 1, row_cols + 1 + FILAS_A_EXTRAER)]
+        for col_name in COLUMNAS_LERMA
+    ]
+    df = pd.DataFrame(np.array(listas_datos).transpose(), columns=NOMBRES_COLUMNAS)
+    df.dropna(how='all', inplace=True)
+    return df
+
+def extrae_hojas_lerma(contenido:bytes, hojas:list) -> list:
+    '''
+    Abre el libro (en modo de solo lectura) y extrae las hojas dadas.
+    Se ejecuta dentro de los procesos del pool, por eso recibe los bytes del archivo.
+    Regresa una lista de tuplas (hoja, datos)
+    '''
+    wb = xl.load_workbook(io.BytesIO(contenido), data_only=True, read_only=True)
+    try:
+        resultados = []
+        for hoja in hojas:
+            ws = wb[hoja]
+            # Las dimensiones guardadas en el archivo no siempre son correctas
+            ws.reset_dimensions()
+            resultados.append((hoja, extrae_hoja_lerma(ws)))
+        return resultados
+    finally:
+        wb.close()
+
+def get_pool(workers:int) -> ProcessPoolExecutor:
+    '''
+    Regresa el pool de procesos con workers procesos. Los procesos se crean con spawn y no con
+    fork, porque el servidor de streamlit tiene varios hilos y hacer fork de un proceso con
+    hilos puede dejar locks tomados en el proceso hijo.
+    '''
+    with _POOLS_LOCK:
+        if workers not in _POOLS:
+            _POOLS[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _POOLS[workers]
+
+def descarta_pool(workers:int):
+    with _POOLS_LOCK:
+        pool = _POOLS.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,390 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scripts.sku_normalizer import normaliza_skus
+
+# Datasets que ya se cargaron en este proceso. La llave es la ubicación del archivo.
+_DATASETS = {}
+_DATASETS_LOCK = threading.Lock()
+
+COLUMNAS_QLIK = ['sku', 'planeado', 'producido', 'tipo', 'planta', 'inicio_semana',
+        'inicio_semana_real', 'semana', 'anio', 'porcentaje', 'completado',
+        'superado', 'inferior', 'terminado', 'estatus', 'familia', 'marca',
+        'descripcion']
+# Número de filas por row group del parquet. Cada row group guarda el mínimo y el máximo
+# de inicio_semana_real, así que al leer un intervalo se saltan los que no lo tocan.
+ROW_GROUP_SIZE = 10_000
+# Cada carga reemplaza semanas completas de una planta y un tipo
+LLAVE_SEMANA = ['planta', 'tipo', 'anio', 'semana']
+
+def convierte_fechas(fechas:pd.Series) -> pd.Series:
+    '''
+    Convierte la columna inicio_semana_real a fecha. Acepta tanto el formato de texto
+    que se usaba antes (dd/mm/YYYY) como fechas nativas.
+    '''
+    if pd.api.types.is_datetime64_any_dtype(fechas):
+        return fechas.astype('datetime64[ns]')
+    return pd.to_datetime(fechas, dayfirst=True).astype('datetime64[ns]')
+
+def lee_csv_con_cache(file_location:str) -> pd.DataFrame:
+    '''
+    Lee un csv de datos de qlik a través de un caché columnar (Arrow IPC) que se guarda junto al csv.
+    El caché ya tiene inicio_semana_real como fecha y los skus limpios y como texto, así que no hay
+    que volver a leer y convertir el texto del csv. En los metadatos del caché se guarda la fecha de
+    modificación y el tamaño del csv; si el csv cambió se vuelve a generar.
+    '''
+    stat = os.stat(file_location)
+    firma = f'{stat.st_mtime_ns}-{stat.st_size}'.encode()
+    cache_location = f'{os.path.dirname(file_location)}/.{os.path.basename(file_location)}.arrow'
+
+    if os.path.isfile(cache_location):
+        # to_pandas copia los datos, así que el archivo se puede cerrar al terminar de leerlo
+        with pa.memory_map(cache_location) as fuente:
+            lector = pa.ipc.open_file(fuente)
+            if (lector.schema.metadata or {}).get(b'qlik_csv_firma') == firma:
+                return lector.read_all().to_pandas()
+
+    datos = pd.read_csv(file_location, dtype={'sku':str})
+    datos = datos.assign(
+        sku=normaliza_skus(datos.sku).where(datos.sku.notna()),
+        inicio_semana_real=convierte_fechas(datos.inicio_semana_real)
+    )
+    tabla = pa.Table.from_pandas(datos, preserve_index=False)
+    tabla = tabla.replace_schema_metadata({**(tabla.schema.metadata or {}), b'qlik_csv_firma': firma})
+    tmp_location = f'{cache_location}.tmp'
+    with pa.OSFile(tmp_location, 'wb') as sink:
+        with pa.ipc.new_file(sink, tabla.schema) as writer:
+            writer.write_table(tabla)
+    os.replace(tmp_location, cache_location)
+    return tabla.to_pandas()
+
+def _tabla_a_frame(tabla:pa.Table) -> pd.DataFrame:
+    datos = tabla.to_pandas(date_as_object=False)
+    return datos.assign(inicio_semana_real=convierte_fechas(datos.inicio_semana_real))
+
+
+class QlikDataset:
+    '''
+    Esta clase lee el archivo de datos para qlik y lo mantiene en memoria.
+    La columna inicio_semana_real se guarda en el parquet como fecha nativa (date32) y el
+    archivo está ordenado por ella, así que los datos en memoria también quedan ordenados y
+    un intervalo se encuentra con una búsqueda binaria.
+
+    Los datos completos solo se leen la primera vez que alguien los necesita. Mientras eso
+    no pase, los intervalos se leen del parquet con el filtro de fechas, de forma que el
+    lector se salta los row groups que no tocan el intervalo.
+    Si el archivo cambia en disco (fecha de modificación o tamaño) los datos se vuelven a leer.
+
+    El cumplimiento (promedio de terminado) se guarda por semana y por tipo junto con sus sumas
+    acumuladas, así que el cumplimiento de cualquier intervalo sale de restar dos filas.
+    '''
+    def __init__(self, file_location:str) -> None:
+        '''
+        file_location: ubicación del archivo (csv o parquet)
+        '''
+        self.file_location = file_location
+        self.tipo_de_archivo = file_location.split('.')[-1]
+        self.signature = self.__file_signature(file_location)
+        self.fecha_nativa = self.__tiene_fecha_nativa()
+        self.lock = threading.Lock()
+        self.__datos = None
+        self.fechas = None
+        # El último intervalo leído directo del parquet: (inicio, fin, datos)
+        self.intervalo = None
+        self.__cumplimiento = None
+
+    @staticmethod
+    def __file_signature(file_location:str) -> tuple:
+        if not os.path.isfile(file_location):
+            return None
+        stat = os.stat(file_location)
+        return stat.st_mtime_ns, stat.st_size
+
+    def __tiene_fecha_nativa(self) -> bool:
+        '''
+        Regresa True si el archivo es un parquet con inicio_semana_real como fecha.
+        Los archivos anteriores la guardaban como texto y esos se tienen que leer completos.
+        '''
+        if self.signature is None or self.tipo_de_archivo != 'parquet':
+            return False
+        schema = pq.read_schema(self.file_location)
+        return 'inicio_semana_real' in schema.names and pa.types.is_date(schema.field('inicio_semana_real').type)
+
+    def __read(self) -> pd.DataFrame:
+        if self.signature is None:
+            # Si el archivo no existe se usa uno vacío para que no truene el resto de cosas
+            return pd.DataFrame(columns=COLUMNAS_QLIK).assign(inicio_semana_real=lambda x: pd.to_datetime(x.inicio_semana_real))
+        if self.tipo_de_archivo == "csv":
+            return lee_csv_con_cache(self.file_location)
+        return _tabla_a_frame(pq.read_table(self.file_location))
+
+    @property
+    def datos(self) -> pd.DataFrame:
+        '''
+        Todos los datos, ordenados por inicio_semana_real.
+        '''
+        if self.__datos is None:
+            with self.lock:
+                if self.__datos is None:
+                    datos = self.__read().sort_values('inicio_semana_real', kind='stable').reset_index(drop=True)
+                    self.fechas = datos.inicio_semana_real.to_numpy()
+                    self.__datos = datos
+        return self.__datos
+
+    def is_current(self) -> bool:
+        '''
+        Regresa True si el archivo no ha cambiado desde que se cargó
+        '''
+        return self.signature == self.__file_signature(self.file_location)
+
+    def filtra_intervalo(self, inicio:pd.Timestamp, fin:pd.Timestamp) -> pd.DataFrame:
+        '''
+        Regresa las filas con inicio <= inicio_semana_real < fin.
+        '''
+        if self.__datos is None and self.fecha_nativa:
+            intervalo = self.intervalo
+            if intervalo is None or intervalo[:2] != (inicio, fin):
+                tabla = pq.read_table(self.file_location, filters=[
+                    ('inicio_semana_real', '>=', inicio.date()),
+                    ('inicio_semana_real', '<', fin.date())
+                ])
+                intervalo = (inicio, fin, _tabla_a_frame(tabla))
+                self.intervalo = intervalo
+            return intervalo[2].copy()
+
+        datos = self.datos
+        inicio_pos = np.searchsorted(self.fechas, inicio.to_datetime64(), side='left')
+        fin_pos = np.searchsorted(self.fechas, fin.to_datetime64(), side='left')
+        return datos.iloc[inicio_pos:fin_pos].copy()
+
+    def __lee_columnas(self, columnas:list) -> pd.DataFrame:
+        '''
+        Regresa solo las columnas dadas. Si los datos no están en memoria se leen solo esas columnas del parquet.
+        '''
+        if self.__datos is None and self.fecha_nativa:
+            return _tabla_a_frame(pq.read_table(self.file_location, columns=columnas))
+        return self.datos[columnas]
+
+    def __get_cumplimiento(self) -> tuple:
+        '''
+        Regresa (semanas, tipos, terminados, productos, terminados_acumulados, productos_acumulados).
+        terminados y productos son matrices de semanas x tipos con el número de productos terminados y el total
+        de productos; las acumuladas tienen una fila de ceros al inicio. Se calcula una sola vez por versión del archivo.
+        '''
+        if self.__cumplimiento is None:
+            conteos = (self.__lee_columnas(['tipo', 'inicio_semana_real', 'terminado'])
+             .dropna(subset=['inicio_semana_real', 'terminado'])
+             .groupby(['inicio_semana_real', 'tipo'])
+             .terminado
+             .agg(['sum', 'count'])
+             .unstack('tipo', fill_value=0)
+             .sort_index()
+            )
+            terminados = conteos['sum'].to_numpy(dtype='float64')
+            productos = conteos['count'].to_numpy(dtype='float64')
+            ceros = np.zeros((1, productos.shape[1]))
+            self.__cumplimiento = (
+                conteos.index.to_numpy(dtype='datetime64[ns]'),
+                list(conteos['count'].columns),
+                terminados,
+                productos,
+                np.vstack([ceros, terminados.cumsum(axis=0)]),
+                np.vstack([ceros, productos.cumsum(axis=0)])
+            )
+        return self.__cumplimiento
+
+    def cumplimiento_en_intervalo(self, inicio:pd.Timestamp, fin:pd.Timestamp) -> float:
+        '''
+        Regresa el promedio de terminado de las filas con inicio <= inicio_semana_real < fin.
+        Si no hay filas regresa NaN.
+        '''
+        semanas, _, _, _, terminados, productos = self.__get_cumplimiento()
+        inicio_pos, fin_pos = np.searchsorted(semanas, [inicio.to_datetime64(), fin.to_datetime64()], side='left')
+        total = productos[fin_pos].sum() - productos[inicio_pos].sum()
+        if total == 0:
+            return np.nan
+        return (terminados[fin_pos].sum() - terminados[inicio_pos].sum()) / total
+
+    def cumplimiento_por_semana(self, inicio:pd.Timestamp, fin:pd.Timestamp) -> pd.DataFrame:
+        '''
+        Regresa el cumplimiento de cada semana con inicio <= inicio_semana_real < fin.
+        El índice es inicio_semana_real; la columna completado es el cumplimiento de la semana
+        y hay una columna más por cada tipo (NaN si ese tipo no tuvo productos esa semana).
+        '''
+        semanas, tipos, terminados, productos, _, _ = self.__get_cumplimiento()
+        inicio_pos, fin_pos = np.searchsorted(semanas, [inicio.to_datetime64(), fin.to_datetime64()], side='left')
+        terminados = terminados[inicio_pos:fin_pos]
+        productos = productos[inicio_pos:fin_pos]
+        with np.errstate(invalid='ignore'):
+            cumplimiento = pd.DataFrame(
+                terminados / productos,
+                index=pd.Index(semanas[inicio_pos:fin_pos], name='inicio_semana_real'),
+                columns=tipos
+            )
+        cumplimiento.insert(0, 'completado', terminados.sum(axis=1) / productos.sum(axis=1))
+        return cumplimiento
+
+    def get_last_update_dates(self) -> pd.DataFrame:
+        '''
+        Regresa la última fecha de inicio de semana de cada planta y tipo.
+        Si los datos no están en memoria solo se leen las tres columnas necesarias.
+        '''
+        return (self.__lee_columnas(['planta', 'tipo', 'inicio_semana_real'])
+         .groupby(['planta', 'tipo'])
+         .agg(last_update=pd.NamedAgg('inicio_semana_real', 'max'))
+        )
+
+
+def get_qlik_dataset(file_location:str) -> QlikDataset:
+    '''
+    Regresa los datos de qlik de este proceso. Solo se vuelven a leer si el archivo cambió.
+    '''
+    with _DATASETS_LOCK:
+        dataset = _DATASETS.get(file_location)
+        if dataset is None or not dataset.is_current():
+            dataset = QlikDataset(file_location)
+            _DATASETS[file_location] = dataset
+        return dataset
+
+def invalida_qlik_dataset(file_location:str):
+    '''
+    Olvida los datos cargados. Se usa cuando se termina de escribir el archivo.
+    '''
+    with _DATASETS_LOCK:
+        _DATASETS.pop(file_location, None)
+
+def _ordena_por_fecha(datos:pd.DataFrame) -> pd.DataFrame:
+    return (datos
+     .assign(inicio_semana_real=convierte_fechas(datos.inicio_semana_real))
+     .sort_values('inicio_semana_real', kind='stable')
+     .reset_index(drop=True)
+    )
+
+def _a_tabla(datos:pd.DataFrame) -> pa.Table:
+    '''
+    Convierte los datos a una tabla de Arrow con inicio_semana_real como date32
+    '''
+    tabla = pa.Table.from_pandas(datos, preserve_index=False)
+    posicion = tabla.schema.get_field_index('inicio_semana_real')
+    return tabla.set_column(posicion, 'inicio_semana_real', tabla.column(posicion).cast(pa.date32()))
+
+def _tmp_location(file_location:str) -> str:
+    return f'{os.path.dirname(file_location)}/.{os.path.basename(file_location)}.tmp'
+
+def guarda_datos_qlik(datos:pd.DataFrame, file_location:str):
+    '''
+    Guarda los datos de qlik ordenados por inicio_semana_real.
+    En parquet la fecha se guarda como date32 en row groups de ROW_GROUP_SIZE filas y el archivo
+    se reemplaza de forma atómica. En csv se sigue guardando como texto dd/mm/YYYY.
+    '''
+    datos = _ordena_por_fecha(datos)
+    if file_location.split('.')[-1] == 'csv':
+        datos.assign(inicio_semana_real=datos.inicio_semana_real.dt.strftime('%d/%m/%Y')).to_csv(file_location, index=False)
+    else:
+        tmp_location = _tmp_location(file_location)
+        pq.write_table(_a_tabla(datos), tmp_location, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_location, file_location)
+    invalida_qlik_dataset(file_location)
+
+def _mismas_filas(anteriores:pd.DataFrame, nuevos:pd.DataFrame) -> bool:
+    '''
+    Regresa True si las filas anteriores y las nuevas tienen exactamente los mismos valores
+    '''
+    if len(anteriores) != len(nuevos) or set(anteriores.columns) != set(nuevos.columns):
+        return False
+    ordena = lambda df: df.sort_values(LLAVE_SEMANA + ['sku']).reset_index(drop=True)[anteriores.columns].astype(object)
+    return ordena(anteriores).equals(ordena(nuevos))
+
+def _rango_row_groups(archivo:pq.ParquetFile, inicio, fin) -> (int, int):
+    '''
+    Regresa el rango [primero, ultimo) de los row groups cuyas fechas tocan el intervalo [inicio, fin].
+    Como el archivo está ordenado por inicio_semana_real, esos row groups son contiguos.
+    Si ninguno lo toca, el rango está vacío y queda donde irían las fechas; si el row group anterior
+    no está lleno se incluye para que los datos nuevos se junten con él y no quede uno pequeño más.
+    Los row groups sin estadísticas se consideran dentro del intervalo.
+    '''
+    posicion = archivo.schema_arrow.get_field_index('inicio_semana_real')
+    tocan, antes = [], 0
+    for i in range(archivo.num_row_groups):
+        estadisticas = archivo.metadata.row_group(i).column(posicion).statistics
+        if estadisticas is None or not estadisticas.has_min_max or (estadisticas.max >= inicio and estadisticas.min <= fin):
+            tocan.append(i)
+        elif estadisticas.max < inicio:
+            antes = i + 1
+    if len(tocan) > 0:
+        return tocan[0], tocan[-1] + 1
+    if antes > 0 and archivo.metadata.row_group(antes - 1).num_rows < ROW_GROUP_SIZE:
+        return antes - 1, antes
+    return antes, antes
+
+def _reemplaza_filas(previas:pd.DataFrame, datos:pd.DataFrame) -> pd.DataFrame:
+    '''
+    Regresa previas con las semanas de datos reemplazadas por datos, ordenado por inicio_semana_real.
+    Regresa None si esas semanas ya tenían exactamente las filas de datos.
+    '''
+    reemplazadas = pd.MultiIndex.from_frame(previas[LLAVE_SEMANA]).isin(pd.MultiIndex.from_frame(datos[LLAVE_SEMANA]))
+    if _mismas_filas(previas.loc[reemplazadas], datos):
+        return None
+    conservadas = previas.loc[~reemplazadas]
+    return _ordena_por_fecha(pd.concat([conservadas, datos], ignore_index=True) if len(conservadas) > 0 else datos)
+
+def _reemplaza_en_row_groups(datos:pd.DataFrame, file_location:str):
+    '''
+    Reemplaza las semanas de datos leyendo solo los row groups cuyas fechas tocan las de datos.
+    Los demás row groups se copian como tablas de Arrow, sin convertirlos a pandas.
+    Regresa True si se escribió, False si no había cambios y None si no se puede hacer así
+    porque las columnas o sus tipos no coinciden con las del archivo.
+    '''
+    with pq.ParquetFile(file_location) as archivo:
+        schema = archivo.schema_arrow
+        if set(schema.names) != set(datos.columns):
+            return None
+        primero, ultimo = _rango_row_groups(archivo, datos.inicio_semana_real.min().date(), datos.inicio_semana_real.max().date())
+        filas = _reemplaza_filas(_tabla_a_frame(archivo.read_row_groups(range(primero, ultimo))), datos)
+        if filas is None:
+            return False
+        try:
+            tabla = _a_tabla(filas).select(schema.names).cast(schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            return None
+
+        tmp_location = _tmp_location(file_location)
+        with pq.ParquetWriter(tmp_location, schema) as writer:
+            for i in range(primero):
+                writer.write_table(archivo.read_row_group(i))
+            writer.write_table(tabla, row_group_size=ROW_GROUP_SIZE)
+            for i in range(ultimo, archivo.num_row_groups):
+                writer.write_table(archivo.read_row_group(i))
+    os.replace(tmp_location, file_location)
+    invalida_qlik_dataset(file_location)
+    return True
+
+def reemplaza_semanas_qlik(datos:pd.DataFrame, file_location:str) -> bool:
+    '''
+    Reemplaza en el archivo de qlik las semanas (LLAVE_SEMANA: planta, tipo, año y semana) que vienen
+    en datos por las filas de datos. Las filas de otras semanas no cambian.
+    Regresa False si esas semanas ya tenían exactamente esas filas; en ese caso no se escribe nada.
+
+    El archivo para qlik es un solo parquet y no se puede modificar en su lugar, así que siempre
+    se escribe completo. Pero como está ordenado por inicio_semana_real, solo se leen a pandas y se
+    comparan los row groups cuyas fechas tocan las de datos; los demás se copian tal cual.
+    Se supone que todas las filas de una semana tienen el mismo inicio_semana_real, como las
+    guarda FileCleaner.
+    Si el archivo no existe, es csv, guarda la fecha como texto o sus columnas no coinciden con
+    las de datos, se lee completo y se guarda con guarda_datos_qlik.
+    '''
+    datos = datos.assign(inicio_semana_real=convierte_fechas(datos.inicio_semana_real))
+    dataset = get_qlik_dataset(file_location)
+    if dataset.fecha_nativa:
+        escrito = _reemplaza_en_row_groups(datos, file_location)
+        if escrito is not None:
+            return escrito
+
+    filas = _reemplaza_filas(dataset.datos, datos)
+    if filas is None:
+        return False
+    guarda_datos_qlik(filas, file_location)
+    return True
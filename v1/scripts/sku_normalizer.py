@@ -0,0 +1,41 @@
+import re
+import threading
+import pandas as pd
+
+# Tabla de skus ya normalizados en este proceso: sku como texto -> sku limpio
+_MEMO = {}
+_MEMO_LOCK = threading.Lock()
+# Lo que int() aceptaría, para hacer la misma conversión que se hacía antes
+_PATRON_ENTERO = re.compile(r'\s*[+-]?\d+(?:_\d+)*\s*')
+
+def _normaliza_unicos(skus:pd.Series) -> pd.Series:
+    '''
+    Limpia skus (como texto y sin repetir) con operaciones vectorizadas:
+    quita tabulaciones, espacios al final, acentos sueltos (´), los sufijos .123 y -123
+    y el prefijo ANSA. Si lo que queda es un número se quitan los ceros a la izquierda.
+    '''
+    limpios = (skus
+     .str.replace('\t', '', regex=False)
+     .str.rstrip()
+     .str.replace('´', '', regex=False)
+     .str.replace(r'\.\d+', '', regex=True)
+     .str.replace(r'-\d+', '', regex=True)
+     .str.replace(r'^ANSA', '', regex=True)
+    )
+    son_enteros = limpios.str.fullmatch(_PATRON_ENTERO)
+    limpios.loc[son_enteros] = limpios.loc[son_enteros].map(lambda sku: str(int(sku)))
+    return limpios
+
+def normaliza_skus(skus:pd.Series) -> pd.Series:
+    '''
+    Regresa los skus limpios. Cada valor distinto se limpia una sola vez por proceso,
+    los que ya se habían visto se toman de la tabla de memo.
+    '''
+    skus = skus.astype(str)
+    unicos = pd.Series(skus.unique(), dtype=object)
+    nuevos = unicos.loc[[sku not in _MEMO for sku in unicos]]
+    if nuevos.size > 0:
+        limpios = _normaliza_unicos(nuevos)
+        with _MEMO_LOCK:
+            _MEMO.update(zip(nuevos, limpios))
+    return skus.map(_MEMO)
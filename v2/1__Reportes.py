@@ -1,8 +1,8 @@
 import streamlit as st
 import pandas as pd
-import os
 from scripts.data_processor import DataProcessor
 from scripts.excel_functions import ExcelFunctions
+from scripts.tracing import panel_trazas
 
 def download_button(data, file_name, label:str='📥 Descargar Datos'):
     if data is not None:
@@ -33,21 +33,31 @@ def add_description_to_page():
 
 def display_filtering_controls(data_processor:DataProcessor):
     # Permitimos al usuario elegir lo que usará de filtro
-    valores = data_processor.get_available_values()
+    # Para los productos son demasiadas opciones, así que primero se buscan por sku o descripción
+    if data_processor.filtro == 'sku':
+        busqueda = st.sidebar.text_input('Busca el producto (sku o descripción)')
+        valores = data_processor.search_available_values(busqueda)
+    else:
+        valores = data_processor.get_available_values()
+    if len(valores) == 0:
+        st.info('No hay valores que coincidan con la búsqueda')
+        st.stop()
     chosen_value = st.sidebar.selectbox("Elige la familia", options=valores)
     if data_processor.filtro == 'sku': chosen_value = chosen_value.split('-')[0].strip()
 
     # Ahora filtramos los datos de esa familia
-    if not chosen_value: return
+    if not chosen_value: st.stop()
     data_processor.set_filter_value(filter_value=chosen_value)
 
     # Ahora le permitimos elegir el rango de fechas que quiere filtrar
     available_dates = data_processor.get_available_dates()
     chosen_dates = st.sidebar.date_input('Elige el rango de fechas', value=available_dates, min_value=available_dates[0], max_value=available_dates[1])
-    if len(chosen_dates) != 2: return
+    # Mientras el usuario elige la segunda fecha el rango viene incompleto
+    if len(chosen_dates) != 2: st.stop()
     data_processor.set_date_range(*chosen_dates)
     if not data_processor.fully_instanciated_processor: 
         st.warning("El rango de fechas no es suficientemente amplio para mostrar información")
+        st.stop()
 
     return chosen_value, chosen_dates
 
@@ -85,12 +95,29 @@ def display_kpis(kpis:dict, col_kpis, sku:bool=False):
             kpi_9.metric(label='Programado', value=kpis['worst_product'][worst_product]['programado'])
             kpi_10.metric(label='Fabricado', value=kpis['worst_product'][worst_product]['fabricado'])
 
-def display_data_col(df:pd.DataFrame, col_datos, file_name:str, sheet_name:str):
+@st.cache_data(max_entries=64, show_spinner=False)
+def genera_excel(filtro:str, filter_value:str, date_range:tuple, data_version:int, sheet_name:str, _df:pd.DataFrame) -> bytes:
+    """
+    Genera los bytes del excel del reporte. El resultado se guarda en caché por filtro, rango de fechas
+    y versión de los datos, así que _df (que no se usa como llave) siempre corresponde a esos valores.
+    """
+    return ExcelFunctions().excel_file_as_bytes(_df, sheet_name=sheet_name)
+
+def display_data_col(data_processor:DataProcessor, col_datos, file_name:str, sheet_name:str):
+    df = data_processor.filtered_data.assign(fecha=lambda x: x.fecha.dt.strftime('%Y-%m-%d'))
     with col_datos:
-        downloadable = ExcelFunctions().save_and_download_excel_file(df.assign(fecha=lambda x: x.fecha.dt.strftime('%Y-%m-%d')), 'data/', file_name, sheet_name)
-        os.remove(f'data/{file_name}.xlsx')
-        download_button(*downloadable)
-        st.dataframe(df.assign(fecha=lambda x: x.fecha.dt.strftime('%Y-%m-%d')), use_container_width=True, hide_index=True)
+        # El excel solo se genera cuando el usuario lo pide
+        if st.button('Generar excel'):
+            data = genera_excel(
+                data_processor.filtro,
+                data_processor.filter_value,
+                data_processor.date_range,
+                data_processor.store.version,
+                sheet_name,
+                df
+            )
+            download_button(data, f'{file_name}.xlsx')
+        st.dataframe(df, use_container_width=True, hide_index=True)
     
 
 def filtro_familia(data_processor:DataProcessor):
@@ -103,7 +130,7 @@ def filtro_familia(data_processor:DataProcessor):
     st.title('KPIS FAMILIAS')
     col_kpis, col_datos = st.columns((.4, .6))
     display_kpis(kpis, col_kpis)
-    display_data_col(data_processor.filtered_data, col_datos, f'reporte_familia_{chosen_family.lower()}', 'reporte de familia')
+    display_data_col(data_processor, col_datos, f'reporte_familia_{chosen_family.lower()}', 'reporte de familia')
 
  
 def filtro_marca(data_processor:DataProcessor):
@@ -115,7 +142,7 @@ def filtro_marca(data_processor:DataProcessor):
     st.title('KPIS MARCAS')
     col_kpis, col_datos = st.columns((.4, .6))
     display_kpis(kpis, col_kpis)
-    display_data_col(data_processor.filtered_data, col_datos, f'reporte_familia_{chosen_brand.lower()}', 'reporte de marca')
+    display_data_col(data_processor, col_datos, f'reporte_familia_{chosen_brand.lower()}', 'reporte de marca')
 
 def filtro_producto(data_processor:DataProcessor):
     chosen_sku, _ = display_filtering_controls(data_processor=data_processor)
@@ -123,7 +150,7 @@ def filtro_producto(data_processor:DataProcessor):
     st.title('KPIS PRODUCTO')
     col_kpis, col_datos = st.columns((.4, .6))
     display_kpis(kpis, col_kpis, sku=True)
-    display_data_col(data_processor.filtered_data, col_datos, f'reporte_producto_{chosen_sku.lower()}', 'reporte de producto')
+    display_data_col(data_processor, col_datos, f'reporte_producto_{chosen_sku.lower()}', 'reporte de producto')
 
 
 def render_page():
@@ -137,8 +164,14 @@ def render_page():
     """
     open_styles()
     add_description_to_page()
-    produccion_file = "data/datos_produccion.parquet"
+    produccion_file = "data/datos_produccion"
     data_processor = DataProcessor(produccion_file)
+    # El panel de trazas va antes de cualquier st.stop(): después de st.stop() streamlit ya no
+    # dibuja nada, ni en un finally. Las trazas de los filtros de esta ejecución salen en la siguiente.
+    panel_trazas()
+    if data_processor.datos.empty:
+        st.info('Aún no hay datos de producción. Carga los archivos en la página Cargar Archivos.')
+        st.stop()
 
     # ------ SIDEBAR ---------
     type_of_filter = st.sidebar.radio('Elige el tipo de filtro', ['Familia', 'Marca', 'Producto'])
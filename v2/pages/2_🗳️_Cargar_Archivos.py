@@ -2,8 +2,13 @@ import os
 import shutil
 import datetime
 import streamlit as st
-from scripts.clean_production_files import LiquidoCleaner, PolvoCleaner, LermaCleaner
+from scripts.clean_production_files import ProductionCleaner
+from scripts.template_registry import get_plantillas
+from scripts.batch_ingestion import BatchIngestion
+from scripts.catalog_service import get_catalogo, invalida_catalogo
+from scripts.production_store import invalida_store
 from scripts.excel_functions import ExcelFunctions
+from scripts.tracing import panel_trazas
 import pandas as pd
 
 def download_button(data, file_name, label:str='📥 Descargar Datos'):
@@ -26,82 +31,65 @@ def open_styles(location='data/style.css'):
     with open(location) as f:
         st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
-def update_polvos(polvo_cleaner:PolvoCleaner):
-    col_uploading, col_errors = st.columns(2, gap="large")
-    bad_data = pd.DataFrame()
-
-    with col_uploading:
-        files = st.file_uploader(label='Sube el archivo de polvos', accept_multiple_files=True, type=['xlsx', 'xlsm'])
-
-        if len(files) > 0:
-            for file in files:
-                try:
-                    polvo_cleaner.extract_and_save_data(file=file)
-                    st.success(f'{file.name} ha sido cargado de manera exitosa')
-                    # Ahora vemos si hubo datos inválidos
-                    aux_bad_data = polvo_cleaner.bad_data.assign(file=file.name)
-                    bad_data = pd.concat((bad_data, aux_bad_data), ignore_index=True).drop_duplicates()
-                except Exception as e:
-                    st.error(f'Error en el archivo {file.name}: {e}')
-
-    with col_errors:
-        if bad_data is not None and bad_data.size > 0:
-            st.dataframe(bad_data, hide_index=True, use_container_width=True)
-            data, filename = ExcelFunctions().save_and_download_excel_file(bad_data, 'data/', 'errores_al_cargar', 'errores')
-            download_button(data, filename)
-
-
-
-def update_liquidos(liquido_cleaner:LiquidoCleaner):
+def carga_archivos(cleaner, files:list) -> dict:
+    """
+    Carga los archivos subidos y regresa el resultado de la carga.
+    Streamlit vuelve a correr la página con cada interacción (por ejemplo al descargar el reporte
+    de errores) mientras los archivos siguen en el uploader, así que el resultado de la última
+    carga se guarda en la sesión y los mismos archivos no se vuelven a cargar.
+    """
+    llave = (cleaner.plan.nombre, tuple(getattr(file, 'file_id', file.name) for file in files))
+    ultima_carga = st.session_state.get('ultima_carga')
+    if ultima_carga is not None and ultima_carga[0] == llave:
+        return ultima_carga[1]
+
+    batch = BatchIngestion(cleaner)
+    error = None
+    try:
+        batch.ingest(files)
+    except Exception as e:
+        error = str(e)
+    else:
+        # Los reportes deben ver los datos nuevos
+        invalida_store(cleaner.clean_data_file)
+    carga = {
+        'archivos_cargados': batch.archivos_cargados,
+        'errores': batch.errores,
+        'bad_data': batch.bad_data,
+        'error': error
+    }
+    st.session_state['ultima_carga'] = (llave, carga)
+    return carga
+
+def update_archivos(cleaner, label:str):
+    """
+    Esta función permite subir varios archivos del mismo tipo a la vez.
+    Todos los archivos se leen y se validan en paralelo, los datos buenos se guardan
+    en una sola escritura y se muestra un solo reporte con los errores de todos.
+    """
     col_uploading, col_errors = st.columns(2, gap="large")
     bad_data = pd.DataFrame()
-    
-    with col_uploading:
-        files = st.file_uploader(label='Sube el archivo de líquidos', accept_multiple_files=True, type=['xlsx', 'xlsm'])
-
-        if len(files) > 0:
-            
-            for file in files:
-                try:
-                    liquido_cleaner.extract_and_save_data(file=file)
-                    st.success(f'{file.name} ha sido cargado de manera exitosa')
-                    # Ahora vemos si hubo datos inválidos
-                    aux_bad_data = liquido_cleaner.bad_data.assign(file=file.name)
-                    bad_data = pd.concat((bad_data, aux_bad_data), ignore_index=True).drop_duplicates()
-                except Exception as e:
-                    st.error(f'Error en el archivo {file.name}: {e}')
-
-    with col_errors:
-        if bad_data is not None and bad_data.size > 0:
-            st.dataframe(bad_data, hide_index=True, use_container_width=True)
-            data, filename = ExcelFunctions().save_and_download_excel_file(bad_data, 'data/', 'errores_al_cargar', 'errores')
-            download_button(data, filename)
 
-        
-
-
-def update_lerma(lerma_cleaner:LiquidoCleaner):
-    col_uploading, col_errors = st.columns(2, gap="large")
-    bad_data = pd.DataFrame()
     with col_uploading:
-        files = st.file_uploader(label='Sube el archivo de Lerma', accept_multiple_files=True, type=['xlsx', 'xlsm'])
+        files = st.file_uploader(label=label, accept_multiple_files=True, type=['xlsx', 'xlsm'])
 
         if len(files) > 0:
-            for file in files:
-                try:
-                    lerma_cleaner.extract_and_save_data(file=file)
-                    st.success(f'{file.name} ha sido cargado de manera exitosa')
-                    # Ahora vemos si hubo datos inválidos
-                    aux_bad_data = lerma_cleaner.bad_data.assign(file=file.name)
-                    bad_data = pd.concat((bad_data, aux_bad_data), ignore_index=True).drop_duplicates()
-                except Exception as e:
-                    st.error(f'Error en el archivo {file.name}: {e}')
+            carga = carga_archivos(cleaner, files)
+            if carga['error'] is not None:
+                st.error(f"Error al guardar los archivos: {carga['error']}")
+            else:
+                for file_name in carga['archivos_cargados']:
+                    st.success(f'{file_name} ha sido cargado de manera exitosa')
+                if carga['bad_data'] is not None:
+                    bad_data = carga['bad_data']
+            for file_name, error in carga['errores'].items():
+                st.error(f'Error en el archivo {file_name}: {error}')
 
     with col_errors:
         if bad_data is not None and bad_data.size > 0:
             st.dataframe(bad_data, hide_index=True, use_container_width=True)
-            data, filename = ExcelFunctions().save_and_download_excel_file(bad_data, 'data/', 'errores_al_cargar', 'errores')
-            download_button(data, filename)
+            data = ExcelFunctions().excel_file_as_bytes(bad_data, sheet_name='errores')
+            download_button(data, 'errores_al_cargar.xlsx')
 
 def catalogo_expander(catalogo_actual:str, directorio_historicos:str='data/historico-catalogos'):
     """
@@ -138,7 +126,7 @@ def update_catalogo(catalogo_actual:str, nuevo_catalogo, directorio_historicos:s
     os.makedirs(directorio_historicos, exist_ok=True)
 
     # Nos aseguramos de que las columnas de los dos archivos sean iguales
-    actual = pd.read_excel(catalogo_actual)
+    actual = get_catalogo(catalogo_actual).datos
     nuevo = pd.read_excel(nuevo_catalogo)
     if not nuevo.columns.equals(actual.columns):
         st.error('Las columnas de los archivos no coinciden')
@@ -150,6 +138,7 @@ def update_catalogo(catalogo_actual:str, nuevo_catalogo, directorio_historicos:s
     
     # Guardamos el nuevo catálogo en el lugar del viejo
     nuevo.to_excel(catalogo_actual, index=False)
+    invalida_catalogo(catalogo_actual)
     st.success("Catálogo actualizado")
 
 def show_files_in_directory(directory:str):
@@ -164,13 +153,6 @@ def show_files_in_directory(directory:str):
         file_name=chosen_file
     )
 
-def open_cleaners(catalogo:str, clean_data:str):
-    liquido_cleaner = LiquidoCleaner(catalogo_file=catalogo, clean_data_file=clean_data)
-    polvo_cleaner = PolvoCleaner(catalogo_file=catalogo, clean_data_file=clean_data)
-    lerma_cleaner = LermaCleaner(catalogo_file=catalogo, clean_data_file=clean_data)
-
-    return liquido_cleaner, polvo_cleaner, lerma_cleaner
-
 def add_description_to_page():
     st.sidebar.write('''
         <p class="paragraph" align="justify">
@@ -183,21 +165,20 @@ def render_page():
     add_description_to_page()
     
     catalogo = 'data/catalogo_productos.xlsx'
-    clean_data = 'data/datos_produccion.parquet'
+    clean_data = 'data/datos_produccion'
 
-    liquido_cleaner, polvo_cleaner, lerma_cleaner = open_cleaners(catalogo=catalogo, clean_data=clean_data)
+    # Hay una opción por cada plantilla en templates
+    plantillas = get_plantillas()
 
     # ------ SIDEBAR ------
-    type_of_file = st.sidebar.radio('Elige el tipo de archivo a subir', ['Polvos', 'Líquidos', 'Lerma'])
+    plantilla = st.sidebar.radio('Elige el tipo de archivo a subir', list(plantillas), format_func=lambda nombre: plantillas[nombre].etiqueta)
     catalogo_expander(catalogo_actual=catalogo)
 
     # ------- BODY --------
-    if type_of_file == 'Polvos':
-        update_polvos(polvo_cleaner=polvo_cleaner)
-    elif type_of_file == 'Líquidos':
-        update_liquidos(liquido_cleaner=liquido_cleaner)
-    elif type_of_file == "Lerma":
-        update_lerma(lerma_cleaner=lerma_cleaner)
+    cleaner = ProductionCleaner(catalogo_file=catalogo, clean_data_file=clean_data, plantilla=plantilla)
+    update_archivos(cleaner, label=f'Sube el archivo de {plantillas[plantilla].descripcion}')
+
+    panel_trazas()
 
     
 
@@ -0,0 +1,138 @@
+import io
+import os
+import threading
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from scripts.clean_production_files import ProductionCleaner
+from scripts.tracing import captura_trazas, registra_trazas
+
+# Máximo de procesos para leer archivos. Cada proceso carga su propia copia del catálogo.
+MAXIMO_PROCESOS = 4
+# Pools de procesos de este proceso, uno por número de workers. Se comparten entre todas las
+# sesiones de streamlit para no levantar procesos nuevos en cada carga.
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def extrae_y_valida_archivo(plantilla:str, catalogo_file:str, reglas:list, nombre:str, contenido:bytes):
+    '''
+    Esta función extrae y valida un solo archivo con la plantilla dada.
+    Se ejecuta dentro de los procesos del pool, por eso recibe solo el nombre de la plantilla,
+    la ubicación del catálogo y los bytes del archivo (el catálogo se carga una vez por proceso)
+    y nunca lanza excepciones: el error se regresa como texto.
+    Las trazas de la extracción no se escriben en el log desde aquí sino que se regresan, para
+    que las guarde el proceso principal con registra_trazas.
+
+    Regresa (nombre, good_data, bad_data, error, trazas)
+    '''
+    with captura_trazas() as trazas:
+        try:
+            cleaner = ProductionCleaner(catalogo_file=catalogo_file, clean_data_file=None, reglas=reglas, plantilla=plantilla)
+            cleaner.extract_data(io.BytesIO(contenido))
+            cleaner.valida_datos()
+            resultado = nombre, cleaner.good_data, cleaner.bad_data, None
+        except Exception as e:
+            resultado = nombre, None, None, str(e)
+    return (*resultado, trazas)
+
+def get_pool(workers:int) -> ProcessPoolExecutor:
+    '''
+    Regresa el pool de procesos con workers procesos. Los procesos se crean con spawn y no con
+    fork, porque el servidor de streamlit tiene varios hilos y hacer fork de un proceso con
+    hilos puede dejar locks tomados en el proceso hijo.
+    '''
+    with _POOLS_LOCK:
+        if workers not in _POOLS:
+            _POOLS[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _POOLS[workers]
+
+def descarta_pool(workers:int):
+    with _POOLS_LOCK:
+        pool = _POOLS.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+class BatchIngestion:
+    '''
+    Esta clase carga varios archivos del mismo tipo a la vez.
+    Los archivos se leen y se validan en paralelo en un pool de procesos, y los datos
+    buenos de todos se guardan en una sola escritura.
+    '''
+    def __init__(self, cleaner, max_workers:int=None) -> None:
+        '''
+        cleaner: un ProductionCleaner (por ejemplo LiquidoCleaner, PolvoCleaner o LermaCleaner)
+        max_workers: número máximo de procesos. Por default el número de CPUs, pero nunca más de MAXIMO_PROCESOS
+        '''
+        self.cleaner = cleaner
+        self.max_workers = max_workers if max_workers is not None else min(os.cpu_count() or 1, MAXIMO_PROCESOS)
+        self.archivos_cargados = []
+        self.errores = {}
+        self.good_data, self.bad_data = None, None
+
+    def __procesa_archivos(self, archivos:list) -> list:
+        '''
+        archivos: lista de tuplas (nombre, bytes)
+        Si solo hay un archivo no vale la pena usar el pool.
+        Regresa (nombre, good_data, bad_data, error) de cada archivo y guarda sus trazas.
+        '''
+        parametros = (self.cleaner.plan.nombre, self.cleaner.catalogo_file, self.cleaner.reglas)
+        if len(archivos) == 1 or self.max_workers <= 1:
+            resultados = [extrae_y_valida_archivo(*parametros, nombre, contenido) for nombre, contenido in archivos]
+        else:
+            workers = min(len(archivos), self.max_workers)
+            try:
+                futures = [get_pool(workers).submit(extrae_y_valida_archivo, *parametros, nombre, contenido) for nombre, contenido in archivos]
+                resultados = [future.result() for future in futures]
+            except BrokenProcessPool:
+                # Si algún proceso murió, el pool ya no sirve. Se crea uno nuevo en la siguiente carga.
+                descarta_pool(workers)
+                raise
+
+        for *_, trazas in resultados:
+            registra_trazas(trazas)
+        return [resultado[:-1] for resultado in resultados]
+
+    def __junta_resultados(self, resultados:list):
+        '''
+        Junta los datos buenos y el reporte de errores de todos los archivos.
+        Si dos archivos traen la misma semana del mismo tipo, se queda el último que se subió,
+        igual que si se hubieran cargado uno por uno.
+        '''
+        good_dfs, bad_dfs = [], []
+        for orden, (nombre, good_data, bad_data, error) in enumerate(resultados):
+            if error is not None:
+                self.errores[nombre] = error
+                continue
+            self.archivos_cargados.append(nombre)
+            good_dfs.append(good_data.assign(orden_archivo=orden))
+            bad_dfs.append(bad_data.assign(file=nombre))
+
+        if len(good_dfs) > 0:
+            good_data = pd.concat(good_dfs, ignore_index=True)
+            ultimo_archivo = good_data.groupby(['tipo', 'fecha']).orden_archivo.transform('max')
+            self.good_data = (
+                good_data
+                .loc[lambda df: df.orden_archivo == ultimo_archivo]
+                .drop('orden_archivo', axis=1)
+                .reset_index(drop=True)
+            )
+        if len(bad_dfs) > 0:
+            self.bad_data = pd.concat(bad_dfs, ignore_index=True).drop_duplicates()
+
+    def ingest(self, files:list):
+        '''
+        Extrae, valida y guarda todos los archivos.
+        files: lista de archivos subidos en streamlit (o cualquier objeto con .name y .getvalue())
+        '''
+        archivos = [(file.name, file.getvalue()) for file in files]
+        resultados = self.__procesa_archivos(archivos)
+        self.__junta_resultados(resultados)
+
+        if self.good_data is not None and self.good_data.size > 0:
+            self.cleaner.funciones_auxiliares.save_data(
+                self.good_data,
+                location=self.cleaner.clean_data_file,
+                type_of_file=self.cleaner.type_of_file,
+                drop_duplicates=True
+            )
@@ -0,0 +1,91 @@
+import os
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Catálogos que ya se cargaron en este proceso. La llave es la ubicación del xlsx.
+_CATALOGOS = {}
+
+class CatalogService:
+    '''
+    Esta clase lee el catálogo de productos (xlsx) una sola vez y lo comparte entre todos los cleaners.
+    El catálogo ya leído se guarda en un archivo parquet junto al xlsx. En ese archivo se guardan
+    también la fecha de modificación y el hash del xlsx, así que mientras el xlsx no cambie ya no
+    es necesario volver a leer el excel, ni siquiera al reiniciar la aplicación.
+
+    Columnas del catálogo: sku, descripcion, familia, marca
+    '''
+    def __init__(self, catalogo_file:str) -> None:
+        '''
+        catalogo_file: ubicación del archivo de excel con el catálogo
+        '''
+        self.catalogo_file = catalogo_file
+        self.sidecar_file = f'{os.path.splitext(catalogo_file)[0]}.parquet'
+        stat = os.stat(catalogo_file)
+        self.signature = (stat.st_mtime_ns, stat.st_size)
+        self.hash = self.__file_hash(catalogo_file)
+        self.datos = self.__load()
+        # Índice por sku para hacer los joins de validación
+        self.por_sku = self.datos.drop_duplicates(subset='sku').set_index('sku')
+
+    def __file_hash(self, location:str) -> str:
+        with open(location, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def __load(self) -> pd.DataFrame:
+        '''
+        Lee el parquet si corresponde al xlsx actual. Si no, lee el xlsx y vuelve a generar el parquet.
+        '''
+        if os.path.exists(self.sidecar_file):
+            metadata = pq.read_schema(self.sidecar_file).metadata or {}
+            if metadata.get(b'catalogo_hash', b'').decode() == self.hash:
+                return pd.read_parquet(self.sidecar_file)
+
+        datos = pd.read_excel(self.catalogo_file)
+        self.__save_sidecar(datos)
+        return datos
+
+    def __save_sidecar(self, datos:pd.DataFrame):
+        '''
+        Guarda el catálogo como parquet con la llave del xlsx en los metadatos.
+        Si el catálogo trae tipos mezclados que no se pueden guardar, simplemente no se guarda.
+        '''
+        try:
+            table = pa.Table.from_pandas(datos, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            return
+        metadata = {
+            **(table.schema.metadata or {}),
+            b'catalogo_mtime': str(self.signature[0]).encode(),
+            b'catalogo_hash': self.hash.encode()
+        }
+        tmp_location = f'{self.sidecar_file}.tmp'
+        pq.write_table(table.replace_schema_metadata(metadata), tmp_location)
+        os.replace(tmp_location, self.sidecar_file)
+
+    def is_current(self) -> bool:
+        '''
+        Regresa True si el xlsx no ha cambiado desde que se cargó
+        '''
+        if not os.path.exists(self.catalogo_file):
+            return False
+        stat = os.stat(self.catalogo_file)
+        return self.signature == (stat.st_mtime_ns, stat.st_size)
+
+
+def get_catalogo(catalogo_file:str) -> CatalogService:
+    '''
+    Regresa el catálogo de este proceso. Solo se vuelve a cargar si el xlsx cambió.
+    '''
+    catalogo = _CATALOGOS.get(catalogo_file)
+    if catalogo is None or not catalogo.is_current():
+        catalogo = CatalogService(catalogo_file)
+        _CATALOGOS[catalogo_file] = catalogo
+    return catalogo
+
+def invalida_catalogo(catalogo_file:str):
+    '''
+    Olvida el catálogo cargado. Se usa cuando se reemplaza el archivo del catálogo.
+    '''
+    _CATALOGOS.pop(catalogo_file, None)
@@ -1,5 +1,10 @@
 from scripts.new_excel_functions import DataExtraction
 from scripts.errores import FechaNoEsLunes, FechaNoEncontrada, ArchivoNoPermitido, ColumnasNoCoinciden
+from scripts.production_dataset import ProductionDataset
+from scripts.catalog_service import get_catalogo
+from scripts.validation_engine import ValidationEngine, crea_reglas
+from scripts.template_registry import get_plantilla
+from scripts.tracing import trazado
 import pandas as pd
 import datetime
 import os
@@ -15,16 +20,10 @@ class AuxiliarFunctions:
         La fecha debe de ser el lunes del inicio de la semana que se está considerando.
         '''
         # Primero tenemos que asegurarnos de que venga una celda con la palabra buscada
-        # Vamos a intentar con dos opciones de tíutlo de fecha: 'fecha' y 'Fecha'
-        celda_fecha = (-1,-1)
+        # Vamos a intentar con todas las opciones de título de fecha (ej. 'fecha' y 'Fecha')
+        nombre_fecha, celda_fecha = extractor.find_first_value(allowed_values)
         
-        for nombre_fecha in allowed_values:
-            lista_celda_fecha = extractor.find_value(nombre_fecha)
-            if len(lista_celda_fecha) > 0:
-                celda_fecha = lista_celda_fecha[0]
-                break
-        
-        if celda_fecha == (-1,-1):
+        if celda_fecha is None:
             raise FechaNoEncontrada(allowed_values)
         
         # La fecha puede estar a la derecha o debajo de donde diga fecha
@@ -55,20 +54,26 @@ class AuxiliarFunctions:
             my_df[col_to_add] = cols_to_add[col_to_add]
         return my_df  
     
+    @trazado(mide=lambda _, self, df, *args, **kwargs: df)
     def save_data(self, df:pd.DataFrame, location:str, type_of_file:str, drop_duplicates:bool):
         '''
         Esta función guarda los datos en un archivo que se especifique.
         Verifica la existencia del archivo. Si este existe, lo abre y agrega los datos
         y si drop_duplicates es True, tira los duplicados que se encuentren.
+
+        Si type_of_file es parquet, location es el directorio de un ProductionDataset y solo
+        se reemplazan las particiones (tipo y semana) que vengan en df.
         '''
+        if type_of_file == 'parquet':
+            ProductionDataset(location).write(df, drop_duplicates=drop_duplicates)
+            return
+
         # Si existe el archivo
         if os.path.exists(location):
             if type_of_file == 'csv':
                 existing_file = pd.read_csv(location)
             elif type_of_file == 'xlsx':
                 existing_file = pd.read_excel(location)
-            elif type_of_file == 'parquet':
-                existing_file = pd.read_parquet(location)
             else:
                 raise ArchivoNoPermitido(['csv', 'xlsx', 'parquet'])
             
@@ -87,184 +92,78 @@ class AuxiliarFunctions:
         # Guardamos los datos
         if type_of_file == 'csv':
             existing_file = together_data.to_csv(location, index=False)
-        elif type_of_file == 'xlsx':
-            existing_file = together_data.to_excel(location, index=False)
         else:
-            existing_file = together_data.to_parquet(location, index=False)
-        
-class LiquidoCleaner:
-    def __init__(self, catalogo_file:str, clean_data_file:str, type_of_file:str='parquet') -> None:
-        '''
-        catalogo_file: ubicación del archivo que se usa como catálogo de los productos. Tiene las columnas sku, descripcion, familia, marca
-        '''
-        self.catalogo = pd.read_excel(catalogo_file)
-        self.clean_data_file = clean_data_file
-        self.type_of_file = type_of_file
-        self.funciones_auxiliares = AuxiliarFunctions()
-        self.INDEX_VALUE = 'CLAVE'
-        self.COLS_TO_EXTRACT = ['Fabricado', 'Programa']
-        self.OUTPUT_COLUMN_NAMES = ['sku', 'fabricado', 'programado']
-        self.TIPO_ARCHIVO = 'liquido'
-        self.SHIFT_BETWEEN_VALUES = 0
-        self.SHEET_NAME = 0
-        self.ALLOWED_VALUES_FOR_DATE = ['DEL:', 'Del:', 'DEL', 'del']
-        self.extracted_data = None
-        self.good_data, self.bad_data = None, None
-    
-    def extract_data(
-            self,
-            file
-        ):
-        '''
-        Esta función limpia el archivo de polvos si el template es el adecuado
-        ''' 
-        # Cargamos el archivo en un extractor
-        extractor = DataExtraction(file, sheet_name=self.SHEET_NAME)
-        
-        # Buscamos la fecha en el archivo
-        fecha = self.funciones_auxiliares.encuentra_fecha(extractor=extractor, allowed_values=self.ALLOWED_VALUES_FOR_DATE)
-        
-        # Ahora sí sacamos los datos
-        df = extractor.extract_data_from_file(
-            index_value=self.INDEX_VALUE,
-            cols_to_extract=self.COLS_TO_EXTRACT,
-            shift_between_values=self.SHIFT_BETWEEN_VALUES
-        )
-        # Tiramos los skus que sean 0
-        df = df.query(f'{self.INDEX_VALUE} != 0')
-        
-        # Homologamos los datos
-        rename_dict = {llave:valor for llave, valor in zip([self.INDEX_VALUE] + self.COLS_TO_EXTRACT, self.OUTPUT_COLUMN_NAMES)}
-        cols_to_add = {'fecha':fecha, 'tipo':self.TIPO_ARCHIVO}
-        df = self.funciones_auxiliares.homologar_df(df, rename_columns_dict=rename_dict, cols_to_add=cols_to_add)
-        self.extract_data = df
-    
-    def valida_datos(self) -> pd.DataFrame:
-        '''
-        Ahora hacemos las validaciones necesarias.
-        1. Convertir a números lo fabricado y programado
-        2. Hacer el match de los sku con los del catálogo
-        '''
-        assert self.extract_data is not None, "Aún no se han limpiado los datos"
-        cols = ['fabricado', 'programado']
-        catalogo = self.catalogo
-        
-        my_df = self.extract_data
-        for col in cols:
-            my_df[col] = pd.to_numeric(my_df[col], errors='coerce')
-        
-        df_sin_nan = my_df.dropna(subset=cols, how='any')
-        bad_production_data = my_df[my_df[cols].isna().any(axis=1)].sku
-        
-        # Ahora, para los productos que sí tienen números en lo producido y fabricado
-        # nos aseguramos de que los skus estén en el catálogo existente. Si no están,
-        # no los queremos.
-        df_skus_bien = df_sin_nan.merge(catalogo, on='sku', how='left').dropna(subset=['familia']).reset_index(drop=True)
-        bad_sku_codes = df_sin_nan.merge(catalogo, on='sku', how='left').pipe(lambda df: df[df.familia.isna()]).sku
-        
-        df_reporte_errores = (
-            pd.concat((pd.DataFrame(bad_production_data).assign(error='cantidades'),
-                    pd.DataFrame(bad_sku_codes).assign(error='sku invalido')), 
-                    ignore_index=True)
-        )
+            existing_file = together_data.to_excel(location, index=False)
         
-        self.good_data, self.bad_data =  (df_skus_bien, df_reporte_errores)
-
-    def save_data(self):
-        '''
-        Esta función guarda los datos limpios en donde se especifique
-        '''
-        assert self.good_data is not None, "Aún no se han limpiado los datos"
-        self.funciones_auxiliares.save_data(self.good_data, location=self.clean_data_file, type_of_file=self.type_of_file, drop_duplicates=True)
-
-    def extract_and_save_data(self, file):
-        '''
-        Esta función extrae los datos, los valida y los guarda.
-        '''
-        self.extract_data(file)
-        self.valida_datos()
-        self.save_data()
+class ProductionCleaner:
+    '''
+    Esta clase limpia los archivos de producción de cualquier planta a partir de su plantilla
+    (ver templates/*.toml). Para agregar un formato nuevo basta con agregar una plantilla.
+    '''
+    PLANTILLA = None
 
-class PolvoCleaner:
-    def __init__(self, catalogo_file:str, clean_data_file:str, type_of_file:str='parquet') -> None:
+    def __init__(self, catalogo_file:str, clean_data_file:str, type_of_file:str='parquet', reglas:list=None, plantilla:str=None) -> None:
         '''
         catalogo_file: ubicación del archivo que se usa como catálogo de los productos. Tiene las columnas sku, descripcion, familia, marca
-        '''
-        self.catalogo = pd.read_excel(catalogo_file)
-        self.funciones_auxiliares = AuxiliarFunctions()
+        reglas: nombres de las reglas de validación (ver validation_engine.REGLAS). Por default las de la plantilla
+        plantilla: el nombre de la plantilla (el archivo en templates sin extensión). Por default PLANTILLA
+        '''
+        self.plan = get_plantilla(plantilla if plantilla is not None else self.PLANTILLA)
+        self.catalogo_file = catalogo_file
+        self.catalogo_service = get_catalogo(catalogo_file)
+        self.catalogo = self.catalogo_service.datos
+        self.reglas = reglas if reglas is not None else self.plan.reglas
+        self.validador = ValidationEngine(crea_reglas(self.reglas))
         self.clean_data_file = clean_data_file
         self.type_of_file = type_of_file
+        self.funciones_auxiliares = AuxiliarFunctions()
         self.extracted_data = None
         self.good_data, self.bad_data = None, None
 
-        self.INDEX_VALUE = 'CLAVE'
-        self.COLS_TO_EXTRACT = ['KG FABRICADOS', 'KG PROGRAMADOS']
-        self.OUTPUT_COLUMN_NAMES = ['sku', 'fabricado', 'programado']
-        self.TIPO_ARCHIVO = 'polvo'
-        self.SHIFT_BETWEEN_VALUES = 0
-        self.SHEET_NAME = 0
-        self.ALLOWED_VALUES_FOR_DATE = ['Fecha', 'fecha', 'Fecha Inicio']
-
-
-
     def extract_data(
             self,
-            file
+            file,
+            streaming:bool=True
         ):
         '''
-        Esta función limpia el archivo de polvos si el template es el adecuado
-        ''' 
+        Esta función limpia el archivo si el template es el adecuado.
+        El archivo se recorre una sola vez y solo se buscan las etiquetas de la plantilla.
+        streaming: si es False el archivo se lee completo con pandas (ver DataExtraction).
+            Los dos modos extraen los mismos datos con los mismos tipos.
+        '''
+        plan = self.plan
         # Cargamos el archivo en un extractor
-        extractor = DataExtraction(file, sheet_name=self.SHEET_NAME)
-        
+        extractor = DataExtraction(file, sheet_name=plan.hoja, streaming=streaming, etiquetas=plan.etiquetas, columnas=[plan.indice] + plan.columnas)
+
         # Buscamos la fecha en el archivo
-        fecha = self.funciones_auxiliares.encuentra_fecha(extractor=extractor, allowed_values=self.ALLOWED_VALUES_FOR_DATE)
-        
+        fecha = self.funciones_auxiliares.encuentra_fecha(extractor=extractor, allowed_values=plan.etiquetas_fecha)
+
         # Ahora sí sacamos los datos
         df = extractor.extract_data_from_file(
-            index_value=self.INDEX_VALUE,
-            cols_to_extract=self.COLS_TO_EXTRACT,
-            shift_between_values=self.SHIFT_BETWEEN_VALUES
+            index_value=plan.indice,
+            cols_to_extract=plan.columnas,
+            shift_between_values=plan.desplazamiento
         )
         # Tiramos los skus que sean 0
-        df = df.query(f'{self.INDEX_VALUE} != 0')
-        
+        df = df[df[plan.indice] != 0]
+
         # Homologamos los datos
-        rename_dict = {llave:valor for llave, valor in zip([self.INDEX_VALUE] + self.COLS_TO_EXTRACT, self.OUTPUT_COLUMN_NAMES)}
-        cols_to_add = {'fecha':fecha, 'tipo':self.TIPO_ARCHIVO}
-        df = self.funciones_auxiliares.homologar_df(df, rename_columns_dict=rename_dict, cols_to_add=cols_to_add)
-        self.extract_data = df
+        # La fecha puede llegar como datetime o como Timestamp según cómo se leyó la hoja.
+        # Siempre se guarda en nanosegundos, como la historia.
+        cols_to_add = {'fecha':pd.Timestamp(fecha).as_unit('ns'), 'tipo':plan.tipo}
+        df = self.funciones_auxiliares.homologar_df(df, rename_columns_dict=plan.renombres, cols_to_add=cols_to_add)
+        self.extracted_data = df
 
+    @trazado(mide=lambda _, self: self.extracted_data)
     def valida_datos(self) -> pd.DataFrame:
         '''
-        Ahora hacemos las validaciones necesarias.
+        Ahora hacemos las validaciones necesarias con el motor de validación.
+        Por default:
         1. Convertir a números lo fabricado y programado
         2. Hacer el match de los sku con los del catálogo
         '''
-        assert self.extract_data is not None, "Aún no se han limpiado los datos"
-        cols = ['fabricado', 'programado']
-        catalogo = self.catalogo
-        
-        my_df = self.extract_data
-        for col in cols:
-            my_df[col] = pd.to_numeric(my_df[col], errors='coerce')
-        
-        df_sin_nan = my_df.dropna(subset=cols, how='any')
-        bad_production_data = my_df[my_df[cols].isna().any(axis=1)].sku
-        
-        # Ahora, para los productos que sí tienen números en lo producido y fabricado
-        # nos aseguramos de que los skus estén en el catálogo existente. Si no están,
-        # no los queremos.
-        df_skus_bien = df_sin_nan.merge(catalogo, on='sku', how='left').dropna(subset=['familia']).reset_index(drop=True)
-        bad_sku_codes = df_sin_nan.merge(catalogo, on='sku', how='left').pipe(lambda df: df[df.familia.isna()]).sku
-        
-        df_reporte_errores = (
-            pd.concat((pd.DataFrame(bad_production_data).assign(error='cantidades'),
-                    pd.DataFrame(bad_sku_codes).assign(error='sku invalido')), 
-                    ignore_index=True)
-        )
-        
-        self.good_data, self.bad_data =  (df_skus_bien, df_reporte_errores)
+        assert self.extracted_data is not None, "Aún no se han limpiado los datos"
+        self.good_data, self.bad_data = self.validador.valida(self.extracted_data, self.catalogo_service)
 
     def save_data(self):
         '''
@@ -281,100 +180,18 @@ class PolvoCleaner:
         self.valida_datos()
         self.save_data()
 
-class LermaCleaner:
+# Los cleaners de siempre ahora solo fijan su plantilla
+class LiquidoCleaner(ProductionCleaner):
+    PLANTILLA = 'liquido'
+
+class PolvoCleaner(ProductionCleaner):
+    PLANTILLA = 'polvo'
+
+class LermaCleaner(ProductionCleaner):
     '''
     Esta funciona para limpiar todo lo de lerma
     '''
-    def __init__(self, catalogo_file:str, clean_data_file:str, type_of_file:str='parquet') -> None:
-        '''
-        catalogo_file: ubicación del archivo que se usa como catálogo de los productos. Tiene las columnas sku, descripcion, familia, marca
-        '''
-        self.catalogo = pd.read_excel(catalogo_file)
-        self.funciones_auxiliares = AuxiliarFunctions()
-        self.clean_data_file = clean_data_file
-        self.type_of_file = type_of_file
-
-        self.INDEX_VALUE = 'Clave'
-        self.COLS_TO_EXTRACT = ['Programado por \nsemana', 'Producido']
-        self.OUTPUT_COLUMN_NAMES = ['sku', 'fabricado', 'programado']
-        self.TIPO_ARCHIVO = 'lerma'
-        self.SHIFT_BETWEEN_VALUES = 0
-        self.SHEET_NAME = 0
-        self.ALLOWED_VALUES_FOR_DATE = ['Fecha', 'fecha', 'fecha:', 'Fecha:']
-
-    def extract_data(
-            self,
-            file
-        ):
-        '''
-        Esta función limpia el archivo de polvos si el template es el adecuado
-        ''' 
-        # Cargamos el archivo en un extractor
-        extractor = DataExtraction(file, sheet_name=self.SHEET_NAME)
-        
-        # Buscamos la fecha en el archivo
-        fecha = self.funciones_auxiliares.encuentra_fecha(extractor=extractor, allowed_values=self.ALLOWED_VALUES_FOR_DATE)
-        
-        # Ahora sí sacamos los datos
-        df = extractor.extract_data_from_file(
-            index_value=self.INDEX_VALUE,
-            cols_to_extract=self.COLS_TO_EXTRACT,
-            shift_between_values=self.SHIFT_BETWEEN_VALUES
-        )
-        # Tiramos los skus que sean 0
-        df = df.query(f'{self.INDEX_VALUE} != 0')
-        
-        # Homologamos los datos
-        rename_dict = {llave:valor for llave, valor in zip([self.INDEX_VALUE] + self.COLS_TO_EXTRACT, self.OUTPUT_COLUMN_NAMES)}
-        cols_to_add = {'fecha':fecha, 'tipo':self.TIPO_ARCHIVO}
-        df = self.funciones_auxiliares.homologar_df(df, rename_columns_dict=rename_dict, cols_to_add=cols_to_add)
-        self.extract_data = df
-
-    def valida_datos(self) -> pd.DataFrame:
-        '''
-        Ahora hacemos las validaciones necesarias.
-        1. Convertir a números lo fabricado y programado
-        2. Hacer el match de los sku con los del catálogo
-        '''
-        assert self.extract_data is not None, "Aún no se han limpiado los datos"
-        cols = ['fabricado', 'programado']
-        catalogo = self.catalogo
-        
-        my_df = self.extract_data
-        for col in cols:
-            my_df[col] = pd.to_numeric(my_df[col], errors='coerce')
-        
-        df_sin_nan = my_df.dropna(subset=cols, how='any')
-        bad_production_data = my_df[my_df[cols].isna().any(axis=1)].sku
-        
-        # Ahora, para los productos que sí tienen números en lo producido y fabricado
-        # nos aseguramos de que los skus estén en el catálogo existente. Si no están,
-        # no los queremos.
-        df_skus_bien = df_sin_nan.merge(catalogo, on='sku', how='left').dropna(subset=['familia']).reset_index(drop=True)
-        bad_sku_codes = df_sin_nan.merge(catalogo, on='sku', how='left').pipe(lambda df: df[df.familia.isna()]).sku
-        
-        df_reporte_errores = (
-            pd.concat((pd.DataFrame(bad_production_data).assign(error='cantidades'),
-                    pd.DataFrame(bad_sku_codes).assign(error='sku invalido')), 
-                    ignore_index=True)
-        )
-        
-        self.good_data, self.bad_data =  (df_skus_bien, df_reporte_errores)
-
-    def save_data(self):
-        '''
-        Esta función guarda los datos limpios en donde se especifique
-        '''
-        assert self.good_data is not None, "Aún no se han limpiado los datos"
-        self.funciones_auxiliares.save_data(self.good_data, location=self.clean_data_file, type_of_file=self.type_of_file, drop_duplicates=True)
-
-    def extract_and_save_data(self, file):
-        '''
-        Esta función extrae los datos, los valida y los guarda.
-        '''
-        self.extract_data(file)
-        self.valida_datos()
-        self.save_data()
+    PLANTILLA = 'lerma'
 
 
 if __name__ == '__main__':
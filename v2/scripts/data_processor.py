@@ -1,13 +1,17 @@
 import pandas as pd
 import datetime
+from scripts.production_store import get_production_store
+from scripts.tracing import trazado
 
 class DataProcessor:
+    @trazado('DataProcessor.carga', mide=lambda _, self, *args, **kwargs: self.datos)
     def __init__(self, file_location:str) -> None:
         """
         file_location: dónde están los datos de producción
         tipo_de_filtro: el tipo de filtro que se va a usar -> [familia, producto, marca]
         """
-        self.datos = pd.read_parquet(file_location)
+        self.store = get_production_store(file_location)
+        self.datos = self.store.datos
         self.filtro = None
         self.filter_value = None
         self.date_range = (None, None)
@@ -37,23 +41,27 @@ class DataProcessor:
         Esta función se utiliza para tener las familias para las cuales se tienen datos disponibles
         """
         if self.filtro is None: return []
-        if self.filtro == 'sku': return sorted(list(self.datos.apply(lambda x: str(x.sku)+' - '+str(x.descripcion), axis=1).unique()))
-        return sorted(list(self.datos[self.filtro].unique()))
+        if self.filtro == 'sku': return self.store.get_sku_options()
+        return self.store.get_unique_values(self.filtro)
+
+    def search_available_values(self, prefix:str, limit:int=200) -> list:
+        """
+        Regresa a lo más limit valores disponibles que empiecen con prefix (sin importar mayúsculas).
+        Para los skus se busca tanto por el sku como por la descripción.
+        """
+        if self.filtro is None: return []
+        if self.filtro == 'sku': return self.store.search_sku_options(prefix, limit=limit)
+        prefix = prefix.strip().lower()
+        return [valor for valor in self.get_available_values() if str(valor).lower().startswith(prefix)][:limit]
     
     def get_available_dates(self):
         """
         Esta función necesita que ya se haya especifcado filtro y filter_value
         """
         assert self.filtro is not None and self.filter_value is not None, "Se necesitan más datos aún"
-        filtered_data_so_far =(
-            self
-            .datos
-            .query(f"{self.filtro} == '{self.filter_value}'")            
-        )
-        min_date = filtered_data_so_far.fecha.min()
-        max_date = filtered_data_so_far.fecha.max()
-        return min_date, max_date
+        return self.store.get_date_limits(self.filtro, self.filter_value)
     
+    @trazado('DataProcessor.kpis')
     def get_my_kpis(self):
         return self.__get_kpis_by_familia_and_marca()
 
@@ -67,14 +75,18 @@ class DataProcessor:
             - Porcentaje de cumplimento (por número de productos terminados)
             - El mejor producto
             - El peor producto
+        Los kpis se calculan a partir del cubo semanal del almacén y no de los datos crudos.
         """
         assert self.fully_instanciated_processor, "Aún no has terminado de instanciar el procesador"
-        unique_skus = self.filtered_data.sku.unique().size
-        total_fabricado = self.filtered_data.fabricado.sum()
-        total_programado = self.filtered_data.programado.sum()
+        kpi_cube = self.store.kpi_cube
+        min_date, max_date = self.date_range
+        cubo = kpi_cube.get_rows(kpi_cube.lookup(self.filtro, self.filter_value, min_date, max_date))
+        unique_skus = cubo.sku.unique().size
+        total_fabricado = cubo.fabricado.sum()
+        total_programado = cubo.programado.sum()
         porcentaje_cumplimento_kilos_litros = round(total_fabricado / total_programado * 100, 2)
         cumpliento_por_producto = (
-            self.filtered_data
+            cubo
             .groupby('sku')
             .agg(
                 fabricado=pd.NamedAgg('fabricado', 'sum'),
@@ -101,18 +113,14 @@ class DataProcessor:
             'worst_product':worst_product
         }
     
+    @trazado('DataProcessor.filtra')
     def __get_filtered_data(self):
         """
         Esta función privada se utiliza para generar los filtros que el usuario desee.
         """
         # Aplicamos los filtros que ya tengamos
         # Se supone que cuando se ejecute esta función ya debemos saber el valor del filtro
-        # y el rango de fechas
+        # y el rango de fechas. La búsqueda se hace sobre el índice del almacén.
         min_date, max_date = self.date_range
-        filtered_data = (
-            self.datos
-            .query(f"{self.filtro} == '{self.filter_value}'")
-            .query(f'@min_date <= fecha <= @max_date')
-            .reset_index(drop=True)
-        )
-        return filtered_data
+        offsets = self.store.lookup(self.filtro, self.filter_value, min_date, max_date)
+        return self.store.get_rows(offsets)
@@ -12,4 +12,12 @@ class ArchivoNoPermitido(Exception):
 
 class ColumnasNoCoinciden(Exception):
     def __init__(self, columnas_1, columnas_2) -> None:
-        super().__init__(f'Las columnas no coinciden: {columnas_1} y {columnas_2}')
\ No newline at end of file
+        super().__init__(f'Las columnas no coinciden: {columnas_1} y {columnas_2}')
+
+class PlantillaInvalida(Exception):
+    def __init__(self, ubicacion, motivo) -> None:
+        super().__init__(f'La plantilla {ubicacion} no es válida: {motivo}')
+
+class PlantillaNoEncontrada(Exception):
+    def __init__(self, nombre, disponibles) -> None:
+        super().__init__(f"No existe la plantilla '{nombre}'. Las plantillas disponibles son {disponibles}")
@@ -1,3 +1,4 @@
+import io
 import pandas as pd
 import numpy as np
 import datetime
@@ -6,7 +7,9 @@ from openpyxl.utils.cell import coordinate_to_tuple
 import openpyxl as xl
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from scripts.tracing import trazado
 
 class DateFunctions:
     def filtrar_valores_numericos(lista):
@@ -276,69 +279,92 @@ class ExcelFunctions:
 
         return ultima_fila_con_datos 
     
-    def save_and_download_excel_file(self, df: pd.DataFrame, dir_location, file_name, sheet_name='hoja_procesada', index=False, n_cols_to_bold=0, return_data=True):
+    @trazado()
+    def excel_file_as_bytes(self, df: pd.DataFrame, sheet_name='hoja_procesada', index=False, n_cols_to_bold=0) -> bytes:
         '''
-        Esta función recibe un data frame, lo convierte a excel y regresa los bytes listos para descargar junto
-        con el archivo del nombre.
+        Esta función recibe un data frame y regresa los bytes del excel con formato, listos para descargar.
+        El libro se escribe en memoria con el modo write-only de openpyxl (fila por fila), sin pasar por disco.
 
         df: el dataframe a convertir
-        dir_location: la ubicación relativa del archivo
-        file_name: el nombre del archivo
-        sheet_name: el nombre de la hoja de excel a guardar
+        sheet_name: el nombre de la hoja de excel
         index: si se desea guardar el index del df o no
         n_cols_to_bold: número de columnas que se pondrá en bold
         '''
         if df is None:
-            return None, None
-        n_rows, n_cols = df.shape
+            return None
+        n_cols = df.shape[1]
 
         # Creamos variables de estilo
         color, font_color = '023e8a', 'edf2f4'
         fill_color = PatternFill(start_color=color, end_color=color, fill_type='solid')
         font = Font(color=font_color, bold=True, size=12)
+        bold_font = Font(bold=True)
         align = Alignment(horizontal='center')
         border = Border(right=Side(style='thin'))
 
-        # Creamos un nuevo libro de Excel utilizando openpyxl
-        wb = xl.Workbook()
-        ws = wb.active
-        ws.title = sheet_name
+        wb = xl.Workbook(write_only=True)
+        ws = wb.create_sheet(title=sheet_name)
 
-        # Pasamos el DataFrame a la hoja de Excel utilizando 'dataframe_to_rows'
-        for r in dataframe_to_rows(df, index=index, header=True):
-            ws.append(r)
+        # En modo write-only la anchura de las columnas se define antes de escribir
+        df_widths = df.reset_index() if index else df
+        for col_number, col_name in enumerate(df_widths.columns, start=1):
+            # Igual que en adjust_column_widths solo se consideran los textos
+            lengths = df_widths[col_name].map(lambda value: len(value) if isinstance(value, str) else 0)
+            max_length = max([len(str(col_name))] + lengths.to_list())
+            ws.column_dimensions[get_column_letter(col_number)].width = max_length + 2
 
-        # Cambiamos la anchura de las columnas
-        for col in range(n_cols):
-            col = get_column_letter(col+1)
-            ws.column_dimensions[col].adjustment = .3
+        rows = dataframe_to_rows(df, index=index, header=True)
 
-        # Cambiamos el color de la primera fila
-        for cell in ws[1]:
+        # La primera fila lleva el color de los encabezados
+        header = []
+        for value in next(rows):
+            cell = WriteOnlyCell(ws, value=value)
             cell.fill = fill_color
             cell.font = font
             cell.alignment = align
+            header.append(cell)
+        ws.append(header)
+
+        bold_columns = n_cols_to_bold > 0 and n_cols_to_bold <= n_cols
+        for row in rows:
+            if bold_columns:
+                # Ponemos en bold las primeras columnas y el borde en la última de ellas
+                row = list(row)
+                for col in range(n_cols_to_bold):
+                    row[col] = WriteOnlyCell(ws, value=row[col])
+                    row[col].font = bold_font
+                row[n_cols_to_bold-1].border = border
+                row[n_cols_to_bold-1].alignment = align
+            ws.append(row)
+
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        return buffer.getvalue()
+
+    @trazado(mide=lambda resultado, *args, **kwargs: resultado[0])
+    def save_and_download_excel_file(self, df: pd.DataFrame, dir_location, file_name, sheet_name='hoja_procesada', index=False, n_cols_to_bold=0, return_data=True):
+        '''
+        Esta función recibe un data frame, lo convierte a excel y regresa los bytes listos para descargar junto
+        con el archivo del nombre.
+        Si solo se necesitan los bytes es mejor usar excel_file_as_bytes, que no escribe a disco.
 
-        if n_cols_to_bold > 0 and n_cols_to_bold <= n_cols:
-            # Cambiamos el tipo de fuente de las primeras dos a bold
-            for row in np.arange(start=2, stop=n_rows+2):
-                for col in np.arange(start=1, stop=1+n_cols_to_bold):
-                    ws.cell(row=row, column=col).font = Font(bold=True)
-
-            # Cambiamos el borde de la segunda columna
-            for row in np.arange(start=2, stop=n_rows+2):
-                ws.cell(row=row, column=n_cols_to_bold).border = border
-                ws.cell(row=row, column=n_cols_to_bold).alignment = align    
+        df: el dataframe a convertir
+        dir_location: la ubicación relativa del archivo
+        file_name: el nombre del archivo
+        sheet_name: el nombre de la hoja de excel a guardar
+        index: si se desea guardar el index del df o no
+        n_cols_to_bold: número de columnas que se pondrá en bold
+        '''
+        if df is None:
+            return None, None
 
-        # Ajustamos la anchura de las columnas
-        self.adjust_column_widths(ws)
+        data = self.excel_file_as_bytes(df, sheet_name=sheet_name, index=index, n_cols_to_bold=n_cols_to_bold)
         # Guardamos el archivo procesado
-        wb.save(f"{dir_location}/{file_name}.xlsx")
-        wb.close()
+        with open(f"{dir_location}/{file_name}.xlsx", "wb") as f:
+            f.write(data)
 
-        # Una vez guardado el archivo, lo podemos regresar como bytes
         if return_data:
-            return self.download_excel_file(f"{dir_location}/{file_name}.xlsx"), f'{file_name}.xlsx'
+            return data, f'{file_name}.xlsx'
         else:
             return None, None
         
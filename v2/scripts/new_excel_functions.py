@@ -7,6 +7,7 @@ import openpyxl as xl
 from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
 from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+from scripts.tracing import traza, trazado
 
 # La idea que tengo es la siguiente. 
 # En general, la mayoría de las funciones que tengo son para extraer información
@@ -16,16 +17,138 @@ from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 # archivos existes.
 
 class DataExtraction:
-    def __init__(self, file, sheet_name=0):
+    # Valores de texto que pandas interpreta como NaN al leer un excel.
+    # Se usan en el modo streaming para que los dos modos regresen lo mismo.
+    NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+                 '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+    def __init__(self, file, sheet_name=0, streaming:bool=False, max_empty_rows:int=100, etiquetas:set=None, columnas:list=None):
         '''
         Se cargará al objeto los datos que se deseen manipular para extraer información.
         Se tendrá de dos maneras. Una en pd.DataFrame y otra en xl.WorkingBook.
 
         sheet_name: la hoja que se desea trabajar. Por default es la active sheet.
+        streaming: si es True, la hoja se lee con openpyxl en modo read-only, fila por fila,
+            y se deja de leer cuando termina el bloque de datos. No se crea el DataFrame de toda
+            la hoja, solo se materializan las columnas que se extraigan.
+        max_empty_rows: en modo streaming, el número de filas vacías consecutivas tras el cual
+            se considera que terminaron los datos.
+        etiquetas: si se da, el índice de celdas solo guarda estos valores (por ejemplo las etiquetas
+            de una plantilla) y find_value solo encuentra estos valores. Si es None se indexa todo.
+        columnas: en modo streaming, los encabezados de las columnas que se van a extraer (incluido
+            el del índice). En cuanto se encuentran todos, de las filas siguientes solo se guardan
+            esas columnas. Si es None se guardan las filas completas.
         '''
-        self.df_file = self.__open_excel_file_as_dataframe(file, sheet_name=sheet_name)
+        self.streaming = streaming
+        with traza('DataExtraction.abre', streaming=streaming) as t:
+            t.bytes = self.__file_size(file)
+            if streaming:
+                self.df_file = None
+                self.rows, self.cell_index = self.__open_excel_file_as_rows(file, sheet_name=sheet_name, max_empty_rows=max_empty_rows, etiquetas=etiquetas, columnas=columnas)
+                t.filas = len(self.rows)
+            else:
+                self.df_file = self.__open_excel_file_as_dataframe(file, sheet_name=sheet_name)
+                self.cell_index = self.__build_cell_index(self.df_file, etiquetas=etiquetas)
+                t.filas = len(self.df_file)
         #self.wb_file, self.ws_file = self.__open_excel_file_as_working_book(file, sheet_name=sheet_name)
 
+    def __file_size(self, file):
+        '''
+        Regresa el tamaño en bytes del archivo (ubicación, archivo subido en streamlit o BytesIO)
+        o None si no se puede saber sin leerlo
+        '''
+        if isinstance(file, (str, os.PathLike)):
+            return os.path.getsize(file) if os.path.exists(file) else None
+        if hasattr(file, 'size'):
+            return file.size
+        if hasattr(file, 'getbuffer'):
+            return file.getbuffer().nbytes
+        return None
+
+    def __convert_cell(self, value):
+        '''
+        Convierte el valor de una celda igual que lo hace pandas al leer un excel
+        '''
+        if isinstance(value, str) and value in self.NA_VALUES:
+            return None
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        return value
+
+    def __build_cell_index(self, df_file:pd.DataFrame, etiquetas:set=None) -> dict:
+        '''
+        Construye en una sola pasada un diccionario valor -> lista de celdas donde aparece.
+        Las celdas van en el mismo orden que las regresaba find_value (por fila y luego por columna).
+        Si se dan etiquetas, solo se indexan esos valores.
+        '''
+        cell_index = {}
+        values = df_file.stack()
+        if etiquetas is not None:
+            values = values[values.isin(etiquetas)]
+        for cell, value in values.items():
+            cell_index.setdefault(value, []).append(cell)
+        return cell_index
+
+    def __open_excel_file_as_rows(self, file, sheet_name=0, max_empty_rows:int=100, etiquetas:set=None, columnas:list=None) -> (list, dict):
+        '''
+        Esta función recorre la hoja una sola vez en modo read-only y regresa una lista con
+        las filas como tuplas (sin los None que tengan al final). La fila 1 del excel es el
+        elemento 0 de la lista.
+        En la misma pasada se construye el índice valor -> lista de celdas (solo de las etiquetas, si se dan).
+        Se deja de leer tras max_empty_rows filas vacías consecutivas.
+
+        Si se dan columnas, en cuanto aparecen todos sus encabezados ya se sabe qué columnas se van
+        a extraer (las de la primera celda de cada encabezado, igual que en extract_data_from_file).
+        De ahí en adelante de cada fila solo se guardan esas columnas y las demás celdas quedan en None.
+        Las filas con alguna etiqueta y la fila que sigue se guardan completas, porque la fecha puede
+        estar a la derecha o debajo de su etiqueta.
+        '''
+        if etiquetas is not None and columnas is not None:
+            etiquetas = set(etiquetas) | set(columnas)
+        wb = xl.load_workbook(file, read_only=True, data_only=True)
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        # Muchos archivos traen mal las dimensiones de la hoja, así que no las usamos
+        ws.reset_dimensions()
+
+        rows = []
+        cell_index = {}
+        consecutive_empty_rows = 0
+        # Las columnas que se guardan (None mientras no aparezcan todos los encabezados)
+        kept_cols = None
+        previous_row_has_labels = False
+        for row_number, row in enumerate(ws.iter_rows(values_only=True), start=1):
+            row = [self.__convert_cell(value) for value in row]
+            while len(row) > 0 and row[-1] is None:
+                row.pop()
+            if len(row) == 0:
+                consecutive_empty_rows += 1
+                if consecutive_empty_rows >= max_empty_rows:
+                    break
+            else:
+                consecutive_empty_rows = 0
+            row_has_labels = False
+            for col_number, value in enumerate(row, start=1):
+                if value is not None and (etiquetas is None or value in etiquetas):
+                    cell_index.setdefault(value, []).append((row_number, col_number))
+                    row_has_labels = True
+
+            if kept_cols is not None and not row_has_labels and not previous_row_has_labels:
+                row = [row[col-1] if col in kept_cols and col <= len(row) else None for col in range(1, min(len(row), kept_cols_end)+1)]
+                while len(row) > 0 and row[-1] is None:
+                    row.pop()
+            rows.append(tuple(row))
+            previous_row_has_labels = row_has_labels
+
+            if kept_cols is None and columnas is not None and all(col in cell_index for col in columnas):
+                kept_cols = {cell_index[col][0][1] for col in columnas}
+                kept_cols_end = max(kept_cols)
+        wb.close()
+
+        # Quitamos las filas vacías del final
+        while len(rows) > 0 and len(rows[-1]) == 0:
+            rows.pop()
+        return rows, cell_index
+
     def __open_excel_file_as_dataframe(self, file, sheet_name=0) -> pd.DataFrame:
         '''
         TODO: Probar que file puede ser una ubicación de archivo y bytes
@@ -55,11 +178,12 @@ class DataExtraction:
             ws = wb[sheet_name]
         return (wb, ws)
     
+    @trazado()
     def find_value(self, value_to_find) -> list:
         '''
         Esta función se utiliza para encontrar el value_to_find en todo el excel.
-        Usa pandas para que sin importar el tamaño del archivo, el tiempo que se 
-        tarde en encontrarlo sea el mismo.
+        La búsqueda se hace sobre el índice de celdas que se construye al abrir la hoja,
+        así que no se vuelve a recorrer la hoja en cada búsqueda.
 
         Regresa una lista de tuplas con las coordenadas convertidas a celdas de excel.
         Ejemplo: si buscas la palabra 'hola' y aparece en la celda A1 y C3 regresa [(1,1), (3,3)]
@@ -67,18 +191,19 @@ class DataExtraction:
 
         Si el valor no se encuetra, se regresa una lista vacía
         '''
+        return list(self.cell_index.get(value_to_find, []))
 
-        result = (
-            self
-            .df_file
-            .eq(value_to_find)
-            .stack()
-            .pipe(lambda df: df[df])
-            .index
-            .to_list()
-        )
-
-        return result
+    def find_first_value(self, values_to_find:list) -> (object, tuple):
+        '''
+        Esta función busca varios alias de un mismo valor (por ejemplo 'Fecha' y 'fecha').
+        Regresa el primer alias, en el orden dado, que aparezca en el excel junto con la primera
+        celda donde aparece. Si ninguno aparece regresa (None, None)
+        '''
+        for value in values_to_find:
+            cells = self.cell_index.get(value)
+            if cells:
+                return value, cells[0]
+        return None, None
 
     def get_value_on_cell(self, cell:(int, int)):
         '''
@@ -87,8 +212,14 @@ class DataExtraction:
         assert len(cell) == 2, "La celda necesita ser de tamaño 2"
         assert cell[0] >= 1, "La celda no está bien especificada"
         assert cell[1] >= 1, "La celda no está bien especificada"
+        if self.streaming:
+            row, col = cell
+            if row > len(self.rows) or col > len(self.rows[row-1]):
+                return None
+            return self.rows[row-1][col-1]
         return self.df_file.loc[cell]
 
+    @trazado()
     def extract_data_from_file(self, index_value, cols_to_extract:list, shift_between_values:int=0) -> pd.DataFrame:
         '''
         Esta función es la última función que vas a necesitar.
@@ -123,10 +254,20 @@ class DataExtraction:
 
         # Paso 3
         # Sacar los datos
+        if self.streaming:
+            # Solo materializamos las columnas que se van a extraer
+            data_rows = self.rows[row_index_cell:]
+            # dtype object, igual que las columnas de read_excel: si no, una columna de enteros con
+            # celdas vacías se volvería float64 y así se guardaría después de validar
+            df_cols = pd.DataFrame({
+                col:[row[col-1] if col <= len(row) else None for row in data_rows]
+                for col in cols_to_extract_index
+            }, dtype=object)
+        else:
+            df_cols = self.df_file.loc[row_index_cell+1:, cols_to_extract_index]
+
         output = (
-            self
-            .df_file
-            .loc[row_index_cell+1:, cols_to_extract_index]
+            df_cols
             .set_index(col_index_cell)
             .shift(shift_between_values)
             .reset_index()
@@ -143,4 +284,6 @@ class DataExtraction:
         Esta función regresa los nombres de la columa especificada
         '''
         assert row >= 1, "la fila no es válida"
+        if self.streaming:
+            return [value for value in self.rows[row-1] if value is not None]
         return self.df_file.loc[row].dropna().to_list()
\ No newline at end of file
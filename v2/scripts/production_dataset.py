@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import pandas as pd
+import pyarrow.parquet as pq
+from scripts.errores import ColumnasNoCoinciden
+
+class ProductionDataset:
+    '''
+    Esta clase maneja los datos limpios de producción como un dataset de parquet
+    particionado por tipo y por semana ISO. Cada partición es un archivo dentro del
+    directorio con el nombre {tipo}-{anio}-W{semana}.parquet.
+
+    Al guardar solo se escriben las particiones que vienen en los datos nuevos. Si la semana
+    ya se había cargado, su partición se reemplaza de forma atómica (se escribe un archivo
+    temporal y luego se renombra), así el costo de subir un archivo no depende de cuánta
+    historia haya.
+    '''
+    PARTITION_COLUMNS = ['tipo', 'anio', 'semana']
+
+    def __init__(self, location:str) -> None:
+        '''
+        location: el directorio del dataset.
+        Si el directorio no existe pero existe el archivo único que se usaba antes
+        (location.parquet), los datos de ese archivo se migran al dataset.
+        '''
+        self.location = location
+        legacy_file = f'{location}.parquet'
+        if not os.path.isdir(location) and os.path.isfile(legacy_file):
+            self.__migrate_legacy_file(legacy_file)
+        os.makedirs(location, exist_ok=True)
+
+    def __migrate_legacy_file(self, legacy_file:str):
+        '''
+        Parte el archivo histórico en particiones. El archivo original no se borra.
+        Las particiones se escriben en un directorio temporal que se renombra al final, así que
+        si el proceso muere a la mitad el dataset no queda incompleto y la migración se repite
+        la próxima vez.
+        '''
+        parent, name = os.path.split(os.path.abspath(self.location))
+        tmp_location = tempfile.mkdtemp(prefix=f'.{name}-', dir=parent)
+        try:
+            ProductionDataset(tmp_location).write(pd.read_parquet(legacy_file), drop_duplicates=True)
+            os.replace(tmp_location, self.location)
+        except OSError:
+            # Otro proceso ya terminó la migración
+            if not os.path.isdir(self.location):
+                raise
+        finally:
+            shutil.rmtree(tmp_location, ignore_errors=True)
+
+    @staticmethod
+    def partition_name(tipo:str, anio:int, semana:int) -> str:
+        return f'{tipo}-{anio}-W{semana:02d}.parquet'
+
+    def __add_partition_columns(self, df:pd.DataFrame) -> pd.DataFrame:
+        calendario = df.fecha.dt.isocalendar()
+        return df.assign(anio=calendario.year.astype(int), semana=calendario.week.astype(int))
+
+    def partitions(self) -> list:
+        '''
+        Regresa las rutas de todas las particiones ordenadas por nombre.
+        Los archivos temporales empiezan con '.' y no se consideran.
+        '''
+        files = [file for file in os.listdir(self.location) if file.endswith('.parquet') and not file.startswith('.')]
+        return [f'{self.location}/{file}' for file in sorted(files)]
+
+    def signature(self) -> tuple:
+        '''
+        Regresa una firma del dataset (nombre, fecha de modificación y tamaño de cada partición).
+        Cambia cada vez que se escribe o se reemplaza alguna partición.
+        '''
+        firma = []
+        for partition in self.partitions():
+            stat = os.stat(partition)
+            firma.append((os.path.basename(partition), stat.st_mtime_ns, stat.st_size))
+        return tuple(firma)
+
+    def read(self) -> pd.DataFrame:
+        '''
+        Lee todas las particiones en un solo DataFrame.
+        '''
+        partitions = self.partitions()
+        if len(partitions) == 0:
+            return pd.DataFrame()
+        return pd.concat([pd.read_parquet(partition) for partition in partitions], ignore_index=True)
+
+    def write(self, df:pd.DataFrame, drop_duplicates:bool=True) -> list:
+        '''
+        Guarda los datos en las particiones que les correspondan. Cada partición que venga
+        en df reemplaza por completo a la partición que ya existiera.
+        Regresa la lista de particiones escritas.
+        '''
+        # Nos aseguramos de que las columnas sean iguales a las que ya se tienen
+        partitions = self.partitions()
+        if len(partitions) > 0:
+            existing_columns = pd.Index(pq.read_schema(partitions[0]).names)
+            if not existing_columns.equals(df.columns):
+                raise ColumnasNoCoinciden(existing_columns, df.columns)
+
+        written = []
+        for (tipo, anio, semana), partition_df in self.__add_partition_columns(df).groupby(self.PARTITION_COLUMNS):
+            partition_df = partition_df[df.columns]
+            if drop_duplicates:
+                partition_df = partition_df.drop_duplicates()
+            name = self.partition_name(tipo, anio, semana)
+            tmp_location = f'{self.location}/.{name}.tmp'
+            partition_df.to_parquet(tmp_location, index=False)
+            os.replace(tmp_location, f'{self.location}/{name}')
+            written.append(f'{self.location}/{name}')
+        return written
@@ -0,0 +1,300 @@
+import bisect
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+from scripts.production_dataset import ProductionDataset
+
+# Aquí guardamos los cachés de los almacenes de este proceso. Se comparten entre todas
+# las sesiones de streamlit. La llave es la ubicación del dataset de producción.
+_STORE_CACHES = {}
+_STORE_CACHES_LOCK = threading.Lock()
+# Cada vez que se cargan datos nuevos el almacén recibe un número de versión distinto
+_VERSIONS = itertools.count(1)
+
+class ProductionStore:
+    '''
+    Esta clase mantiene en memoria los datos de producción de forma columnar.
+    Los datos se ordenan por fecha una sola vez y las columnas familia, marca, sku y tipo
+    se guardan como categorías. Para cada una de ellas se precalcula un índice con los
+    offsets de las filas de cada valor, ordenados por fecha, de forma que filtrar por un
+    valor y un rango de fechas sea una búsqueda binaria y no un recorrido de toda la tabla.
+    '''
+    KEY_COLUMNS = ['familia', 'marca', 'sku', 'tipo']
+
+    def __init__(self, datos:pd.DataFrame, signature:tuple, kpi_cube=None) -> None:
+        '''
+        datos: todos los datos de producción
+        signature: la firma del dataset del que salieron los datos
+        kpi_cube: el WeeklyKpiCube de los mismos datos
+        '''
+        self.signature = signature
+        self.kpi_cube = kpi_cube
+        self.version = next(_VERSIONS)
+        datos = (
+            datos
+            .sort_values(['fecha', 'tipo'], kind='stable')
+            .reset_index(drop=True)
+        )
+        for col in self.KEY_COLUMNS:
+            datos[col] = datos[col].astype('category')
+        self.datos = datos
+        self.fechas = datos.fecha.to_numpy()
+        self.indices = {col:self.__build_index(datos[col]) for col in self.KEY_COLUMNS}
+        # Las opciones de sku se calculan la primera vez que se piden
+        self.sku_options = None
+        self.sku_search_keys = None
+
+    def __build_index(self, columna:pd.Series) -> (np.ndarray, np.ndarray):
+        '''
+        Regresa los offsets de las filas agrupados por código de la categoría y los límites
+        de cada grupo. Como el ordenamiento es estable, dentro de cada grupo las filas
+        siguen ordenadas por fecha.
+        Los offsets del código i son offsets[limites[i]:limites[i+1]]
+        '''
+        codes = columna.cat.codes.to_numpy()
+        offsets = np.argsort(codes, kind='stable')
+        limites = np.searchsorted(codes[offsets], np.arange(len(columna.cat.categories) + 1))
+        return offsets, limites
+
+    def __to_fecha(self, fecha) -> np.datetime64:
+        return pd.Timestamp(fecha).to_datetime64().astype(self.fechas.dtype)
+
+    def get_offsets(self, column:str, value) -> np.ndarray:
+        '''
+        Regresa los offsets (ordenados por fecha) de las filas donde column == value.
+        Si el valor no existe se regresa un arreglo vacío.
+        '''
+        assert column in self.indices, "Columna sin índice"
+        categorias = self.datos[column].cat.categories
+        if value not in categorias:
+            return np.array([], dtype=np.intp)
+        code = categorias.get_loc(value)
+        offsets, limites = self.indices[column]
+        return offsets[limites[code]:limites[code+1]]
+
+    def get_date_limits(self, column:str, value) -> (pd.Timestamp, pd.Timestamp):
+        '''
+        Regresa la primera y la última fecha que hay para el valor dado.
+        '''
+        offsets = self.get_offsets(column, value)
+        if offsets.size == 0:
+            return pd.NaT, pd.NaT
+        return pd.Timestamp(self.fechas[offsets[0]]), pd.Timestamp(self.fechas[offsets[-1]])
+
+    def lookup(self, column:str, value, min_date, max_date) -> np.ndarray:
+        '''
+        Regresa los offsets de las filas donde column == value y min_date <= fecha <= max_date.
+        '''
+        offsets = self.get_offsets(column, value)
+        fechas = self.fechas[offsets]
+        inicio = np.searchsorted(fechas, self.__to_fecha(min_date), side='left')
+        fin = np.searchsorted(fechas, self.__to_fecha(max_date), side='right')
+        return offsets[inicio:fin]
+
+    def get_rows(self, offsets:np.ndarray) -> pd.DataFrame:
+        '''
+        Materializa las filas de los offsets dados con los tipos originales de las columnas.
+        '''
+        return (
+            self.datos
+            .take(offsets)
+            .astype({col:object for col in self.KEY_COLUMNS})
+            .reset_index(drop=True)
+        )
+
+    def get_unique_values(self, column:str) -> list:
+        '''
+        Regresa los valores distintos de una columna con índice.
+        '''
+        return self.datos[column].cat.categories.to_list()
+
+    def __build_sku_options(self):
+        '''
+        Arma las etiquetas 'sku - descripcion' a partir de los pares distintos (sku, descripcion)
+        y las llaves de búsqueda por prefijo (en minúsculas) tanto del sku como de la descripción.
+        '''
+        pares = self.datos[['sku', 'descripcion']].drop_duplicates()
+        etiquetas = pares.sku.astype(str) + ' - ' + pares.descripcion.astype(str)
+        self.sku_options = sorted(etiquetas.unique().tolist())
+
+        llaves = pd.concat((
+            pd.DataFrame({'llave':pares.sku.astype(str).str.lower(), 'etiqueta':etiquetas}),
+            pd.DataFrame({'llave':pares.descripcion.astype(str).str.lower(), 'etiqueta':etiquetas})
+        )).drop_duplicates().sort_values(['llave', 'etiqueta'])
+        self.sku_search_keys = (llaves.llave.to_list(), llaves.etiqueta.to_list())
+
+    def get_sku_options(self) -> list:
+        '''
+        Regresa las etiquetas 'sku - descripcion' ordenadas. Se calculan una sola vez por versión de los datos.
+        '''
+        if self.sku_options is None:
+            self.__build_sku_options()
+        return self.sku_options
+
+    def search_sku_options(self, prefix:str, limit:int=200) -> list:
+        '''
+        Regresa (ordenadas) a lo más limit etiquetas 'sku - descripcion' cuyo sku o descripción
+        empiece con prefix, sin importar mayúsculas. La búsqueda es binaria sobre las llaves.
+        '''
+        if self.sku_options is None:
+            self.__build_sku_options()
+        prefix = prefix.strip().lower()
+        if prefix == '':
+            return self.sku_options[:limit]
+
+        llaves, etiquetas = self.sku_search_keys
+        inicio = bisect.bisect_left(llaves, prefix)
+        fin = bisect.bisect_left(llaves, prefix + '\U0010ffff', lo=inicio)
+        return sorted(set(etiquetas[inicio:fin]))[:limit]
+
+
+class WeeklyKpiCube(ProductionStore):
+    '''
+    Agregado semanal de los datos de producción con llave (familia, marca, sku, tipo, fecha).
+    Como la fecha de cada archivo es el lunes de su semana, cada fecha es una semana.
+    Guarda la suma de lo fabricado y lo programado, el número de registros y cuántos de ellos
+    se terminaron (fabricado >= programado). Se consulta igual que un ProductionStore.
+    '''
+    CUBE_KEYS = ['familia', 'marca', 'sku', 'tipo', 'fecha']
+
+    @staticmethod
+    def aggregate(datos:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Agrega los datos crudos (por ejemplo, los de una partición) al nivel del cubo.
+        '''
+        return (
+            datos
+            .assign(terminado=lambda x: (x.fabricado >= x.programado).astype(int))
+            .groupby(WeeklyKpiCube.CUBE_KEYS, dropna=False, observed=True)
+            .agg(
+                fabricado=pd.NamedAgg('fabricado', 'sum'),
+                programado=pd.NamedAgg('programado', 'sum'),
+                registros=pd.NamedAgg('terminado', 'size'),
+                terminados=pd.NamedAgg('terminado', 'sum')
+            )
+            .reset_index()
+        )
+
+
+class ProductionStoreCache:
+    '''
+    Esta clase mantiene el almacén de un dataset de producción para todo el proceso.
+    De cada partición solo guarda su firma y su agregado semanal: los datos crudos viven una sola
+    vez, en el almacén. Cuando cambia el dataset solo se vuelven a leer y agregar las particiones
+    que cambiaron; las filas de las demás se toman del almacén anterior.
+    '''
+    def __init__(self, file_location:str) -> None:
+        self.dataset = ProductionDataset(file_location)
+        self.partitions = {}
+        self.store = None
+        self.stale = False
+        self.lock = threading.Lock()
+
+    def __filas_vigentes(self, descartadas:set) -> pd.DataFrame:
+        '''
+        Regresa las filas del almacén actual que no pertenecen a las particiones descartadas.
+        La partición de cada fila se calcula por combinación (tipo, fecha) y no fila por fila.
+        '''
+        datos = self.store.datos
+        if len(descartadas) == 0:
+            return datos
+        fechas, inversa = np.unique(self.store.fechas, return_inverse=True)
+        calendario = pd.DatetimeIndex(fechas).isocalendar()
+        tipos = datos.tipo.cat.categories
+        descartada = np.array([
+            [ProductionDataset.partition_name(tipo, anio, semana) in descartadas for anio, semana in zip(calendario.year, calendario.week)]
+            for tipo in tipos
+        ], dtype=bool).reshape(len(tipos), len(fechas))
+        return datos[~descartada[datos.tipo.cat.codes.to_numpy(), inversa]]
+
+    def __refresh(self, signature:tuple):
+        '''
+        Lee las particiones nuevas o modificadas, olvida las que ya no existen y arma el almacén
+        con su cubo de kpis.
+        '''
+        partitions = {}
+        frames = []
+        for name, mtime, size in signature:
+            cached = self.partitions.get(name)
+            if cached is not None and cached[0] == (mtime, size) and self.store is not None:
+                partitions[name] = cached
+            else:
+                datos = pd.read_parquet(f'{self.dataset.location}/{name}')
+                partitions[name] = ((mtime, size), WeeklyKpiCube.aggregate(datos))
+                frames.append(datos)
+        if self.store is not None:
+            # Las particiones que cambiaron o que ya no existen se quitan del almacén anterior
+            reutilizadas = {name for name in partitions if partitions[name] is self.partitions.get(name)}
+            frames.insert(0, self.__filas_vigentes(set(self.partitions) - reutilizadas))
+        self.partitions = partitions
+        self.stale = False
+
+        cubes = [cubo for _, cubo in partitions.values()]
+        if len(partitions) == 0:
+            # Aún no se ha cargado ningún archivo
+            vacios = _datos_vacios()
+            self.store = ProductionStore(vacios, signature, kpi_cube=WeeklyKpiCube(WeeklyKpiCube.aggregate(vacios), signature))
+            return
+        kpi_cube = WeeklyKpiCube(pd.concat(cubes, ignore_index=True), signature)
+        self.store = ProductionStore(pd.concat(frames, ignore_index=True), signature, kpi_cube=kpi_cube)
+
+    def get(self) -> ProductionStore:
+        '''
+        Regresa el almacén actual. Si el dataset cambió (o se invalidó) se vuelve a armar.
+        Solo una sesión a la vez puede recargar los datos.
+        '''
+        store = self.store
+        if store is not None and not self.stale and store.signature == self.dataset.signature():
+            return store
+        with self.lock:
+            signature = self.dataset.signature()
+            if self.store is None or self.stale or self.store.signature != signature:
+                self.__refresh(signature)
+            return self.store
+
+    def invalidate(self):
+        '''
+        Marca el almacén como viejo. La siguiente consulta lo vuelve a armar, pero solo lee las
+        particiones que cambiaron: las demás se siguen reutilizando.
+        '''
+        with self.lock:
+            self.stale = True
+
+
+def _datos_vacios() -> pd.DataFrame:
+    '''
+    Regresa un DataFrame sin filas con las columnas de los datos de producción
+    '''
+    return pd.DataFrame({
+        'sku': pd.Series(dtype=object),
+        'fabricado': pd.Series(dtype=float),
+        'programado': pd.Series(dtype=float),
+        'fecha': pd.Series(dtype='datetime64[ns]'),
+        'tipo': pd.Series(dtype=object),
+        'descripcion': pd.Series(dtype=object),
+        'familia': pd.Series(dtype=object),
+        'marca': pd.Series(dtype=object)
+    })
+
+def _get_store_cache(file_location:str) -> ProductionStoreCache:
+    with _STORE_CACHES_LOCK:
+        cache = _STORE_CACHES.get(file_location)
+        if cache is None:
+            cache = ProductionStoreCache(file_location)
+            _STORE_CACHES[file_location] = cache
+        return cache
+
+def get_production_store(file_location:str) -> ProductionStore:
+    '''
+    Regresa el almacén de los datos de producción de este proceso.
+    Solo se vuelven a leer los datos si alguna partición cambió (fecha de modificación o tamaño)
+    desde la última vez que se cargaron, o si se invalidó el almacén.
+    '''
+    return _get_store_cache(file_location).get()
+
+def invalida_store(file_location:str):
+    '''
+    Invalida el almacén de los datos de producción. Se usa cuando se terminan de guardar datos nuevos.
+    '''
+    _get_store_cache(file_location).invalidate()
@@ -0,0 +1,98 @@
+import os
+import glob
+import tomllib
+import threading
+from scripts.errores import PlantillaInvalida, PlantillaNoEncontrada
+from scripts.validation_engine import REGLAS
+
+# Las plantillas viven junto al código de la app y no en data
+DIRECTORIO_PLANTILLAS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+# Plantillas ya compiladas en este proceso. La llave es el directorio de las plantillas.
+_REGISTROS = {}
+_REGISTROS_LOCK = threading.Lock()
+
+class ExtractionPlan:
+    '''
+    Una plantilla de archivo de producción ya compilada. Tiene todo lo que se necesita para
+    extraer los datos de un archivo de esa planta:
+        nombre      -> el nombre del archivo de la plantilla sin extensión
+        tipo        -> el tipo con el que se guardan los datos (liquido, polvo, lerma...)
+        etiqueta    -> el nombre que se muestra en la página de carga
+        descripcion -> cómo se nombra el archivo en la página de carga ('Sube el archivo de ...')
+        hoja        -> el nombre o el número de la hoja
+        etiquetas_fecha -> los textos junto a los que puede estar la fecha
+        indice      -> el encabezado de la columna de los skus
+        columnas    -> los encabezados de las columnas a extraer, en el orden de COLUMNAS_SALIDA[1:]
+        desplazamiento -> diferencia de filas entre los skus y los valores
+        reglas      -> nombres de las reglas de validación o None para las de default
+        etiquetas   -> todos los textos que hay que buscar en el archivo. Al abrir el archivo solo
+                       se indexan estos textos, así que en una sola pasada se encuentran la fecha
+                       y todos los encabezados.
+    '''
+    COLUMNAS_SALIDA = ['sku', 'fabricado', 'programado']
+
+    def __init__(self, ubicacion:str, plantilla:dict) -> None:
+        self.ubicacion = ubicacion
+        self.nombre = os.path.splitext(os.path.basename(ubicacion))[0]
+        try:
+            self.tipo = plantilla['tipo']
+            self.etiqueta = plantilla.get('etiqueta', self.tipo)
+            self.descripcion = plantilla.get('descripcion', self.etiqueta)
+            self.orden = plantilla.get('orden', 0)
+            self.hoja = plantilla.get('hoja', 0)
+            self.desplazamiento = plantilla.get('desplazamiento', 0)
+            self.reglas = plantilla.get('reglas')
+            self.etiquetas_fecha = list(plantilla['fecha']['etiquetas'])
+            columnas = plantilla['columnas']
+        except KeyError as e:
+            raise PlantillaInvalida(ubicacion, f'falta {e}')
+
+        faltantes = [col for col in self.COLUMNAS_SALIDA if col not in columnas]
+        if len(faltantes) > 0:
+            raise PlantillaInvalida(ubicacion, f'faltan las columnas {faltantes}')
+        if self.reglas is not None and any(regla not in REGLAS for regla in self.reglas):
+            raise PlantillaInvalida(ubicacion, f'reglas desconocidas {[regla for regla in self.reglas if regla not in REGLAS]}')
+
+        self.indice = columnas['sku']
+        self.columnas = [columnas[col] for col in self.COLUMNAS_SALIDA[1:]]
+        self.renombres = {columnas[col]:col for col in self.COLUMNAS_SALIDA}
+        self.etiquetas = frozenset(self.etiquetas_fecha + [self.indice] + self.columnas)
+
+
+def compila_plantillas(directorio:str) -> dict:
+    '''
+    Lee y compila todas las plantillas (*.toml) del directorio.
+    Regresa un diccionario nombre -> ExtractionPlan ordenado por el campo orden de cada plantilla.
+    '''
+    planes = []
+    for ubicacion in sorted(glob.glob(f'{directorio}/*.toml')):
+        with open(ubicacion, 'rb') as f:
+            try:
+                plantilla = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise PlantillaInvalida(ubicacion, e)
+        planes.append(ExtractionPlan(ubicacion, plantilla))
+    planes.sort(key=lambda plan: plan.orden)
+    return {plan.nombre:plan for plan in planes}
+
+def get_plantillas(directorio:str=DIRECTORIO_PLANTILLAS) -> dict:
+    '''
+    Regresa las plantillas del directorio. Se compilan una sola vez por proceso.
+    '''
+    with _REGISTROS_LOCK:
+        if directorio not in _REGISTROS:
+            _REGISTROS[directorio] = compila_plantillas(directorio)
+        return _REGISTROS[directorio]
+
+def get_plantilla(nombre:str, directorio:str=DIRECTORIO_PLANTILLAS) -> ExtractionPlan:
+    plantillas = get_plantillas(directorio)
+    if nombre not in plantillas:
+        raise PlantillaNoEncontrada(nombre, list(plantillas))
+    return plantillas[nombre]
+
+def invalida_plantillas(directorio:str=DIRECTORIO_PLANTILLAS):
+    '''
+    Olvida las plantillas compiladas. Se usa cuando se agrega o se cambia una plantilla.
+    '''
+    with _REGISTROS_LOCK:
+        _REGISTROS.pop(directorio, None)
@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import logging
+import datetime
+import functools
+import threading
+import tracemalloc
+import collections
+import pandas as pd
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+# Configuración por variables de entorno:
+#   TRAZAS          -> '0' desactiva las trazas por completo
+#   TRAZAS_ARCHIVO  -> ubicación del log en json lines
+#   TRAZAS_MEMORIA  -> '1' mide el pico de memoria de cada etapa con tracemalloc (hace todo más lento)
+#   TRAZAS_PANEL    -> '1' muestra en la barra lateral los tiempos de la sesión
+ACTIVAS = os.environ.get('TRAZAS', '1') != '0'
+ARCHIVO = os.environ.get('TRAZAS_ARCHIVO', 'data/logs/trazas.jsonl')
+MAXIMO_BYTES_LOG = 5 * 2**20
+RESPALDOS_LOG = 3
+# Número de trazas que se guardan en memoria por sesión de streamlit
+MAXIMO_RECIENTES = 200
+# Número de sesiones de las que se guardan trazas; al pasarlo se olvida la más antigua
+MAXIMO_SESIONES = 50
+
+if os.environ.get('TRAZAS_MEMORIA') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+# Las trazas recientes de cada sesión de streamlit (None fuera de streamlit)
+_RECIENTES = {}
+_RECIENTES_LOCK = threading.Lock()
+# Las etapas abiertas de cada hilo, para llevar el pico de memoria de las etapas anidadas
+_ABIERTAS = threading.local()
+# Las trazas que se están capturando en cada hilo en lugar de guardarse (ver captura_trazas)
+_CAPTURAS = threading.local()
+_LOGGER = None
+_LOGGER_LOCK = threading.Lock()
+
+
+class Traza:
+    '''
+    Una etapa medida. Dentro del bloque se le pueden asignar las filas y los bytes procesados,
+    ya sea directamente o con registra(objeto).
+    '''
+    def __init__(self, etapa:str, etiquetas:dict) -> None:
+        self.etapa = etapa
+        self.etiquetas = etiquetas
+        self.filas = None
+        self.bytes = None
+        self.memoria_inicio = None
+        self.memoria_pico = None
+
+    def registra(self, objeto):
+        '''
+        Toma las filas y los bytes de un DataFrame, un Series o unos bytes, o las filas de una lista
+        '''
+        if isinstance(objeto, (pd.DataFrame, pd.Series)):
+            self.filas = len(objeto)
+            # Sin deep para que medir no cueste tanto como lo medido
+            self.bytes = int(objeto.memory_usage(index=False, deep=False).sum())
+        elif isinstance(objeto, (bytes, bytearray, memoryview)):
+            self.bytes = len(objeto)
+        elif isinstance(objeto, list):
+            self.filas = len(objeto)
+        return objeto
+
+
+def _get_logger() -> logging.Logger:
+    '''
+    Regresa el logger de las trazas. Se crea la primera vez que se usa, así que importar este
+    módulo no crea el directorio del log.
+    '''
+    global _LOGGER
+    with _LOGGER_LOCK:
+        if _LOGGER is None:
+            logger = logging.getLogger('dragon.trazas')
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            os.makedirs(os.path.dirname(ARCHIVO) or '.', exist_ok=True)
+            handler = RotatingFileHandler(ARCHIVO, maxBytes=MAXIMO_BYTES_LOG, backupCount=RESPALDOS_LOG, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            _LOGGER = logger
+        return _LOGGER
+
+def _sesion_actual():
+    '''
+    Regresa el id de la sesión de streamlit del hilo actual o None si no se está en streamlit
+    '''
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+def _guarda(registro:dict):
+    sesion = registro['sesion']
+    with _RECIENTES_LOCK:
+        if sesion not in _RECIENTES:
+            if len(_RECIENTES) >= MAXIMO_SESIONES:
+                _RECIENTES.pop(next(iter(_RECIENTES)))
+            _RECIENTES[sesion] = collections.deque(maxlen=MAXIMO_RECIENTES)
+        _RECIENTES[sesion].append(registro)
+    try:
+        _get_logger().info(json.dumps(registro, ensure_ascii=False, default=str))
+    except OSError:
+        # Si no se puede escribir el log, la traza se queda solo en memoria
+        pass
+
+@contextmanager
+def traza(etapa:str, **etiquetas):
+    '''
+    Mide el tiempo de lo que pase dentro del bloque y lo guarda en el log de trazas.
+    Las etiquetas se guardan tal cual (por ejemplo el tipo de archivo).
+    Si tracemalloc está activo también se guarda el pico de memoria de la etapa (lo más que creció
+    la memoria sobre la que había al empezar), que incluye el de las etapas anidadas.
+
+    Ejemplo:
+        with traza('valida_datos', tipo='polvo') as t:
+            ...
+            t.registra(df)
+    '''
+    t = Traza(etapa, etiquetas)
+    if not ACTIVAS:
+        yield t
+        return
+
+    abiertas = _ABIERTAS.__dict__.setdefault('pila', [])
+    memoria = tracemalloc.is_tracing()
+    if memoria:
+        actual, pico = tracemalloc.get_traced_memory()
+        # reset_peak borra el pico de la etapa padre, así que antes se lo guardamos
+        if len(abiertas) > 0:
+            abiertas[-1].memoria_pico = max(abiertas[-1].memoria_pico, pico)
+        tracemalloc.reset_peak()
+        t.memoria_inicio = t.memoria_pico = actual
+    abiertas.append(t)
+    error = None
+    inicio = time.perf_counter()
+    try:
+        yield t
+    except BaseException as e:
+        error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        abiertas.pop()
+        if memoria and tracemalloc.is_tracing():
+            t.memoria_pico = max(t.memoria_pico, tracemalloc.get_traced_memory()[1])
+            if len(abiertas) > 0:
+                abiertas[-1].memoria_pico = max(abiertas[-1].memoria_pico, t.memoria_pico)
+        registro = {
+            'fecha': datetime.datetime.now().isoformat(timespec='milliseconds'),
+            'etapa': etapa,
+            **etiquetas,
+            'segundos': round(segundos, 6),
+            'filas': t.filas,
+            'bytes': t.bytes,
+            'memoria_pico_mb': round((t.memoria_pico - t.memoria_inicio) / 2**20, 3) if t.memoria_pico is not None else None,
+            'error': error,
+            'sesion': _sesion_actual(),
+            'pid': os.getpid()
+        }
+        capturadas = getattr(_CAPTURAS, 'registros', None)
+        if capturadas is not None:
+            capturadas.append(registro)
+        else:
+            _guarda(registro)
+
+@contextmanager
+def captura_trazas():
+    '''
+    Las trazas de este hilo que terminen dentro del bloque no se guardan sino que se juntan en la
+    lista que regresa el bloque. Se usa en los procesos del pool de carga: así no escriben en el
+    log (que solo rota bien si lo escribe un proceso) y el proceso principal guarda sus trazas
+    con registra_trazas, con la sesión de streamlit que pidió la carga.
+
+    Ejemplo:
+        with captura_trazas() as trazas:
+            ...
+        return resultado, trazas
+    '''
+    anteriores = getattr(_CAPTURAS, 'registros', None)
+    _CAPTURAS.registros = []
+    try:
+        yield _CAPTURAS.registros
+    finally:
+        _CAPTURAS.registros = anteriores
+
+def registra_trazas(registros:list):
+    '''
+    Guarda las trazas capturadas con captura_trazas, con la sesión de streamlit actual.
+    El pid se queda como estaba, así que en el log se ve qué proceso hizo cada etapa.
+    '''
+    sesion = _sesion_actual()
+    for registro in registros:
+        _guarda({**registro, 'sesion': sesion})
+
+def trazado(etapa:str=None, mide=None):
+    '''
+    Decorador que mide cada llamada de la función con traza.
+    etapa: el nombre de la etapa. Por default es el nombre calificado de la función.
+    mide: función que recibe el resultado y los argumentos de la llamada y regresa el objeto
+        del que se toman las filas y los bytes. Por default se usa el resultado.
+    '''
+    def decorador(funcion):
+        nombre = etapa if etapa is not None else funcion.__qualname__
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with traza(nombre) as t:
+                resultado = funcion(*args, **kwargs)
+                t.registra(mide(resultado, *args, **kwargs) if mide is not None else resultado)
+                return resultado
+        return envoltura
+    return decorador
+
+def trazas_recientes(n:int=20, sesion=...) -> list:
+    '''
+    Regresa las últimas n trazas de la sesión dada, de la más reciente a la más antigua.
+    Por default se usa la sesión de streamlit actual.
+    '''
+    if sesion is ...:
+        sesion = _sesion_actual()
+    with _RECIENTES_LOCK:
+        recientes = list(_RECIENTES.get(sesion, []))
+    return recientes[::-1][:n]
+
+def panel_trazas(n:int=20):
+    '''
+    Muestra en la barra lateral las últimas n trazas de la sesión.
+    Solo se muestra si la variable de entorno TRAZAS_PANEL es '1'.
+    '''
+    if os.environ.get('TRAZAS_PANEL') != '1':
+        return
+    import streamlit as st
+
+    with st.sidebar.expander('⏱️ Tiempos de la sesión'):
+        recientes = trazas_recientes(n)
+        if len(recientes) == 0:
+            st.caption('Aún no hay trazas en esta sesión')
+            return
+        columnas = ['etapa', 'segundos', 'filas', 'bytes', 'memoria_pico_mb', 'error']
+        st.dataframe(pd.DataFrame(recientes).reindex(columns=columnas), hide_index=True, use_container_width=True)
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+from scripts.catalog_service import CatalogService
+
+class Regla:
+    '''
+    Una regla de validación. Cada regla regresa, para todas las filas a la vez, cuáles no la cumplen.
+    error es el texto con el que aparecen esas filas en el reporte de errores.
+
+    Para agregar una regla basta con heredar de esta clase, implementar filas_invalidas
+    y registrarla en REGLAS.
+    '''
+    error = None
+
+    def filas_invalidas(self, datos:pd.DataFrame, en_catalogo:np.ndarray) -> np.ndarray:
+        '''
+        datos: los datos extraídos, con las cantidades ya convertidas a números
+        en_catalogo: True para las filas cuyo sku está en el catálogo
+        Regresa un arreglo de booleanos, True para las filas que no cumplen la regla
+        '''
+        raise NotImplementedError
+
+class ReglaCantidades(Regla):
+    '''
+    Las cantidades deben ser números
+    '''
+    error = 'cantidades'
+
+    def __init__(self, columnas:list) -> None:
+        self.columnas = columnas
+
+    def filas_invalidas(self, datos:pd.DataFrame, en_catalogo:np.ndarray) -> np.ndarray:
+        return datos[self.columnas].isna().any(axis=1).to_numpy()
+
+class ReglaSkuInvalido(Regla):
+    '''
+    El sku debe estar en el catálogo y tener familia
+    '''
+    error = 'sku invalido'
+
+    def filas_invalidas(self, datos:pd.DataFrame, en_catalogo:np.ndarray) -> np.ndarray:
+        return ~en_catalogo
+
+class ReglaCantidadNegativa(Regla):
+    '''
+    Las cantidades no pueden ser negativas
+    '''
+    error = 'cantidad negativa'
+
+    def __init__(self, columnas:list) -> None:
+        self.columnas = columnas
+
+    def filas_invalidas(self, datos:pd.DataFrame, en_catalogo:np.ndarray) -> np.ndarray:
+        return (datos[self.columnas] < 0).any(axis=1).to_numpy()
+
+class ReglaSkuDuplicado(Regla):
+    '''
+    Un sku solo puede aparecer una vez por semana y tipo. Se marcan todas las filas repetidas
+    porque no hay forma de saber cuál es la buena.
+    '''
+    error = 'sku duplicado'
+
+    def filas_invalidas(self, datos:pd.DataFrame, en_catalogo:np.ndarray) -> np.ndarray:
+        llaves = [col for col in ['sku', 'fecha', 'tipo'] if col in datos.columns]
+        return datos.duplicated(subset=llaves, keep=False).to_numpy()
+
+
+COLUMNAS_CANTIDADES = ['fabricado', 'programado']
+# Reglas disponibles por nombre. Las reglas se evalúan en el orden en que se piden.
+REGLAS = {
+    'cantidades': lambda: ReglaCantidades(COLUMNAS_CANTIDADES),
+    'sku invalido': ReglaSkuInvalido,
+    'cantidad negativa': lambda: ReglaCantidadNegativa(COLUMNAS_CANTIDADES),
+    'sku duplicado': ReglaSkuDuplicado
+}
+# Las reglas que se aplican si no se especifica otra cosa (las que siempre ha tenido la carga)
+REGLAS_DEFAULT = ['cantidades', 'sku invalido']
+
+def crea_reglas(nombres:list=None) -> list:
+    '''
+    Regresa las reglas con los nombres dados. Por default las de REGLAS_DEFAULT.
+    '''
+    nombres = REGLAS_DEFAULT if nombres is None else nombres
+    desconocidas = [nombre for nombre in nombres if nombre not in REGLAS]
+    assert len(desconocidas) == 0, f"Reglas de validación desconocidas: {desconocidas}"
+    return [REGLAS[nombre]() for nombre in nombres]
+
+
+class ValidationEngine:
+    '''
+    Esta clase valida los datos extraídos de un archivo contra el catálogo con una lista de reglas.
+    El catálogo se consulta una sola vez, con el índice por sku del CatalogService, y todas las
+    reglas se evalúan sobre todas las filas a la vez.
+    Cada fila inválida se reporta una sola vez, con el error de la primera regla que no cumple.
+
+    Ejemplo:
+        engine = ValidationEngine(crea_reglas(['cantidades', 'sku invalido', 'sku duplicado']))
+        good_data, bad_data = engine.valida(extracted_data, get_catalogo(catalogo_file))
+    '''
+    def __init__(self, reglas:list=None, columnas_numericas:list=COLUMNAS_CANTIDADES) -> None:
+        '''
+        reglas: lista de Regla. Por default las de REGLAS_DEFAULT
+        columnas_numericas: columnas que se convierten a números antes de aplicar las reglas
+        '''
+        self.reglas = reglas if reglas is not None else crea_reglas()
+        # Los datos buenos llevan las columnas del catálogo, así que todos deben estar en él
+        assert any(isinstance(regla, ReglaSkuInvalido) for regla in self.reglas), "Falta la regla sku invalido"
+        self.columnas_numericas = columnas_numericas
+        self.tipo_error = pd.CategoricalDtype([regla.error for regla in self.reglas])
+
+    def __convierte_numeros(self, datos:pd.DataFrame) -> pd.DataFrame:
+        '''
+        Convierte a números las columnas numéricas. Lo que no se pueda convertir queda como NaN.
+        '''
+        datos = datos.copy()
+        for col in self.columnas_numericas:
+            if not pd.api.types.is_numeric_dtype(datos[col]):
+                datos[col] = pd.to_numeric(datos[col], errors='coerce')
+        return datos
+
+    def valida(self, datos:pd.DataFrame, catalogo:CatalogService) -> (pd.DataFrame, pd.DataFrame):
+        '''
+        Regresa (good_data, bad_data):
+            good_data -> las filas que cumplen todas las reglas con las columnas del catálogo
+            bad_data  -> el sku y el error de cada fila inválida, en el orden de las reglas.
+                         error es una categoría con los errores de las reglas.
+        '''
+        datos = self.__convierte_numeros(datos)
+        por_sku = catalogo.por_sku
+
+        # La única búsqueda en el catálogo
+        posiciones = por_sku.index.get_indexer(datos.sku)
+        en_catalogo = posiciones >= 0
+        en_catalogo[en_catalogo] = por_sku.familia.notna().to_numpy()[posiciones[en_catalogo]]
+
+        # Código de la primera regla que no cumple cada fila (-1 si las cumple todas)
+        codigos = np.full(len(datos), -1, dtype=np.int8)
+        for codigo, regla in enumerate(self.reglas):
+            invalidas = np.asarray(regla.filas_invalidas(datos, en_catalogo), dtype=bool)
+            codigos[invalidas & (codigos < 0)] = codigo
+
+        validas = codigos < 0
+        good_data = pd.concat((
+            datos[validas].reset_index(drop=True),
+            por_sku.iloc[posiciones[validas]].reset_index(drop=True)
+        ), axis=1)
+
+        orden = np.flatnonzero(~validas)
+        orden = orden[np.argsort(codigos[orden], kind='stable')]
+        bad_data = pd.DataFrame({
+            'sku': datos.sku.to_numpy()[orden],
+            'error': pd.Categorical.from_codes(codigos[orden], dtype=self.tipo_error)
+        })
+        return good_data, bad_data